@@ -64,12 +64,33 @@ class IndexService:
         #    if texts:
         #        self.faiss_manager.initialize_bm25(texts)
 
-         # 2. 执行向量相似度搜索（基于embedding）
+         # 2. 执行向量相似度搜索（基于embedding）, 返回 (Document, score) 元组
         raw_results = self.faiss_manager.search(query, k=top_k * 10)
+        return self._filter_results(query, [doc for doc, _ in raw_results], top_k, filter_value)
 
+    def faiss_search_batch(self, queries, top_k=5, filter_values=None):
+        """
+        faiss_search 的批量版本: 所有 query 一次 embedding、一次 FAISS 批量搜索。
+        :param filter_values: 与 queries 等长的过滤值列表 (可为 None)
+        :return: 每个 query 对应的结果列表
+        """
+        if not self.faiss_manager.faiss_store:
+            self.faiss_manager.load_index()
+        if not self.faiss_manager.faiss_store:
+            logger.error("FAISS index is not available.")
+            return [[] for _ in queries]
+
+        filter_values = filter_values or [None] * len(queries)
+        batch_results = self.faiss_manager.search_batch(list(queries), k=top_k * 10)
+        return [
+            self._filter_results(query, [doc for doc, _ in raw_results], top_k, filter_value)
+            for query, raw_results, filter_value in zip(queries, batch_results, filter_values)
+        ]
 
+    def _filter_results(self, query, documents, top_k, filter_value=None):
        # 3. 按 source 以及 filter_value 做过滤
-        filtered_results = [doc for doc in raw_results if doc.metadata.get('source') == self.platform]
+        filtered_results = [doc for doc in documents if doc.metadata.get('source') == self.platform]
+        filtered_results = self._merge_passages(filtered_results)
         if filter_value:
             if self.platform == 'reddit':
                 filtered_results = [doc for doc in filtered_results if doc.metadata.get('subreddit') == filter_value]
@@ -87,6 +108,22 @@ class IndexService:
         else:
             # 否则直接返回原结果
             return filtered_results[:top_k]
+
+    @staticmethod
+    def _merge_passages(documents):
+        """
+        长帖子切分后的段落按 parent_id 合并 (与 HybridRetriever 的 parent_aggregation='max' 相同):
+        结果已按相似度排序，每个帖子只保留排在最前的段落; 没有 parent_id 的旧文档保持不变。
+        """
+        seen, merged = set(), []
+        for doc in documents:
+            parent_id = doc.metadata.get('parent_id')
+            if parent_id is not None:
+                if parent_id in seen:
+                    continue
+                seen.add(parent_id)
+            merged.append(doc)
+        return merged
         
 
 def is_recommendation_query(query: str) -> bool:
@@ -0,0 +1,377 @@
+# 基于稀疏词项-文档矩阵(CSR)的 BM25 检索引擎，排序语义与 rank_bm25.BM25Okapi 保持一致
+
+import json
+import os
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# 持久化文件名及格式版本 (修改存储字段时需要递增版本号, 旧文件会被自动重建)
+BM25_ARTIFACT_NAME = "bm25.npz"
+BM25_ARTIFACT_VERSION = 3
+
+
+class SparseBM25:
+    """
+    BM25Okapi 的向量化实现，可以直接替换 rank_bm25.BM25Okapi:
+      - 语料在构建时被压缩为按词项组织的 CSR 矩阵 (indptr / doc_ids / term_freqs)
+      - 查询时只访问查询词对应的倒排列表，不再逐文档遍历 Python 字典
+      - IDF (含 epsilon 下限) 与文档长度归一化的计算方式与 BM25Okapi 相同
+      - top-k 使用 argpartition，分数相同时按文档下标升序，与原先的稳定排序一致
+
+    支持增量更新:
+      - add_documents 只处理新文档的词项 (写入增量倒排表)，代价为 O(新词项数)
+      - remove_documents 以墓碑方式删除文档，文档下标保持不变
+      - avgdl / 文档频率 / IDF 等全局统计量在下一次查询时才重新计算
+      - 增量部分超过主矩阵的 compact_ratio 后合并回 CSR 矩阵
+    """
+
+    def __init__(self, corpus, k1=1.5, b=0.75, epsilon=0.25, compact_ratio=0.1):
+        """
+        :param corpus: 已分词的文档序列，每个文档是可迭代的词项序列
+        :param k1, b, epsilon: 与 BM25Okapi 相同的参数
+        :param compact_ratio: 增量倒排表的词项数超过主矩阵该比例时触发合并
+        """
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.compact_ratio = compact_ratio
+        self.vocab = {}  # term -> term_id (按首次出现的顺序编号)
+        self._build(corpus)
+
+    def __len__(self):
+        """文档槽位数 (含已删除文档)，即合法文档下标的上界"""
+        return len(self.doc_len) + len(self._pending_doc_len)
+
+    def _build(self, corpus):
+        term_ids = array('i')
+        doc_ids = array('i')
+        term_freqs = array('i')
+        doc_len = array('i')
+
+        for doc_index, document in enumerate(corpus):
+            doc_len.append(len(document))
+            for term, freq in Counter(document).items():
+                term_ids.append(self._term_id(term))
+                doc_ids.append(doc_index)
+                term_freqs.append(freq)
+
+        self._set_postings(
+            np.asarray(term_ids, dtype=np.int32),
+            np.asarray(doc_ids, dtype=np.int32),
+            np.asarray(term_freqs, dtype=np.int32),
+        )
+        self.doc_freqs = np.bincount(self._posting_terms(), minlength=len(self.vocab)).astype(np.int32)
+        self.doc_len = np.asarray(doc_len, dtype=np.int32)
+        self.deleted = np.zeros(len(self.doc_len), dtype=bool)
+        self._reset_pending()
+        self._refresh_stats()
+
+    def _term_id(self, term):
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = len(self.vocab)
+            self.vocab[term] = term_id
+        return term_id
+
+    def _set_postings(self, term_ids, doc_ids, term_freqs):
+        """由 (term_id, doc_id, tf) 三元组构建 CSR 矩阵"""
+        # 稳定排序保证同一词项的倒排列表内文档下标递增
+        order = np.argsort(term_ids, kind='stable')
+        self.doc_ids = doc_ids[order]
+        self.term_freqs = term_freqs[order]
+        self.indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocab)), out=self.indptr[1:])
+
+    def _posting_terms(self):
+        """CSR 矩阵中每个非零元素所属的 term_id"""
+        return np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+
+    def _reset_pending(self):
+        self._delta_postings = {}  # term_id -> (array doc_ids, array term_freqs)
+        self._delta_size = 0
+        self._pending_doc_len = array('i')
+        self._pending_df = Counter()  # term_id -> 文档频率变化量
+        self._dirty = True
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+    def add_documents(self, corpus):
+        """
+        追加新文档，返回新文档的下标列表。只遍历新文档的词项，全局统计量延迟到查询时更新。
+        """
+        start = len(self)
+        for offset, document in enumerate(corpus):
+            doc_index = start + offset
+            self._pending_doc_len.append(len(document))
+            for term, freq in Counter(document).items():
+                term_id = self._term_id(term)
+                postings = self._delta_postings.get(term_id)
+                if postings is None:
+                    postings = self._delta_postings[term_id] = (array('i'), array('i'))
+                postings[0].append(doc_index)
+                postings[1].append(freq)
+                self._pending_df[term_id] += 1
+                self._delta_size += 1
+        self._dirty = True
+
+        if self._delta_size > max(self.compact_ratio * len(self.doc_ids), 1024):
+            self.compact()
+        return list(range(start, len(self)))
+
+    def remove_documents(self, doc_indexes):
+        """以墓碑方式删除文档，已删除文档不会再出现在检索结果中"""
+        self._flush_doc_len()
+        targets = np.unique(np.asarray(list(doc_indexes), dtype=np.int64))
+        targets = targets[(targets >= 0) & (targets < len(self.doc_len))]
+        targets = targets[~self.deleted[targets]]
+        if len(targets) == 0:
+            return 0
+
+        # 主矩阵中这些文档包含的词项
+        positions = np.flatnonzero(np.isin(self.doc_ids, targets))
+        removed_terms = np.searchsorted(self.indptr, positions, side='right') - 1
+        for term_id, count in zip(*np.unique(removed_terms, return_counts=True)):
+            self._pending_df[int(term_id)] -= int(count)
+        # 增量倒排表中这些文档包含的词项
+        target_set = set(targets.tolist())
+        for term_id, (docs, _) in self._delta_postings.items():
+            hits = sum(1 for doc in docs if doc in target_set)
+            if hits:
+                self._pending_df[term_id] -= hits
+
+        self.deleted[targets] = True
+        self._dirty = True
+        return len(targets)
+
+    def compact(self):
+        """将增量倒排表合并进 CSR 矩阵，并丢弃已删除文档的倒排项"""
+        self._flush_doc_len()
+        term_parts = [self._posting_terms()]
+        doc_parts = [self.doc_ids]
+        tf_parts = [self.term_freqs]
+        for term_id, (docs, tfs) in self._delta_postings.items():
+            term_parts.append(np.full(len(docs), term_id, dtype=np.int32))
+            doc_parts.append(np.asarray(docs, dtype=np.int32))
+            tf_parts.append(np.asarray(tfs, dtype=np.int32))
+
+        term_ids = np.concatenate(term_parts)
+        doc_ids = np.concatenate(doc_parts)
+        term_freqs = np.concatenate(tf_parts)
+        if self.deleted.any():
+            live = ~self.deleted[doc_ids]
+            term_ids, doc_ids, term_freqs = term_ids[live], doc_ids[live], term_freqs[live]
+
+        self._set_postings(term_ids, doc_ids, term_freqs)
+        self._delta_postings = {}
+        self._delta_size = 0
+
+    def _flush_doc_len(self):
+        if self._pending_doc_len:
+            new_len = np.asarray(self._pending_doc_len, dtype=np.int32)
+            self.doc_len = np.concatenate([self.doc_len, new_len])
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(new_len), dtype=bool)])
+            self._pending_doc_len = array('i')
+
+    def _refresh_stats(self):
+        """重新计算 corpus_size / avgdl / IDF / 长度归一化 (仅在有更新后的首次查询时执行)"""
+        self._flush_doc_len()
+        if len(self.doc_freqs) < len(self.vocab):
+            padding = np.zeros(len(self.vocab) - len(self.doc_freqs), dtype=np.int32)
+            self.doc_freqs = np.concatenate([self.doc_freqs, padding])
+        if self._pending_df:
+            keys = np.fromiter(self._pending_df.keys(), dtype=np.int64, count=len(self._pending_df))
+            values = np.fromiter(self._pending_df.values(), dtype=np.int32, count=len(self._pending_df))
+            np.add.at(self.doc_freqs, keys, values)
+            self._pending_df = Counter()
+
+        live = ~self.deleted
+        self.corpus_size = int(live.sum())
+        total_len = int(self.doc_len[live].sum())
+        self.avgdl = float(total_len) / self.corpus_size if self.corpus_size else 0.0
+        self._calc_idf()
+        self._calc_length_norm()
+        self._dirty = False
+
+    def _calc_idf(self):
+        """与 BM25Okapi._calc_idf 相同：负 IDF 被替换为 epsilon * 平均 IDF"""
+        df = self.doc_freqs.astype(np.float64)
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        # 只统计仍出现在语料中的词项；按词项编号顺序累加，与 BM25Okapi 的逐项求和保持相同的浮点结果
+        present = idf[self.doc_freqs > 0]
+        self.average_idf = sum(present.tolist()) / len(present) if len(present) else 0.0
+        idf[idf < 0] = self.epsilon * self.average_idf
+        self.idf = idf
+
+    def _calc_length_norm(self):
+        """预先计算每个文档的 k1 * (1 - b + b * |d| / avgdl)"""
+        if self.avgdl > 0:
+            self._length_norm = self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)
+        else:
+            self._length_norm = np.full(len(self.doc_len), self.k1 * (1 - self.b))
+
+    # ------------------------------------------------------------------
+    # 检索
+    # ------------------------------------------------------------------
+    def get_scores(self, query):
+        """返回所有文档的 BM25 分数 (np.ndarray)，与 BM25Okapi.get_scores 相同；已删除文档为 -inf"""
+        if self._dirty:
+            self._refresh_stats()
+        scores = np.zeros(len(self.doc_len))
+        for term in query:
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            idf = self.idf[term_id]
+            if term_id < len(self.indptr) - 1:
+                start, end = self.indptr[term_id], self.indptr[term_id + 1]
+                docs = self.doc_ids[start:end]
+                tf = self.term_freqs[start:end]
+                scores[docs] += idf * (tf * (self.k1 + 1) / (tf + self._length_norm[docs]))
+            delta = self._delta_postings.get(term_id)
+            if delta is not None:
+                docs = np.asarray(delta[0], dtype=np.int32)
+                tf = np.asarray(delta[1], dtype=np.int32)
+                scores[docs] += idf * (tf * (self.k1 + 1) / (tf + self._length_norm[docs]))
+        if self.corpus_size < len(self.doc_len):
+            scores[self.deleted] = -np.inf
+        return scores
+
+    def get_top_n(self, query, n):
+        """
+        返回 (top_indexes, top_scores)，按分数降序排列。
+        等价于 sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:n]，但不会返回已删除文档
+        """
+        scores = self.get_scores(query)
+        top_indexes = self.top_n_from_scores(scores, min(n, self.corpus_size))
+        return top_indexes, scores[top_indexes]
+
+    def get_top_n_batch(self, queries, n):
+        """
+        对多个查询一起打分，返回 [(top_indexes, top_scores), ...]，与逐个调用 get_top_n 的结果相同。
+        统计量只刷新一次；多个查询共享同一词项时，该词项的倒排权重只计算一次。
+        """
+        if self._dirty:
+            self._refresh_stats()
+        term_weights = {}  # term_id -> (doc_ids, 权重)
+        scores = np.zeros(len(self.doc_len))
+        limit = min(n, self.corpus_size)
+        results = []
+        for query in queries:
+            scores.fill(0.0)
+            for term in query:
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    continue
+                weights = term_weights.get(term_id)
+                if weights is None:
+                    weights = term_weights[term_id] = self._term_weights(term_id)
+                for docs, weight in weights:
+                    scores[docs] += weight
+            if self.corpus_size < len(self.doc_len):
+                scores[self.deleted] = -np.inf
+            top_indexes = self.top_n_from_scores(scores, limit)
+            results.append((top_indexes, scores[top_indexes]))
+        return results
+
+    def _term_weights(self, term_id):
+        """词项在主矩阵和增量倒排表中的 (doc_ids, BM25 权重) 列表"""
+        idf = self.idf[term_id]
+        parts = []
+        if term_id < len(self.indptr) - 1:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            parts.append((self.doc_ids[start:end], self.term_freqs[start:end]))
+        delta = self._delta_postings.get(term_id)
+        if delta is not None:
+            parts.append((np.asarray(delta[0], dtype=np.int32), np.asarray(delta[1], dtype=np.int32)))
+        return [
+            (docs, idf * (tf * (self.k1 + 1) / (tf + self._length_norm[docs])))
+            for docs, tf in parts
+        ]
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+    def save(self, path, validation_key):
+        """
+        将倒排矩阵、IDF 表和文档长度保存为单个 .npz 文件，validation_key 由调用方生成 (描述对应的语料)。
+        先写临时文件再 os.replace，避免读取方看到写了一半的文件。
+        """
+        self.compact()
+        if self._dirty:
+            self._refresh_stats()
+        vocab_bytes = json.dumps(list(self.vocab), ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(BM25_ARTIFACT_VERSION),
+                validation_key=np.array(validation_key),
+                params=np.array([self.k1, self.b, self.epsilon]),
+                vocab=np.frombuffer(vocab_bytes, dtype=np.uint8),
+                indptr=self.indptr,
+                doc_ids=self.doc_ids,
+                term_freqs=self.term_freqs,
+                doc_freqs=self.doc_freqs,
+                doc_len=self.doc_len,
+                deleted=self.deleted,
+                idf=self.idf,
+                average_idf=np.array(self.average_idf),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, validation_key, k1=1.5, b=0.75, epsilon=0.25, compact_ratio=0.1):
+        """
+        从 .npz 文件恢复模型。版本、validation_key 或参数不匹配时返回 None，由调用方重新构建。
+        """
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != BM25_ARTIFACT_VERSION:
+                return None
+            if str(data["validation_key"]) != validation_key:
+                return None
+            if not np.array_equal(data["params"], [k1, b, epsilon]):
+                return None
+
+            model = cls.__new__(cls)
+            model.k1, model.b, model.epsilon = k1, b, epsilon
+            model.compact_ratio = compact_ratio
+            terms = json.loads(data["vocab"].tobytes().decode("utf-8"))
+            model.vocab = {term: term_id for term_id, term in enumerate(terms)}
+            model.indptr = data["indptr"]
+            model.doc_ids = data["doc_ids"]
+            model.term_freqs = data["term_freqs"]
+            model.doc_freqs = data["doc_freqs"]
+            model.doc_len = data["doc_len"]
+            model.deleted = data["deleted"]
+            model.idf = data["idf"]
+            model.average_idf = float(data["average_idf"])
+
+        model._reset_pending()
+        live = ~model.deleted
+        model.corpus_size = int(live.sum())
+        model.avgdl = float(int(model.doc_len[live].sum())) / model.corpus_size if model.corpus_size else 0.0
+        model._calc_length_norm()
+        model._dirty = False
+        return model
+
+    @staticmethod
+    def top_n_from_scores(scores, n):
+        """在分数向量上做 top-n 选择，平分时保持下标升序"""
+        total = len(scores)
+        if n <= 0 or total == 0:
+            return np.empty(0, dtype=np.int64)
+        if n < total:
+            partition = np.argpartition(-scores, n - 1)[:n]
+            kth_score = scores[partition].min()
+            above = np.flatnonzero(scores > kth_score)
+            ties = np.flatnonzero(scores == kth_score)[:n - len(above)]
+            candidates = np.concatenate([above, ties])
+        else:
+            candidates = np.arange(total)
+        # lexsort 以最后一个键为主键：先按分数降序，再按下标升序
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
@@ -0,0 +1,49 @@
+# 长文档切分: 把帖子 + 评论 / 回答拼成的长文本切成有重叠的段落，每段单独 embedding 和建 BM25
+
+import bisect
+import re
+from typing import List
+
+# 优先在段落 / 句子边界处切分 (中英文标点)
+_BOUNDARY_RE = re.compile(r'\n+|(?<=[。！？；!?;])|(?<=[.:])\s')
+
+
+class TextChunker:
+    """
+    按字符数切分 (内容中英混合，字符数比按空格分词更稳定):
+      - 不超过 chunk_size 的文本保持为一段，短帖子的索引方式不变
+      - 每段不超过 chunk_size 个字符，尽量在窗口后半部分最后一个段落 / 句子边界处结束
+      - 相邻段落重叠约 overlap 个字符 (下一段从重叠区内第一个边界开始)，避免答案恰好被切断
+    chunk_size 默认与 Indexer 送入模型前的截断长度 (512 字符) 一致，保证每段都被完整 embedding。
+    """
+
+    def __init__(self, chunk_size: int = 512, overlap: int = 96):
+        if overlap >= chunk_size // 2:
+            raise ValueError("overlap must be smaller than half of chunk_size")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def split(self, text: str) -> List[str]:
+        text = (text or "").strip()
+        if len(text) <= self.chunk_size:
+            return [text] if text else []
+
+        boundaries = sorted({match.end() for match in _BOUNDARY_RE.finditer(text)})
+        chunks = []
+        start = 0
+        while True:
+            end = min(start + self.chunk_size, len(text))
+            if end < len(text):
+                # 窗口后半部分的最后一个边界，找不到时硬切
+                i = bisect.bisect_right(boundaries, end) - 1
+                if i >= 0 and boundaries[i] > start + self.chunk_size // 2:
+                    end = boundaries[i]
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= len(text):
+                return chunks
+            # 下一段从重叠区 [end - overlap, end) 内第一个边界开始，没有边界时从 end - overlap 开始
+            next_start = end - self.overlap
+            i = bisect.bisect_left(boundaries, next_start)
+            start = boundaries[i] if i < len(boundaries) and boundaries[i] < end else next_start
@@ -122,7 +122,8 @@ def main():
         bm25_weight=0.45,
         embedding_weight=0.45,
         vote_weight=0.1,
-        l2_decay_beta=6.0
+        l2_decay_beta=6.0,
+        parent_aggregation='max'  # 与搜索接口一致: 长帖子切分后的段落按所属帖子合并
     )
 
     # 读取 JSON 文件
@@ -137,12 +138,12 @@ def main():
     sum_f1 = 0.0
     with open(output_path, "w", encoding="utf-8") as F:
         F.write("")
-    for item in queries:
+    # 一次性批量检索全部 query (一次 embedding 前向 + 一次 FAISS 批量搜索)
+    batch_docs = hybrid_retriever.retrieve_batch([item["query"] for item in queries], top_k=5, relevance_threshold=0.1)
+    for item, docs in zip(queries, batch_docs):
         query = item["query"]
         relevant_ids = set(item["relevant_doc_ids"])
 
-        docs = hybrid_retriever.retrieve(query=query, top_k=5, relevance_threshold=0.1)
-
         evaluated_docs = convert_to_evaluated_documents(platform, docs, relevant_ids)
         all_evaluated_results.append(evaluated_docs)
 
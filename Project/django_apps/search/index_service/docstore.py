@@ -0,0 +1,221 @@
+# 基于内存映射的文档存储: 替代 langchain 的 InMemoryDocstore + index.pkl (整体 pickle)
+
+import json
+import mmap
+import os
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+
+DOCSTORE_DATA_NAME = "docstore.data"
+DOCSTORE_OFFSETS_NAME = "docstore.offsets"
+
+
+class MmapDocstore(Docstore, AddableMixin):
+    """
+    按 FAISS 行号存储文档 (page_content + metadata)，docstore id 就是行号字符串 ("0", "1", ...):
+      - docstore.data: 追加写入的 JSON 记录 [page_content, metadata]
+      - docstore.offsets: 每条记录在 data 文件中的结束偏移 (little-endian int64)，行数以此文件为准
+    两个文件都通过 mmap 读取，加载时不需要反序列化任何文档，常驻内存只与实际访问的文档有关。
+    add() 只把新文档放入内存缓冲区，flush() 时追加写入磁盘，不会重写已有数据; 存储本身不删除文档 (行号必须稳定)。
+    指定 max_rows 时只看到前 max_rows 条文档 (索引快照的行数)，打开时不会截断文件:
+    之后的记录可能属于其他进程正在写入或已发布的新快照。
+    """
+
+    def __init__(self, directory: str, max_rows: Optional[int] = None):
+        self.directory = directory
+        self.max_rows = max_rows
+        self.data_path = os.path.join(directory, DOCSTORE_DATA_NAME)
+        self.offsets_path = os.path.join(directory, DOCSTORE_OFFSETS_NAME)
+        self._lock = threading.RLock()
+        self._pending: List[bytes] = []  # 已 add 但尚未 flush 的记录
+        self._ends = np.empty(0, dtype='<i8')
+        self._data = None
+        self._open()
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, DOCSTORE_OFFSETS_NAME)) and \
+            os.path.exists(os.path.join(directory, DOCSTORE_DATA_NAME))
+
+    @classmethod
+    def create(cls, directory: str) -> "MmapDocstore":
+        """在目录下创建一个空的文档存储 (覆盖已有文件)"""
+        os.makedirs(directory, exist_ok=True)
+        for name in (DOCSTORE_OFFSETS_NAME, DOCSTORE_DATA_NAME):
+            open(os.path.join(directory, name), "wb").close()
+        return cls(directory)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ends) + len(self._pending)
+
+    @property
+    def flushed_count(self) -> int:
+        return len(self._ends)
+
+    def data_end(self, rows: Optional[int] = None) -> int:
+        """前 rows 条文档 (默认全部，含尚未 flush 的) 的数据总字节数，只读取 offsets，不解码文档"""
+        with self._lock:
+            rows = len(self) if rows is None else min(rows, len(self))
+            flushed = min(rows, len(self._ends))
+            end = int(self._ends[flushed - 1]) if flushed else 0
+            return end + sum(len(raw) for raw in self._pending[:rows - flushed])
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """追加文档，id 必须是连续的行号 (与 FAISS 中向量的行号一一对应)"""
+        with self._lock:
+            start = len(self)
+            for offset, (doc_id, doc) in enumerate(texts.items()):
+                if doc_id != str(start + offset):
+                    raise ValueError(
+                        f"MmapDocstore ids must be consecutive FAISS row ids, expected '{start + offset}', got '{doc_id}'"
+                    )
+                self._pending.append(self._encode(doc))
+
+    def search(self, search: str) -> Union[str, Document]:
+        try:
+            row = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        doc = self.get_document(row)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def get_document(self, row: int) -> Optional[Document]:
+        """按 FAISS 行号读取文档，行号越界时返回 None"""
+        with self._lock:
+            flushed = len(self._ends)
+            if 0 <= row < flushed:
+                start = int(self._ends[row - 1]) if row else 0
+                raw = self._data[start:int(self._ends[row])]
+            elif flushed <= row < flushed + len(self._pending):
+                raw = self._pending[row - flushed]
+            else:
+                return None
+        return self._decode(raw)
+
+    def iter_documents(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Document]:
+        """按行号顺序逐个读取文档 (不会一次性载入全部文档)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for row in range(start, stop):
+            yield self.get_document(row)
+
+    def flush(self) -> int:
+        """将缓冲区中的新文档追加到磁盘，返回写入的文档数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            flushed = len(self._ends)
+            base = int(self._ends[-1]) if flushed else 0
+            lengths = np.fromiter((len(raw) for raw in self._pending), dtype='<i8', count=len(self._pending))
+            ends = base + np.cumsum(lengths)
+            # 从视图末尾写入: 视图之外的记录不属于任何已发布的快照 (上次保存中断留下的)，直接覆盖。
+            # 调用方需持有平台的写入锁 (见 FaissManager.save_index)，保证没有其他进程在同时追加或已发布更新的版本。
+            # 文件只会变长不会被截短，其他进程 mmap 的已发布数据不受影响。
+            # 先写数据再写偏移: offsets 文件是提交点，快照只通过 max_rows 看到已发布的前缀
+            self._write_at(self.data_path, base, b"".join(self._pending))
+            self._write_at(self.offsets_path, flushed * 8, ends.astype('<i8').tobytes())
+            count = len(self._pending)
+            self._pending = []
+            if self.max_rows is not None:
+                self.max_rows = flushed + count
+            self._open()
+            return count
+
+    def truncate(self, size: int) -> None:
+        """只保留前 size 条文档 (用于丢弃上次保存时 index.faiss 未写完而多出的文档)"""
+        with self._lock:
+            if size > len(self):
+                raise ValueError(f"Cannot truncate docstore of {len(self)} documents to {size}")
+            flushed = len(self._ends)
+            if size >= flushed:
+                self._pending = self._pending[:size - flushed]
+                return
+            data_end = int(self._ends[size - 1]) if size else 0
+            self._pending = []
+            self._close()
+            self._truncate_files(size, data_end)
+            if self.max_rows is not None:
+                self.max_rows = size
+            self._open()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _open(self):
+        self._close()
+        offsets_size = os.path.getsize(self.offsets_path) if os.path.exists(self.offsets_path) else 0
+        # 不完整的最后一条偏移 (写入中断) 直接忽略
+        count = offsets_size // 8
+        if self.max_rows is not None:
+            count = min(count, self.max_rows)
+        self._ends = np.memmap(self.offsets_path, dtype='<i8', mode='r', shape=(count,)) if count else np.empty(0, dtype='<i8')
+        data_end = int(self._ends[-1]) if count else 0
+        if self.max_rows is None:
+            self._truncate_files(count, data_end)
+        if data_end:
+            with open(self.data_path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def _write_at(path, position, payload: bytes):
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(position)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _truncate_files(self, count, data_end):
+        if os.path.exists(self.data_path) and os.path.getsize(self.data_path) > data_end:
+            with open(self.data_path, "r+b") as f:
+                f.truncate(data_end)
+        if os.path.exists(self.offsets_path) and os.path.getsize(self.offsets_path) > count * 8:
+            with open(self.offsets_path, "r+b") as f:
+                f.truncate(count * 8)
+
+    def _close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
+        self._ends = np.empty(0, dtype='<i8')
+
+    @staticmethod
+    def _encode(doc: Document) -> bytes:
+        return json.dumps([doc.page_content, doc.metadata], ensure_ascii=False, default=str).encode("utf-8")
+
+    @staticmethod
+    def _decode(raw) -> Document:
+        page_content, metadata = json.loads(bytes(raw))
+        return Document(page_content=page_content, metadata=metadata)
+
+
+class RowIdMap(Mapping):
+    """
+    与 MmapDocstore 配合使用的 index_to_docstore_id: 行号 -> 行号字符串。
+    不需要保存任何字典，langchain 的 FAISS 追加向量时通过 update() 增加行数。
+    """
+
+    def __init__(self, size: int = 0):
+        self._size = size
+
+    def __getitem__(self, row):
+        if isinstance(row, (int, np.integer)) and 0 <= row < self._size:
+            return str(int(row))
+        raise KeyError(row)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def update(self, mapping):
+        for row, doc_id in sorted(mapping.items()):
+            if row != self._size or doc_id != str(row):
+                raise ValueError(f"RowIdMap expects consecutive row ids, got {row} -> {doc_id}")
+            self._size += 1
@@ -0,0 +1,292 @@
+# 磁盘 embedding 缓存: 按 (模型名, 规范化文本的哈希) 缓存向量，命中时不再调用 embedding 模型
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: 没有 flock，不做跨进程的写入者检查
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "embedding_cache"
+DEFAULT_MAX_ENTRIES = 500000
+CACHE_DATA_NAME = "cache.bin"
+CACHE_META_NAME = "meta.json"
+CACHE_LOCK_NAME = "writer.lock"
+MIN_CAPACITY = 1024
+_EMPTY_KEY = bytes(16)
+
+
+class EmbeddingCache:
+    """
+    每个模型一个目录，目录下是一个内存映射的定长记录文件 cache.bin，每条记录为:
+      key (16 字节 blake2b 文本哈希) | tick (最近使用的序号，用于 LRU) | vector (float16)
+    哈希索引 (key -> 记录位置) 在加载时由文件重建，因此不需要单独保存索引文件;
+    记录数达到 max_entries 后按 LRU 淘汰，直接复用被淘汰记录的位置，文件大小不会超过上限。
+    同一目录只能由一个进程写入: 打开时对目录下的 writer.lock 加 flock 排他锁 (进程退出时自动释放)，
+    拿不到锁的进程 (例如同时运行的 index_content --workers 和 process_indexing_queue) 以只读方式打开:
+    只读取命中的向量，新计算的向量不写入; 读取时核对记录中的 key，被写入者淘汰复用的位置按未命中处理。
+    """
+
+    def __init__(self, directory: str, model_name: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.model_name = model_name
+        self.directory = os.path.join(directory, self._model_slug(model_name))
+        self.data_path = os.path.join(self.directory, CACHE_DATA_NAME)
+        self.meta_path = os.path.join(self.directory, CACHE_META_NAME)
+        self.max_entries = max_entries
+        self.dimension = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        self._slots = OrderedDict()  # key -> 记录位置, 按最近使用排序 (最近使用的在末尾)
+        self._free = []  # 未使用的记录位置
+        self._records = None
+        self._tick = 0
+        self._loaded_size = 0  # 只读时加载的文件大小，写入者扩容后重新加载
+        self._lock_file = None
+        self.read_only = not self._acquire_writer_lock()
+        self._load()
+
+    def __len__(self):
+        return len(self._slots)
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """Unicode NFC + 去掉首尾空白，保证同一段内容得到同一个 key"""
+        return unicodedata.normalize("NFC", text).strip()
+
+    @classmethod
+    def text_key(cls, text: str) -> bytes:
+        return hashlib.blake2b(cls.normalize_text(text).encode("utf-8"), digest_size=16).digest()
+
+    def get_many(self, texts: List[str]):
+        """返回 (vectors, hit_mask)，未命中的行为 0; 缓存为空时 vectors 为 None"""
+        keys = [self.text_key(text) for text in texts]
+        with self._lock:
+            if self.read_only:
+                self._reload_if_grown()
+            hit_mask = np.zeros(len(keys), dtype=bool)
+            if self.dimension is None:
+                self.misses += len(keys)
+                return None, hit_mask
+            vectors = np.zeros((len(keys), self.dimension), dtype=np.float32)
+            for row, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    continue
+                if self.read_only:
+                    if self._records['key'][slot].tobytes() != key:
+                        del self._slots[key]  # 该位置已被写入者淘汰并复用
+                        continue
+                else:
+                    self._touch(key, slot)
+                vectors[row] = self._records['vector'][slot]
+                hit_mask[row] = True
+            hit_count = int(hit_mask.sum())
+            self.hits += hit_count
+            self.misses += len(keys) - hit_count
+            return vectors, hit_mask
+
+    def put_many(self, texts: List[str], vectors) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(texts) or self.read_only:
+            return
+        with self._lock:
+            if self.dimension is None:
+                self._create(vectors.shape[1])
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match cache dimension {self.dimension} ({self.model_name})"
+                )
+            for text, vector in zip(texts, vectors):
+                key = self.text_key(text)
+                slot = self._slots.get(key)
+                if slot is None:
+                    slot = self._allocate_slot()
+                    self._records['key'][slot] = np.frombuffer(key, dtype='V16')[0]
+                self._records['vector'][slot] = vector
+                self._touch(key, slot)
+
+    def embed_documents(self, texts: List[str], embed_fn: Callable[[List[str]], list]) -> np.ndarray:
+        """
+        命中的文本直接读缓存，只把未命中的 (去重后的) 文本交给 embed_fn 计算并写入缓存。
+        返回 float32 矩阵; 新计算的向量同样经过 float16 取整，保证同一文本无论是否命中结果一致。
+        """
+        if not texts:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        cached, hit_mask = self.get_many(texts)
+
+        missing = {}  # key -> 第一次出现的文本, 同一批中重复的文本只计算一次
+        for text, hit in zip(texts, hit_mask):
+            if not hit:
+                missing.setdefault(self.text_key(text), text)
+        if not missing:
+            return cached
+
+        computed = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+        computed = computed.astype(np.float16).astype(np.float32)
+        self.put_many(list(missing.values()), computed)
+
+        computed_rows = dict(zip(missing.keys(), computed))
+        vectors = cached if cached is not None else np.zeros((len(texts), computed.shape[1]), dtype=np.float32)
+        for row, (text, hit) in enumerate(zip(texts, hit_mask)):
+            if not hit:
+                vectors[row] = computed_rows[self.text_key(text)]
+        return vectors
+
+    def save(self) -> None:
+        """把缓存记录刷到磁盘"""
+        with self._lock:
+            if self._records is not None and not self.read_only:
+                self._records.flush()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'model_name': self.model_name,
+            'read_only': self.read_only,
+            'entries': len(self._slots),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def _touch(self, key, slot):
+        self._tick += 1
+        self._records['tick'][slot] = self._tick
+        self._slots[key] = slot
+        self._slots.move_to_end(key)
+
+    def _allocate_slot(self):
+        if not self._free:
+            if len(self._records) < self.max_entries:
+                self._grow(min(self.max_entries, max(MIN_CAPACITY, len(self._records) * 2)))
+            else:
+                # 已满: 淘汰最久未使用的记录并复用其位置
+                _, slot = self._slots.popitem(last=False)
+                return slot
+        return self._free.pop()
+
+    def _record_dtype(self, dimension):
+        return np.dtype([('key', 'V16'), ('tick', '<i8'), ('vector', '<f2', (dimension,))])
+
+    def _create(self, dimension):
+        os.makedirs(self.directory, exist_ok=True)
+        self.dimension = dimension
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'model_name': self.model_name, 'dimension': dimension}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.meta_path)
+        open(self.data_path, "wb").close()
+        self._records = np.zeros(0, dtype=self._record_dtype(dimension))
+
+    def _grow(self, capacity):
+        """扩大记录文件 (新记录全为 0，即空位置)"""
+        old_capacity = len(self._records)
+        if isinstance(self._records, np.memmap):
+            self._records.flush()
+        self._records = None
+        with open(self.data_path, "r+b") as f:
+            f.truncate(capacity * self._record_dtype(self.dimension).itemsize)
+        self._records = np.memmap(self.data_path, dtype=self._record_dtype(self.dimension), mode='r+', shape=(capacity,))
+        # 倒序放入，pop() 时按位置从小到大使用
+        self._free.extend(range(capacity - 1, old_capacity - 1, -1))
+
+    def _acquire_writer_lock(self) -> bool:
+        """对 writer.lock 加非阻塞的排他锁，成功时本进程是该目录的写入者"""
+        if fcntl is None:
+            return True
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(os.path.join(self.directory, CACHE_LOCK_NAME), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            logger.warning(f"Embedding cache at {self.directory} is locked by another process, opening read-only")
+            return False
+        self._lock_file = lock_file  # 保持打开，进程存活期间一直持有锁
+        return True
+
+    def _reload_if_grown(self):
+        size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        if size != self._loaded_size:
+            self._slots.clear()
+            self._free = []
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.data_path):
+            return
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dimension = json.load(f)['dimension']
+            dtype = self._record_dtype(self.dimension)
+            self._loaded_size = os.path.getsize(self.data_path)
+            capacity = self._loaded_size // dtype.itemsize
+            if not capacity:
+                self._records = np.zeros(0, dtype=dtype)
+                return
+            mode = 'r' if self.read_only else 'r+'
+            self._records = np.memmap(self.data_path, dtype=dtype, mode=mode, shape=(capacity,))
+        except Exception as e:
+            logger.warning(f"Embedding cache at {self.directory} is unreadable, starting empty: {e}")
+            self.dimension = None
+            self._records = None
+            return
+
+        keys = np.ascontiguousarray(self._records['key']).view(np.uint8).reshape(capacity, 16)
+        used = np.flatnonzero(keys.any(axis=1))
+        ticks = np.asarray(self._records['tick'][used])
+        for slot in used[np.argsort(ticks, kind='stable')]:
+            self._slots[keys[slot].tobytes()] = int(slot)
+        self._free = sorted(set(range(capacity)) - set(used.tolist()), reverse=True)
+        self._tick = int(ticks.max()) if len(ticks) else 0
+
+        # max_entries 调小后，淘汰多出来的记录 (只读时交给写入者)
+        while not self.read_only and len(self._slots) > self.max_entries:
+            _, slot = self._slots.popitem(last=False)
+            self._records['key'][slot] = np.frombuffer(_EMPTY_KEY, dtype='V16')[0]
+            self._free.append(slot)
+        logger.info(f"Loaded embedding cache for {self.model_name}: {len(self._slots)} entries (dim={self.dimension})")
+
+    @staticmethod
+    def _model_slug(model_name: str) -> str:
+        return re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name).strip('_') or 'default'
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(embedding_model) -> Optional[EmbeddingCache]:
+    """
+    返回该 embedding 模型共享的缓存实例 (同一进程内每个模型只打开一次)。
+    settings.EMBEDDING_CACHE_MAX_ENTRIES 为 0 时关闭缓存，返回 None。
+    """
+    max_entries = DEFAULT_MAX_ENTRIES
+    directory = DEFAULT_CACHE_DIR
+    if settings.configured:
+        max_entries = getattr(settings, 'EMBEDDING_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+        directory = getattr(settings, 'EMBEDDING_CACHE_DIR', DEFAULT_CACHE_DIR)
+    if not max_entries:
+        return None
+    model_name = getattr(embedding_model, 'model_name', None) or type(embedding_model).__name__
+    with _caches_lock:
+        cache = _caches.get((directory, model_name))
+        if cache is None:
+            cache = EmbeddingCache(directory, model_name, max_entries=max_entries)
+            _caches[(directory, model_name)] = cache
+        return cache
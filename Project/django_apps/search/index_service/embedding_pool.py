@@ -0,0 +1,99 @@
+# 多进程 embedding: 大批量回填时把文本分批分发给 N 个 worker 进程 (每个进程一份模型)，结果按原顺序拼回
+
+import functools
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_worker_model = None
+
+
+def _init_worker(num_threads: int, model_factory: Callable):
+    """worker 进程初始化: 固定线程数后加载自己的模型副本"""
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[name] = str(num_threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+    torch.set_num_threads(num_threads)
+
+    global _worker_model
+    _worker_model = model_factory()
+
+
+def _embed_batch(texts: List[str]):
+    return np.asarray(_worker_model.embed_documents(texts), dtype=np.float32)
+
+
+class EmbeddingWorkerPool:
+    """
+    与 langchain Embeddings 接口兼容 (embed_documents / embed_query) 的多进程 embedding 执行器:
+      - num_workers 个 spawn 出来的进程，每个进程 torch 线程数固定为 threads_per_worker，避免线程数超订
+      - 同时在途的批次数不超过 max_pending (有界队列)，超过时等待已提交的批次完成
+      - 结果按批次序号拼回，输出顺序与输入一致
+    模型在进程启动时加载，因此 pool 应在整个回填过程中复用，用完调用 close() (或使用 with 语句)。
+    """
+
+    def __init__(self, num_workers: int, threads_per_worker: Optional[int] = None, batch_size: int = 32,
+                 max_pending: Optional[int] = None, model_factory: Optional[Callable] = None):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self.batch_size = batch_size
+        self.max_pending = max_pending or num_workers * 2
+        if model_factory is None:
+            # worker 进程没有加载 Django settings，在父进程中确定 embedding 后端 (torch / onnx) 后传给 worker
+            from ..utils import get_embedding_backend_config, get_embeddings
+            config = get_embedding_backend_config()
+            if config['backend'] == 'onnx':
+                config['onnx_num_threads'] = self.threads_per_worker
+            model_factory = functools.partial(get_embeddings, **config)
+        # torch 与 fork 不兼容 (父进程已初始化的线程池 / CUDA 状态)，统一使用 spawn
+        self._executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, model_factory),
+        )
+        logger.info(f"Started embedding worker pool: {num_workers} workers x {self.threads_per_worker} threads")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def embed_documents(self, texts: List[str]):
+        """返回与 texts 一一对应的向量 (float32 矩阵)"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # 批次不超过 batch_size，且尽量让每个 worker 都分到任务
+        size = max(1, min(self.batch_size, math.ceil(len(texts) / self.num_workers)))
+        return np.vstack(self.embed_batches([texts[start:start + size] for start in range(0, len(texts), size)]))
+
+    def embed_batches(self, batches: List[List[str]]):
+        """按给定的批次分发给 worker，返回与 batches 一一对应的向量矩阵列表"""
+        results = [None] * len(batches)
+        pending = {}  # future -> 批次序号
+        next_batch = 0
+        while next_batch < len(batches) or pending:
+            while next_batch < len(batches) and len(pending) < self.max_pending:
+                pending[self._executor.submit(_embed_batch, batches[next_batch])] = next_batch
+                next_batch += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+        return results
+
+    def embed_query(self, text: str):
+        return self.embed_documents([text])[0].tolist()
@@ -1,15 +1,26 @@
 # 负责 FAISS 索引的保存、加载、验证等管理
 
 import os
+import json
 import logging
+import shutil
+import faiss
 import jieba
 from langchain_community.vectorstores import FAISS
 from rank_bm25 import BM25Okapi
 from typing import List
-from .text_preprocessor import TextPreprocessor  # 引入文本预处理
+import numpy as np
+from .text_preprocessor import TextPreprocessor, get_preprocessor  # 引入文本预处理
+from .bm25_engine import SparseBM25, BM25_ARTIFACT_NAME
+from . import index_factory
+from . import snapshot_store
+from .docstore import MmapDocstore, RowIdMap
+from .embedding_cache import get_embedding_cache
+from .query_cache import get_query_embedding_cache
 
 # 这里是混合检索中用到的类型
 from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from rank_bm25 import BM25Okapi
 
@@ -17,14 +28,42 @@ logger = logging.getLogger(__name__)
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+# 可选的 BM25 实现: sparse 为基于 CSR 倒排矩阵的向量化实现, rank_bm25 为原始的 BM25Okapi
+BM25_BACKENDS = {
+    'sparse': SparseBM25,
+    'rank_bm25': BM25Okapi,
+}
+
+# 文档存储: mmap 为按行号追加写入的内存映射存储, pickle 为 langchain 默认的 index.pkl
+DOCSTORE_BACKENDS = ('mmap', 'pickle')
+
 class FaissManager:
-    def __init__(self, embedding_model, base_index_dir="faiss_index", platform="reddit"):
+    def __init__(self, embedding_model, base_index_dir="faiss_index", platform="reddit", bm25_backend="sparse",
+                 index_type="flat", index_params=None, docstore_backend="mmap", snapshot_keep=snapshot_store.DEFAULT_KEEP,
+                 tokenize_workers=None):
         """
         :param embedding_model: 用于生成文本向量的模型
         :param base_index_dir: 基础索引目录(例如 faiss_index)
         :param platform: 平台标识(reddit, stackoverflow, rednote)，用于确定子目录
+        :param bm25_backend: BM25 实现, 见 BM25_BACKENDS ('sparse' 或 'rank_bm25')
+        :param index_type: 新建索引时使用的向量索引类型, 见 index_factory.INDEX_TYPES;
+                           加载已有索引时以磁盘上的 index_params.json 为准
+        :param index_params: 索引参数 (nlist / nprobe / m / ef_search 等)，未指定的使用默认值
+        :param docstore_backend: 文档存储, 见 DOCSTORE_BACKENDS; 选择 mmap 时旧的 index.pkl 会在首次加载时迁移
+        :param snapshot_keep: 保存时保留的快照版本数 (见 snapshot_store)
+        :param tokenize_workers: 构建 BM25 时并行分词的进程数，None 为按 CPU 核数自动选择，1 表示串行
         """
+        if bm25_backend not in BM25_BACKENDS:
+            raise ValueError(f"Unsupported bm25_backend: {bm25_backend}")
+        if index_type not in index_factory.INDEX_TYPES:
+            raise ValueError(f"Unsupported index_type: {index_type}")
+        if docstore_backend not in DOCSTORE_BACKENDS:
+            raise ValueError(f"Unsupported docstore_backend: {docstore_backend}")
         self.embedding_model = embedding_model
+        self.bm25_backend = bm25_backend
+        self.index_type = index_type
+        self.index_params = dict(index_params or {})
+        self.docstore_backend = docstore_backend
         self.platform = platform.lower() if isinstance(platform, str) else "all"
         self.index_dir = os.path.join(base_index_dir, self.platform)
         self.texts = []  # 添加这行来保存文本
@@ -33,9 +72,17 @@ class FaissManager:
             os.makedirs(self.index_dir, exist_ok=True)
         self.faiss_store = None
         self.bm25 = None
-        self.all_texts = []  # 用于保存初始化BM25时的文本
-        self.preprocessor = TextPreprocessor()  # 实例化预处理类
-        print(f"--- [FaissManager.__init__] FaissManager for platform '{platform}' initialized. TextPreprocessor ready. ---")
+        self._bm25_saved_key = None  # 已写入磁盘的 BM25 文件对应的校验键 (见 _bm25_validation_key)
+        self._bm25_saved_path = None  # 该 BM25 文件的路径 (下一个快照 BM25 未变化时直接硬链接)
+        self.snapshot_keep = snapshot_keep
+        self.tokenize_workers = tokenize_workers
+        self.snapshot_version = None  # 当前内存中的索引对应的快照版本; None 表示旧的平铺目录或尚未保存的新索引
+        self._snapshot_state = None  # 该快照的 (行数, 索引类型, 参数)，未变化时 save_index 不再写新版本
+        self._snapshot_dir = None
+        self._manifest_bm25_key = None  # 已加载快照的 snapshot.json 中记录的 BM25 校验键
+        self.preprocessor = get_preprocessor()  # 进程内共享的预处理实例 (停用词 / jieba 词典在第一次分词时加载)
+        self.query_cache = get_query_embedding_cache(embedding_model)  # 查询向量 LRU 缓存 (所有平台共享)
+        print(f"--- [FaissManager.__init__] FaissManager for platform '{platform}' initialized. ---")
 
     def initialize_bm25(self, texts: List[str]):
         """使用提供的文本列表初始化 BM25 模型"""
@@ -43,7 +90,6 @@ class FaissManager:
         if not texts:
             print("--- [FaissManager.initialize_bm25] 警告：文本列表为空，无法初始化 BM25 ---")
             self.bm25 = None
-            self.all_texts = []
             return
 
         try:
@@ -52,41 +98,101 @@ class FaissManager:
             # 检查第一个文档预处理后的结果
             if texts:
                 print(f"    原始文档示例: '{texts[0][:100]}...'")
-                tokenized_docs = [self.preprocessor.preprocess_text(text) for text in texts]
+                tokenized_docs = self.preprocessor.process_batch(texts, workers=self.tokenize_workers)
                 print(f"    分词后文档示例 (前 20 词): {tokenized_docs[0][:20]}")
             else:
                  tokenized_docs = []
 
             # 使用 tokenized_docs 训练 BM25 模型
             if tokenized_docs:
-                self.bm25 = BM25Okapi(tokenized_docs)
-                self.all_texts = texts # 保存原始文本用于后续检索
-                print(f"--- [FaissManager.initialize_bm25] BM25 模型初始化成功！(self.bm25 is not None: {self.bm25 is not None}) ---")
+                self.bm25 = BM25_BACKENDS[self.bm25_backend](tokenized_docs)
+                print(f"--- [FaissManager.initialize_bm25] BM25 模型初始化成功！(backend={self.bm25_backend}) ---")
             else:
                 print("--- [FaissManager.initialize_bm25] 警告：所有文档预处理后均为空，无法初始化 BM25 ---")
                 self.bm25 = None
-                self.all_texts = []
 
         except Exception as e:
             print(f"!!! [FaissManager.initialize_bm25] 初始化 BM25 时出错: {e}")
             self.bm25 = None
-            self.all_texts = []
 
     def initialize_store(self, texts: list):
         """从文本列表初始化 FAISS 索引"""
         self.texts = texts  # 保存原始文本
-        self.faiss_store = FAISS.from_texts(texts, self.embedding_model)
+        index_type, index_params = self.index_type, self.index_params
+        if self.docstore_backend == 'mmap':
+            self.create_empty_index()
+            self.faiss_store.add_texts(texts, ids=self._next_row_ids(len(texts)))
+        else:
+            self.faiss_store = FAISS.from_texts(texts, self.embedding_model)
+            self.index_type, self.index_params = 'flat', {}
+        if index_type != self.index_type:
+            # 向量先写入 IndexFlatL2，这里按配置转换为近似索引
+            self._rebuild_index(index_type, index_params)
         # 同时初始化BM25
         self.initialize_bm25(texts)
 
-    def add_texts(self, texts: list, metadatas: list, embeddings: list):
+    def add_texts(self, texts: list, metadatas: list, embeddings: list = None):
+        """
+        添加文本到 FAISS 和 BM25。
+        提供 embeddings 时直接写入这些向量 (langchain 的 FAISS.add_texts 会忽略该参数并重新计算 embedding)。
+        """
+        if embeddings is not None:
+            return self.add_embeddings(texts, embeddings, metadatas)
+        if not self.faiss_store:
+            logger.info("FAISS store not initialized, creating empty index first")
+            self.create_empty_index()
+        self.faiss_store.add_texts(texts=texts, metadatas=metadatas, ids=self._next_row_ids(len(texts)))
+        self._append_to_bm25(texts)
+
+    def add_embeddings(self, texts: list, embeddings, metadatas: list = None):
+        """将已计算好的向量批量写入 FAISS (不会再次调用 embedding 模型)，并同步 BM25"""
+        if not texts:
+            return
         if not self.faiss_store:
             logger.info("FAISS store not initialized, creating empty index first")
             self.create_empty_index()
-        self.faiss_store.add_texts(texts=texts, metadatas=metadatas, embeddings=embeddings)
+        self.faiss_store.add_embeddings(
+            text_embeddings=list(zip(texts, embeddings)),
+            metadatas=metadatas,
+            ids=self._next_row_ids(len(texts))
+        )
+        self._append_to_bm25(texts)
+
+    def _next_row_ids(self, count):
+        """MmapDocstore 以 FAISS 行号作为 docstore id; pickle 存储返回 None, 由 langchain 生成 uuid"""
+        if not isinstance(self.faiss_store.docstore, MmapDocstore):
+            return None
+        start = self.faiss_store.index.ntotal
+        return [str(row) for row in range(start, start + count)]
+
+    def _append_to_bm25(self, texts: list):
+        """
+        将新加入 FAISS 的文档同步到 BM25，只对新文本分词，不再整体重建。
+        空文本同样占一个位置，保证 BM25 中的位置与 FAISS 行号一致。
+        rank_bm25 实现不支持增量更新，此时丢弃旧模型，由 search_bm25 在下次查询时重建。
+        """
+        new_texts = [text or "" for text in texts]
+        if not new_texts:
+            return
+        if self.bm25 is None:
+            # 索引此前为空时直接用新文档构建；否则交给 search_bm25 从 docstore 懒加载
+            if len(self.faiss_store.index_to_docstore_id) == len(texts):
+                self.initialize_bm25(new_texts)
+            return
+        if not isinstance(self.bm25, SparseBM25):
+            self.bm25 = None
+            return
+
+        tokenized_docs = self.preprocessor.process_batch(new_texts, workers=self.tokenize_workers)
+        self.bm25.add_documents(tokenized_docs)
+        print(f"--- [FaissManager._append_to_bm25] BM25 增量加入 {len(new_texts)} 个文档 (共 {len(self.bm25)} 个) ---")
 
     def save_index(self):
-        """保存FAISS索引到本地目录"""
+        """
+        将当前索引保存为一个新的快照版本 (index.faiss / index_params.json / BM25 文件写入新目录)，
+        全部写完后原子地切换 CURRENT。读取方不会看到写了一半的文件，写入中断时 CURRENT 仍指向上一个完整版本。
+        返回是否成功发布 (其他进程已发布更新的版本时返回 False，需要重新加载后再写入)。
+        """
         try:
             if not self.faiss_store:
                 logger.warning(f"尝试保存空的FAISS索引 (platform={self.platform})，跳过")
@@ -95,16 +201,45 @@ class FaissManager:
             # 确保目录存在
             if not os.path.exists(self.index_dir):
                 os.makedirs(self.index_dir, exist_ok=True)
+
+            # 从检查版本到发布都持有平台目录的写入锁，其他进程的保存依次进行 (共享的文档存储不会被同时追加)
+            with snapshot_store.writer_lock(self.index_dir):
+                current = snapshot_store.current_version(self.index_dir)
+                if self.snapshot_version is not None and current != self.snapshot_version:
+                    # 其他进程在本实例加载之后发布了新版本: 继续追加会覆盖对方写入的文档
+                    logger.error(f"平台 {self.platform} 的索引已被更新到版本 {current} (本实例为 {self.snapshot_version})，"
+                                 f"需要重新加载后再写入")
+                    return False
+                if current is not None and current == self.snapshot_version and self._snapshot_state == self._current_state():
+                    logger.info(f"平台 {self.platform} 的索引没有变化 (版本 {current})，跳过保存")
+                    return True
+
+                version, snapshot_dir = snapshot_store.new_snapshot_dir(self.index_dir)
+                logger.info(f"正在保存FAISS索引快照到: {snapshot_dir}")
+                manifest = {'rows': self.faiss_store.index.ntotal, 'index_type': self.index_type}
             
-            # 记录保存路径
-            index_path = os.path.join(self.index_dir, "index.faiss")
-            docstore_path = os.path.join(self.index_dir, "index.pkl")
-            logger.info(f"正在保存FAISS索引到: {index_path}")
-            
-            # 保存索引
-            self.faiss_store.save_local(self.index_dir)
-            logger.info(f"成功保存FAISS索引到: {self.index_dir}")
-            return True
+                # mmap 文档存储只追加新文档 (各版本共享, 快照只记录行数), pickle 存储把 index.pkl 写进快照目录
+                if isinstance(self.faiss_store.docstore, MmapDocstore):
+                    appended = self.faiss_store.docstore.flush()
+                    self._write_faiss_index(snapshot_dir)
+                    manifest['docstore'] = 'mmap'
+                    manifest['docstore_dir'] = os.path.relpath(self.faiss_store.docstore.directory, self.index_dir)
+                    logger.info(f"文档存储追加写入 {appended} 个文档")
+                else:
+                    self.faiss_store.save_local(snapshot_dir)
+                    manifest['docstore'] = 'pickle'
+                index_factory.save_index_params(snapshot_dir, self.index_type, self.index_params)
+                bm25_key = self._save_bm25_artifact(snapshot_dir)
+                if bm25_key:
+                    manifest['bm25_key'] = bm25_key
+
+                snapshot_store.publish(self.index_dir, version, manifest)
+                self.snapshot_version = version
+                self._snapshot_state = self._current_state()
+                self._manifest_bm25_key = manifest.get('bm25_key')
+                logger.info(f"成功保存FAISS索引快照: {snapshot_dir} (版本 {version})")
+                snapshot_store.prune(self.index_dir, self.snapshot_keep)
+                return True
         except Exception as e:
             logger.error(f"保存FAISS索引时出错: {str(e)}")
             import traceback
@@ -112,18 +247,14 @@ class FaissManager:
             return False
 
     def load_index(self):
-        """加载 FAISS 索引，如果不存在则返回 None"""
+        """加载 CURRENT 指向的快照 (没有快照时加载旧的平铺目录)，如果不存在则返回 None"""
         try:
-            index_path = os.path.join(self.index_dir, "index.faiss")
-            docstore_path = os.path.join(self.index_dir, "index.pkl")
-            
-            if not os.path.exists(index_path) or not os.path.exists(docstore_path):
-                logger.warning(f"索引文件不存在: {index_path} 或 {docstore_path}")
+            version = snapshot_store.current_version(self.index_dir)
+            if version is not None:
+                self._load_snapshot(version)
+            elif not self._load_legacy_index():
                 return None
             
-            logger.info(f"Loading FAISS index from {self.index_dir}...")
-            self.faiss_store = FAISS.load_local(self.index_dir, self.embedding_model, allow_dangerous_deserialization=True)
-            
             # 加载成功后，初始化 BM25
             print(f"--- [FaissManager.load_index] 正在加载平台 '{self.platform}' 的索引... ---")
             try:
@@ -132,12 +263,64 @@ class FaissManager:
             except Exception as e:
                 print(f"!!! [FaissManager.load_index] 调用 BM25 初始化时出错: {str(e)}")
             
-            logger.info(f"Loaded FAISS index with {len(self._get_all_docs_from_faiss())} documents")
+            logger.info(f"Loaded FAISS index with {self.faiss_store.index.ntotal} documents")
             return True
         except Exception as e:
             logger.error(f"加载索引时出错: {str(e)}")
             return False
 
+    def is_stale(self):
+        """磁盘上的 CURRENT 是否指向了与内存中不同的快照 (例如其他进程发布了新版本)"""
+        current = snapshot_store.current_version(self.index_dir)
+        return current is not None and current != self.snapshot_version
+
+    def _load_snapshot(self, version):
+        manifest = snapshot_store.read_manifest(self.index_dir, version)
+        snapshot_dir = snapshot_store.snapshot_path(self.index_dir, version)
+        logger.info(f"Loading FAISS index snapshot {version} from {snapshot_dir}...")
+        if manifest.get('docstore') == 'mmap':
+            docstore_dir = os.path.normpath(os.path.join(self.index_dir, manifest['docstore_dir']))
+            self.faiss_store = self._load_mmap_store(os.path.join(snapshot_dir, "index.faiss"), docstore_dir)
+        else:
+            self.faiss_store = FAISS.load_local(snapshot_dir, self.embedding_model, allow_dangerous_deserialization=True)
+        self._restore_index_params(snapshot_dir)
+        self.snapshot_version = version
+        self._snapshot_state = self._current_state()
+        self._snapshot_dir = snapshot_dir
+        self._manifest_bm25_key = manifest.get('bm25_key')
+        if manifest.get('docstore') != 'mmap' and self.docstore_backend == 'mmap':
+            # 已发布的快照不可修改: 迁移到新的文档存储目录后立即发布为新版本
+            self._migrate_pickle_docstore(snapshot_dir)
+            self.save_index()
+
+    def _load_legacy_index(self):
+        """加载快照功能之前的平铺目录 (index.faiss + index.pkl / docstore.*)，下次 save_index 时转为快照"""
+        index_path = os.path.join(self.index_dir, "index.faiss")
+        docstore_path = os.path.join(self.index_dir, "index.pkl")
+        
+        # index.pkl 只有在迁移完成后才会被重命名, 两者同时存在说明上次迁移未完成
+        has_mmap_docstore = MmapDocstore.exists(self.index_dir) and not os.path.exists(docstore_path)
+        if not os.path.exists(index_path) or not (has_mmap_docstore or os.path.exists(docstore_path)):
+            logger.warning(f"索引文件不存在: {index_path} 或 {docstore_path}")
+            return False
+        
+        logger.info(f"Loading FAISS index from {self.index_dir}...")
+        if has_mmap_docstore:
+            self.faiss_store = self._load_mmap_store(index_path)
+        else:
+            self.faiss_store = FAISS.load_local(self.index_dir, self.embedding_model, allow_dangerous_deserialization=True)
+            if self.docstore_backend == 'mmap':
+                self._migrate_pickle_docstore()
+        self._restore_index_params()
+        self.snapshot_version = None
+        self._snapshot_state = None
+        self._snapshot_dir = None
+        self._manifest_bm25_key = None
+        return True
+
+    def _current_state(self):
+        return (self.faiss_store.index.ntotal, self.index_type, json.dumps(self.index_params, sort_keys=True, default=str))
+
     def _get_all_docs_from_faiss(self):
         """
         从 self.faiss_store 的 docstore 中直接提取所有文档。
@@ -148,6 +331,8 @@ class FaissManager:
             return []
 
         all_doc_objects = []
+        if isinstance(self.faiss_store.docstore, MmapDocstore):
+            return list(self.faiss_store.docstore.iter_documents())
         # Langchain 的 FAISS 对象通常包含一个 InMemoryDocstore，它在 _dict 中存储文档
         if hasattr(self.faiss_store.docstore, '_dict') and isinstance(self.faiss_store.docstore._dict, dict):
             all_doc_objects = list(self.faiss_store.docstore._dict.values())
@@ -175,6 +360,30 @@ class FaissManager:
             
         return all_doc_objects
 
+    def get_document(self, row: int):
+        """
+        按 FAISS 行号读取文档 (不会加载整个 docstore)，行号不存在时返回 None。
+        返回的是副本，metadata['row_id'] 为行号 —— BM25 与向量检索共用的唯一整数 id。
+        """
+        if not self.faiss_store or row < 0 or row >= self.faiss_store.index.ntotal:
+            return None
+        docstore = self.faiss_store.docstore
+        if isinstance(docstore, MmapDocstore):
+            doc = docstore.get_document(row)
+        else:
+            doc_id = self.faiss_store.index_to_docstore_id.get(row)
+            doc = docstore.search(doc_id) if doc_id is not None else None
+        if not isinstance(doc, Document):
+            return None
+        return Document(page_content=doc.page_content, metadata={**doc.metadata, 'row_id': row})
+
+    def iter_documents(self):
+        """按行号顺序逐个返回文档"""
+        if not self.faiss_store:
+            return
+        for row in range(self.faiss_store.index.ntotal):
+            yield self.get_document(row)
+
     def verify_index(self):
         if not self.faiss_store:
             raise ValueError("No FAISS store loaded, cannot verify.")
@@ -185,103 +394,135 @@ class FaissManager:
         logger.info("Index verification successful.")
 
 
-    def search_bm25(self, query: str, top_k: int):
-        """Perform search using BM25."""
-        print(f"--- [FaissManager.search_bm25] Starting BM25 search, query: '{query}' ---")
+    def search_bm25_rows(self, query: str, top_k: int):
+        """
+        BM25 search returning row ids instead of Documents.
+        :return: (rows, scores) numpy arrays sorted by score descending; rows are FAISS row ids
+        """
+        top_rows, top_scores = self.search_bm25_rows_batch([query], top_k)[0]
+        if len(top_scores):
+            print(f"--- [FaissManager.search_bm25_rows] Top BM25 scores (top 10): {top_scores[:10]} ---")
+            print(f"    Score stats (top {len(top_scores)}): Min={top_scores.min():.4f}, Max={top_scores.max():.4f}, Avg={top_scores.mean():.4f}")
+        return top_rows, top_scores
+
+    def search_bm25_rows_batch(self, queries: List[str], top_k: int):
+        """
+        BM25 search for several queries at once (statistics refreshed once, shared term weights).
+        :return: list of (rows, scores) numpy arrays, one entry per query
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
         if self.bm25 is None:
-            print("--- [FaissManager.search_bm25] Warning: BM25 model not initialized, attempting to reinitialize... ---")
+            print("--- [FaissManager.search_bm25_rows_batch] Warning: BM25 model not initialized, attempting to reinitialize... ---")
             # Try to reinitialize just in case
             try:
                 self._initialize_bm25_from_faiss()
             except Exception as e:
-                print(f"!!! [FaissManager.search_bm25] Failed to reinitialize BM25: {e}")
+                print(f"!!! [FaissManager.search_bm25_rows_batch] Failed to reinitialize BM25: {e}")
 
         if self.bm25 is None:
-            print("!!! [FaissManager.search_bm25] BM25 model still uninitialized, cannot perform search, returning empty list. ---")
-            return []
-
-        # Retrieve all documents and their original metadata from FAISS
-        faiss_docs = self._get_all_docs_from_faiss()
-        faiss_docs_dict = {doc.page_content: doc.metadata for doc in faiss_docs}
+            print("!!! [FaissManager.search_bm25_rows_batch] BM25 model still uninitialized, cannot perform search. ---")
+            return [empty for _ in queries]
 
-        # Preprocess the query
-        print(f"--- [FaissManager.search_bm25] Preprocessing query: '{query}' ---")
-        tokenized_query = self.preprocessor.preprocess_text(query)
-        print(f"    Tokenized query: {tokenized_query}")
+        # Preprocess the queries
+        tokenized_queries = [self.preprocessor.preprocess_text(query) for query in queries]
+        if len(tokenized_queries) == 1:
+            print(f"    Tokenized query: {tokenized_queries[0]}")
 
-        # --- Key: print raw BM25 scores ---
         try:
-            print("--- [FaissManager.search_bm25] Calling bm25.get_scores()... ---")
-            scores = self.bm25.get_scores(tokenized_query)
-            print(f"--- [FaissManager.search_bm25] Raw scores from bm25.get_scores() (top 10): {scores[:10]} ---")
-            print(f"    Score stats: Min={min(scores):.4f}, Max={max(scores):.4f}, Avg={sum(scores)/len(scores):.4f}")
-        except Exception as e:
-            print(f"!!! [FaissManager.search_bm25] Error calling bm25.get_scores(): {e}")
-            return []
-        # --- End printing ---
-
-        # Get top top_k document indexes by score
-        top_indexes = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
-
-        # Convert them into list of (Document, score) tuples
-        results = []  # <--- renamed variable for clarity
-        print(f"--- [FaissManager.search_bm25] Constructing BM25 results... ---")  # Added log
-        for i in top_indexes:
-            if i < 0 or i >= len(self.all_texts):  # Add boundary check
-                print(f"!!! [FaissManager.search_bm25] Warning: index {i} out of all_texts range, skipping.")
-                continue
-            if i < 0 or i >= len(scores):  # Add boundary check
-                print(f"!!! [FaissManager.search_bm25] Warning: index {i} out of scores range, skipping.")
-                continue
-
-            doc_text = self.all_texts[i]
-            bm25_score = scores[i]
-
-            # Create basic metadata
-            metadata = {
-                # 'bm25_score': bm25_score, # no longer added here, will return in tuple
-                'id': i,
-                'source': self.platform
-            }
-
-            # If found in FAISS index, add full original metadata
-            # Note: faiss_docs_dict might be large, lookup efficiency may be low, but keep logic
-            if faiss_docs_dict and doc_text in faiss_docs_dict:
-                original_metadata = faiss_docs_dict[doc_text].copy()  # use copy() to avoid accidental modification
-                # Ensure id and source are correct
-                original_metadata['id'] = i
-                original_metadata['source'] = self.platform
-                # original_metadata['bm25_score'] = bm25_score # no longer added here
-
-                doc_obj = Document(
-                    page_content=doc_text,
-                    metadata=original_metadata
-                )
-            else:
-                # If not found in FAISS index, add platform-specific fields accordingly
-                # (This logic may need review, as all_texts should come from FAISS)
-                if self.platform == 'reddit':
-                    metadata['upvotes'] = 0
-                elif self.platform == 'stackoverflow':
-                    metadata['vote_score'] = 0
-                elif self.platform == 'rednote':
-                    metadata['likes'] = 0
-
-                doc_obj = Document(
-                    page_content=doc_text,
-                    metadata=metadata
-                )
-
-            # --- Key modification: return (Document, score) tuple ---
-            if doc_obj is not None:  # Ensure doc_obj was created successfully
-                results.append((doc_obj, bm25_score))
+            if isinstance(self.bm25, SparseBM25):
+                # Only the posting lists of the query terms are touched; top-k via argpartition
+                raw_results = self.bm25.get_top_n_batch(tokenized_queries, top_k)
             else:
-                print(f"!!! [FaissManager.search_bm25] Warning: Failed to create Document object for index {i}.")
+                raw_results = []
+                for tokenized_query in tokenized_queries:
+                    scores = np.asarray(self.bm25.get_scores(tokenized_query))
+                    top_rows = SparseBM25.top_n_from_scores(scores, top_k)
+                    raw_results.append((top_rows, scores[top_rows]))
+        except Exception as e:
+            print(f"!!! [FaissManager.search_bm25_rows_batch] Error computing BM25 scores: {e}")
+            return [empty for _ in queries]
+
+        results = []
+        for top_rows, top_scores in raw_results:
+            # Deleted documents score -inf and never count as hits
+            valid = np.isfinite(top_scores)
+            results.append((np.asarray(top_rows, dtype=np.int64)[valid], np.asarray(top_scores, dtype=np.float64)[valid]))
+        return results
 
+    def search_bm25(self, query: str, top_k: int):
+        """Perform search using BM25, returning (Document, score) tuples."""
+        print(f"--- [FaissManager.search_bm25] Starting BM25 search, query: '{query}' ---")
+        top_rows, top_scores = self.search_bm25_rows(query, top_k)
+        results = self.documents_for_rows(top_rows, top_scores)
         print(f"--- [FaissManager.search_bm25] BM25 search completed, returning {len(results)} (Document, score) tuples ---")
-        # --- Ensure returning tuple list ---
         return results
 
+    def search_rows(self, query: str, k: int):
+        """
+        FAISS vector search returning row ids instead of Documents.
+        :return: (rows, distances) numpy arrays; distances are the raw L2 values from the index
+        """
+        if not self.faiss_store or self.faiss_store.index.ntotal == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        query_vector = self._embed_queries([query])
+        if self.query_cache is not None:
+            stats = self.query_cache.stats()
+            print(f"--- [FaissManager.search_rows] Query embedding cache: hits={stats['hits']}, misses={stats['misses']}, hit_rate={stats['hit_rate']:.1%} ---")
+        distances, rows = self.faiss_store.index.search(query_vector, k)
+        # FAISS pads with -1 when fewer than k vectors are found
+        valid = rows[0] >= 0
+        return rows[0][valid].astype(np.int64), distances[0][valid].astype(np.float64)
+
+    def search_rows_batch(self, queries: List[str], k: int):
+        """
+        Batched FAISS search: the queries are embedded in one embed_documents call and
+        searched with a single index.search over the query matrix.
+        :return: list of (rows, distances) numpy arrays, one entry per query
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        if not self.faiss_store or self.faiss_store.index.ntotal == 0:
+            return [empty for _ in queries]
+        if not queries:
+            return []
+        query_matrix = self._embed_queries(list(queries))
+        distances, rows = self.faiss_store.index.search(query_matrix, k)
+        results = []
+        for row_ids, row_distances in zip(rows, distances):
+            # FAISS pads with -1 when fewer than k vectors are found
+            valid = row_ids >= 0
+            results.append((row_ids[valid].astype(np.int64), row_distances[valid].astype(np.float64)))
+        return results
+
+    def _embed_queries(self, queries: List[str]):
+        """
+        Embed queries as a float32 matrix. Repeated queries are served from the query
+        embedding cache; the misses go to the model in one embed_documents call
+        (a single miss uses embed_query).
+        """
+        def embed_many(missing):
+            if len(missing) == 1:
+                return [self.embedding_model.embed_query(missing[0])]
+            return self.embedding_model.embed_documents(missing)
+
+        if self.query_cache is None:
+            return np.asarray(embed_many(queries), dtype=np.float32)
+        return self.query_cache.embed_queries(queries, embed_many)
+
+    def search_batch(self, queries: List[str], k: int):
+        """Batched version of search: a list of (Document, score) lists, one per query."""
+        return [self.documents_for_rows(rows, distances) for rows, distances in self.search_rows_batch(queries, k)]
+
+    def documents_for_rows(self, rows, scores):
+        """Build (Document, score) tuples for the given row ids (one docstore read per row)."""
+        results = []
+        for row, score in zip(np.asarray(rows).tolist(), np.asarray(scores).tolist()):
+            doc = self.get_document(row)
+            if doc is None:
+                print(f"!!! [FaissManager.documents_for_rows] Warning: row {row} not found in docstore, skipping.")
+                continue
+            doc.metadata['source'] = self.platform
+            results.append((doc, score))
+        return results
 
     def search(self, query: str, k: int):
         """
@@ -291,28 +532,22 @@ class FaissManager:
         print(f"--- [FaissManager.search] Starting FAISS query: '{query}' (Top {k}) ---")
         if self.faiss_store:
             try:
-                # Directly call and get list of (Document, score) tuples
-                results_with_scores = self.faiss_store.similarity_search_with_score(query, k)
+                rows, distances = self.search_rows(query, k)
+                results_with_scores = self.documents_for_rows(rows, distances)
 
                 # --- Optional logging ---
                 print(f"--- [FaissManager.search] Raw FAISS search results (Top 5): ---")
-                raw_scores = []
                 for i, (doc, score) in enumerate(results_with_scores[:5]):  # Only print top 5
-                    print(f"  Result {i+1}: Raw score (L2)={score:.4f}, Document ID={doc.metadata.get('id', 'N/A')}")
-                    raw_scores.append(score)
-                if raw_scores:
-                    # Avoid min/max/avg on empty list
-                    if len(results_with_scores) > 0:
-                        all_scores = [s for _, s in results_with_scores]
-                        print(f"  Raw score stats (total {len(all_scores)}): Min={min(all_scores):.4f}, Max={max(all_scores):.4f}, Avg={sum(all_scores)/len(all_scores):.4f}")
+                    print(f"  Result {i+1}: Raw score (L2)={score:.4f}, Row ID={doc.metadata['row_id']}")
+                if len(distances):
+                    print(f"  Raw score stats (total {len(distances)}): Min={distances.min():.4f}, Max={distances.max():.4f}, Avg={distances.mean():.4f}")
                 # --- End logging ---
 
                 print(f"--- [FaissManager.search] FAISS query succeeded, returning {len(results_with_scores)} (Document, score) tuples ---")
-                # --- Return the original (Document, score) tuples ---
                 return results_with_scores
 
             except Exception as e:
-                print(f"!!! [FaissManager.search] Error executing similarity_search_with_score: {e}")
+                print(f"!!! [FaissManager.search] Error executing FAISS search: {e}")
                 print("--- [FaissManager.search] FAISS search failed, trying fallback to BM25 search. ---")
                 try:
                     # Ensure search_bm25 returns correct (doc, score) format
@@ -336,44 +571,254 @@ class FaissManager:
 
     def create_empty_index(self):
         """创建一个空的 FAISS 索引"""
-        from langchain_community.docstore.in_memory import InMemoryDocstore
-        import faiss
-        import numpy as np
-        
         # 确保目录存在
         if not os.path.exists(self.index_dir):
             os.makedirs(self.index_dir, exist_ok=True)
         
-        # 获取嵌入维度
-        test_embedding = self.embedding_model.embed_query("test")
-        dimension = len(test_embedding)
+        # 获取嵌入维度 (embedding 缓存中已记录维度时不需要推理)
+        dimension = self._embedding_dimension()
         
-        # 创建新的索引
-        index = faiss.IndexFlatL2(dimension)
-        docstore = InMemoryDocstore({})
+        # 创建新的索引; 需要训练的类型 (IVF / PQ / SQ) 先用 flat，数据足够后再调用 migrate_index
+        index_type = self.index_type
+        if index_type in index_factory.TRAINED_INDEX_TYPES:
+            logger.info(f"{index_type} 索引需要训练数据，先创建 flat 索引 (platform={self.platform})")
+            index_type = 'flat'
+        params = index_factory.resolve_params(index_type, self.index_params if index_type == self.index_type else None)
+        index = index_factory.build_index(index_type, dimension, params)
+        self.index_type, self.index_params = index_type, params
+        self._create_store(index)
+
+        # 初始化空的 BM25
+        self.bm25 = None
+
+        # 平台还没有任何快照时直接保存到磁盘; 已有快照时不发布空索引 (例如重建过程中)，
+        # 读取方继续使用旧版本，直到写入方填充数据后调用 save_index
+        if snapshot_store.current_version(self.index_dir) is None:
+            self.save_index()
         
+        logger.info(f"Created empty index for {self.platform}")
+        return self.faiss_store
+    
+    def _embedding_dimension(self):
+        cache = get_embedding_cache(self.embedding_model)
+        if cache is not None and cache.dimension:
+            return cache.dimension
+        return len(self.embedding_model.embed_query("test"))
+
+    def initialize_store_from_embeddings(self, texts: list, embeddings, metadatas: list = None):
+        """
+        用已经计算好的向量矩阵直接构建新索引 (不再调用 embedding 模型)，并初始化 BM25。
+        需要训练的索引类型在向量数达到 MIN_TRAINING_VECTORS 时直接在该矩阵上训练，否则先使用 flat。
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        index_type = self.index_type
+        if index_type in index_factory.TRAINED_INDEX_TYPES and len(vectors) < index_factory.MIN_TRAINING_VECTORS:
+            logger.info(f"只有 {len(vectors)} 个向量，{index_type} 索引先使用 flat (platform={self.platform})")
+            index_type = 'flat'
+        params = index_factory.resolve_params(
+            index_type, self.index_params if index_type == self.index_type else None, num_vectors=len(vectors)
+        )
+        index = index_factory.build_index(index_type, vectors.shape[1], params)
+        index_factory.train_index(index, vectors)
+        self.index_type, self.index_params = index_type, params
+
+        self._create_store(index)
+        self.faiss_store.add_embeddings(
+            text_embeddings=list(zip(texts, vectors)),
+            metadatas=metadatas,
+            ids=self._next_row_ids(len(texts))
+        )
+        self._bm25_saved_key = None
+        self.initialize_bm25(texts)
+        print(f"--- [FaissManager.initialize_store_from_embeddings] 用 {len(vectors)} 个向量构建了 {index_type} 索引 (platform={self.platform}) ---")
+        return self.faiss_store
+
+    def _create_store(self, index):
+        """用给定的 (空) faiss 索引和按 docstore_backend 新建的文档存储创建 FAISS 对象"""
+        if not os.path.exists(self.index_dir):
+            os.makedirs(self.index_dir, exist_ok=True)
+        if self.docstore_backend == 'mmap':
+            # 新的文档存储放在单独的目录中，不会覆盖已发布快照仍在引用的文档
+            docstore = MmapDocstore.create(snapshot_store.new_docstore_dir(self.index_dir))
+            index_to_docstore_id = RowIdMap()
+            if os.path.exists(os.path.join(self.index_dir, "index.pkl")):
+                os.replace(os.path.join(self.index_dir, "index.pkl"), os.path.join(self.index_dir, "index.pkl.bak"))
+        else:
+            docstore, index_to_docstore_id = InMemoryDocstore({}), {}
+        # 新的索引与已加载的快照无关，save_index 时直接发布为新版本
+        self.snapshot_version = None
+        self._snapshot_state = None
+
         # 创建 FAISS 对象
         self.faiss_store = FAISS(
             embedding_function=self.embedding_model,
             index=index,
             docstore=docstore,
-            index_to_docstore_id={}
+            index_to_docstore_id=index_to_docstore_id
         )
+        return self.faiss_store
 
-        # 直接保存到磁盘
-        index_path = os.path.join(self.index_dir, "index.faiss")
+    def migrate_index(self, index_type, index_params=None, sample_size=100000):
+        """
+        将当前向量索引原地转换为另一种类型 (例如 flat -> hnsw / ivf_pq)。
+        向量从现有索引中重建，行号顺序不变，docstore 与 BM25 无需改动。
+        """
+        if not self.faiss_store or self.faiss_store.index.ntotal == 0:
+            raise ValueError(f"平台 {self.platform} 的索引为空，无法迁移")
+        old_type = self.index_type
+        print(f"--- [FaissManager.migrate_index] 正在将 {self.platform} 索引从 {old_type} 迁移为 {index_type} ({self.faiss_store.index.ntotal} 个向量) ---")
+        self._rebuild_index(index_type, index_params, sample_size=sample_size)
+        self.save_index()
+        logger.info(f"平台 {self.platform} 的索引已从 {old_type} 迁移为 {index_type}, 参数: {self.index_params}")
+        return self.index_params
+
+    def set_search_params(self, **params):
+        """调整查询期参数 (nprobe / ef_search) 并在下次保存时持久化"""
+        self.index_params.update(params)
+        if self.faiss_store:
+            index_factory.apply_search_params(self.faiss_store.index, self.index_type, self.index_params)
+
+    def _rebuild_index(self, index_type, index_params=None, sample_size=100000):
+        if self.index_type in ('ivf_pq', 'sq8'):
+            logger.warning(f"从 {self.index_type} 迁移时向量为量化后的近似值，建议从 flat 索引迁移")
+        vectors = index_factory.reconstruct_all(self.faiss_store.index)
+        index, params = index_factory.build_trained_index(
+            index_type, vectors, index_params, sample_size=sample_size
+        )
+        self.faiss_store.index = index
+        self.index_type, self.index_params = index_type, params
+
+    def _restore_index_params(self, directory=None):
+        """加载索引后恢复类型与查询期参数 (旧索引没有 index_params.json 时按 faiss 类型推断)"""
+        index_type, params = index_factory.load_index_params(directory or self.index_dir)
+        if index_type is None:
+            index_type = index_factory.detect_index_type(self.faiss_store.index)
+        self.index_type, self.index_params = index_type, params
+        index_factory.apply_search_params(self.faiss_store.index, index_type, params)
+
+    def _write_faiss_index(self, directory):
+        """原子地写入 index.faiss (先写临时文件再替换)"""
+        index_path = os.path.join(directory, "index.faiss")
+        tmp_path = f"{index_path}.tmp"
+        faiss.write_index(self.faiss_store.index, tmp_path)
+        os.replace(tmp_path, index_path)
+
+    def _load_mmap_store(self, index_path, docstore_dir=None):
+        """
+        从 index.faiss + MmapDocstore 构建 FAISS 对象，不反序列化任何文档。
+        指定 docstore_dir (快照) 时只映射前 ntotal 条文档，不截断共享的文档存储文件。
+        """
+        index = faiss.read_index(index_path)
+        if docstore_dir is not None:
+            docstore = MmapDocstore(docstore_dir, max_rows=index.ntotal)
+        else:
+            docstore = MmapDocstore(self.index_dir)
+        if len(docstore) < index.ntotal:
+            raise ValueError(f"文档存储只有 {len(docstore)} 个文档, 少于索引中的 {index.ntotal} 个向量")
+        if docstore_dir is None:
+            # 上次保存时文档已追加但 index.faiss 未写完, 丢弃多出的文档
+            docstore.truncate(index.ntotal)
+        return FAISS(
+            embedding_function=self.embedding_model,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=RowIdMap(index.ntotal)
+        )
+
+    def _migrate_pickle_docstore(self, snapshot_dir=None):
+        """
+        一次性将 index.pkl 中的文档按行号写入 MmapDocstore。
+        旧的平铺目录: 文档存储写在同一目录，原文件重命名为 index.pkl.bak; 快照: 写入新的文档存储目录，快照本身不修改。
+        """
+        store = self.faiss_store
+        ntotal = store.index.ntotal
+        print(f"--- [FaissManager._migrate_pickle_docstore] 正在将 {ntotal} 个文档从 index.pkl 迁移到 mmap 文档存储 ---")
+        if snapshot_dir is not None:
+            docstore = MmapDocstore.create(snapshot_store.new_docstore_dir(self.index_dir))
+        else:
+            docstore = MmapDocstore.create(self.index_dir)
+        batch_size = 10000
+        for start in range(0, ntotal, batch_size):
+            rows = range(start, min(start + batch_size, ntotal))
+            docstore.add({str(row): store.docstore.search(store.index_to_docstore_id[row]) for row in rows})
+            docstore.flush()
+        store.docstore = docstore
+        store.index_to_docstore_id = RowIdMap(ntotal)
+        if snapshot_dir is not None:
+            self._snapshot_state = None
+            return
         docstore_path = os.path.join(self.index_dir, "index.pkl")
-        
-        # 使用 FAISS 的 save_local 方法保存
-        self.faiss_store.save_local(self.index_dir)
-        
-        # 初始化空的 BM25
-        self.bm25 = None
-        self.all_texts = []
-        
-        logger.info(f"Created empty index for {self.platform}")
-        return self.faiss_store
-    
+        os.replace(docstore_path, f"{docstore_path}.bak")
+        logger.info(f"已将平台 {self.platform} 的 index.pkl 迁移为 mmap 文档存储")
+
+    def _bm25_validation_key(self):
+        """
+        BM25 文件的校验键: BM25 实现 + 分词器版本 + 文档存储 (目录 / 行数 / 数据末尾偏移)。
+        文档存储只追加写入，行数和末尾偏移相同即语料相同; 只读取 offsets 中的一个值，不解码任何文档。
+        """
+        docstore = self.faiss_store.docstore
+        rows = self.faiss_store.index.ntotal
+        if isinstance(docstore, MmapDocstore):
+            location = f"{os.path.relpath(docstore.directory, self.index_dir)}@{docstore.data_end(rows)}"
+        else:
+            location = "pickle"  # index.pkl 与 BM25 文件在同一个快照目录中
+        return f"{self.bm25_backend}:tokenizer-v{TextPreprocessor.TOKENIZER_VERSION}:rows={rows}:docstore={location}"
+
+    def _bm25_artifact_path(self, directory=None):
+        return os.path.join(directory or self._snapshot_dir or self.index_dir, BM25_ARTIFACT_NAME)
+
+    def _save_bm25_artifact(self, directory=None):
+        """
+        将 BM25 统计量保存到 index.faiss 同目录下 (仅 sparse 实现支持持久化)，返回校验键 (未保存时返回 None)。
+        与上次保存的文件相同时不重新序列化: 同一目录直接跳过，新的快照目录硬链接已有文件。
+        """
+        if not isinstance(self.bm25, SparseBM25) or len(self.bm25) != self.faiss_store.index.ntotal:
+            return None
+        key = self._bm25_validation_key()
+        path = self._bm25_artifact_path(directory)
+        try:
+            if key == self._bm25_saved_key and self._bm25_saved_path and os.path.exists(self._bm25_saved_path):
+                if self._bm25_saved_path != path:
+                    self._link_file(self._bm25_saved_path, path)
+            else:
+                self.bm25.save(path, key)
+                logger.info(f"已保存 BM25 索引到: {path}")
+            self._bm25_saved_key = key
+            self._bm25_saved_path = path
+            return key
+        except Exception as e:
+            logger.error(f"保存 BM25 索引时出错: {str(e)}")
+            return None
+
+    def _load_bm25_artifact(self):
+        """
+        若磁盘上的 BM25 文件与当前文档存储一致则直接加载，避免解码文档和重新分词。
+        快照先核对 snapshot.json 中记录的校验键，再核对 BM25 文件中保存的校验键。
+        """
+        if self.bm25_backend != 'sparse':
+            return False
+        key = self._bm25_validation_key()
+        if self.snapshot_version is not None and self._manifest_bm25_key != key:
+            return False
+        try:
+            bm25 = SparseBM25.load(self._bm25_artifact_path(), key)
+        except Exception as e:
+            logger.warning(f"读取 BM25 索引文件失败, 将重新构建: {str(e)}")
+            return False
+        if bm25 is None or len(bm25) != self.faiss_store.index.ntotal:
+            return False
+        self.bm25 = bm25
+        self._bm25_saved_key = key
+        self._bm25_saved_path = self._bm25_artifact_path()
+        return True
+
+    @staticmethod
+    def _link_file(source, target):
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
     def _initialize_bm25_from_faiss(self):
         """从FAISS加载的文档初始化BM25索引"""
         print("--- [FaissManager._initialize_bm25_from_faiss] 尝试从 FAISS 文档初始化 BM25 ---")
@@ -381,17 +826,25 @@ class FaissManager:
             print("--- [FaissManager._initialize_bm25_from_faiss] 警告：FAISS store 未加载，无法初始化 BM25 ---")
             return
             
-        docs = self._get_all_docs_from_faiss()
+        if self.faiss_store.index.ntotal and self._load_bm25_artifact():
+            print(f"--- [FaissManager._initialize_bm25_from_faiss] 从 {self._bm25_artifact_path()} 加载了 BM25 索引, 跳过重新分词 ---")
+            return
+
+        # 按行号顺序读取, BM25 中的位置即 FAISS 行号
+        docs = list(self.iter_documents())
         if not docs:
             print("--- [FaissManager._initialize_bm25_from_faiss] 警告：在 FAISS store 中未找到文档，无法初始化 BM25 ---")
             return
             
         print(f"--- [FaissManager._initialize_bm25_from_faiss] 从 FAISS 获取了 {len(docs)} 个文档 ---")
-        # 提取文本内容
-        texts = [doc.page_content for doc in docs if doc.page_content]
-        if texts:
+        # 提取文本内容 (空文本也保留, 使 BM25 中的位置与 FAISS 行号一致)
+        texts = [doc.page_content if doc is not None else "" for doc in docs]
+        if any(texts):
             self.initialize_bm25(texts)
             logger.info(f"Initialized BM25 with {len(texts)} documents from FAISS")
+            if self.snapshot_version is None:
+                # 已发布的快照不在加载时修改 (多个进程可能同时加载)，由下一次 save_index 写入新快照
+                self._save_bm25_artifact()
 
     def set_platform(self, platform):
         """
@@ -417,6 +870,11 @@ class FaissManager:
             # 清除当前索引，准备加载新索引
             self.faiss_store = None
             self.bm25 = None
+            self._bm25_saved_key = None
+            self._bm25_saved_path = None
+            self.snapshot_version = None
+            self._snapshot_state = None
+            self._snapshot_dir = None
 
             # 主动加载新平台的索引，并检查加载结果
             load_result = self.load_index()
@@ -432,9 +890,8 @@ class FaissManager:
         if not self.faiss_store:
             return 0
         try:
-            # 获取FAISS索引中的文档数量
-            docs = self._get_all_docs_from_faiss()
-            return len(docs)
+            # 向量数即文档数, O(1)
+            return self.faiss_store.index.ntotal
         except Exception as e:
             logger.error(f"获取索引大小时出错: {str(e)}")
             return 0
@@ -1,10 +1,13 @@
 import numpy as np
-import math
+from .bm25_engine import SparseBM25
 # import logging # You can comment out logging imports if not used
 # logger = logging.getLogger(__name__)
 
 class HybridRetriever:
-    def __init__(self, faiss_manager, embedding_model, bm25_weight=0.3, embedding_weight=0.4, vote_weight=0.3, l2_decay_beta=1.0):
+    PARENT_AGGREGATIONS = ('max', 'sum')
+
+    def __init__(self, faiss_manager, embedding_model, bm25_weight=0.3, embedding_weight=0.4, vote_weight=0.3, l2_decay_beta=1.0,
+                 parent_aggregation=None, max_passages_per_parent=3):
         """
         [DEMO SECTION 6] Initialize Hybrid Retriever with configurable weights
         
@@ -12,14 +15,20 @@ class HybridRetriever:
         - Combines semantic similarity (FAISS) and keyword relevance (BM25)
         - Uses weighted fusion of multiple scoring mechanisms
         - Applies relevance threshold filtering for quality control
+        - Optionally aggregates passage scores per parent thread ('max' or 'sum'); the default None
+          keeps one result per indexed document, exactly as before chunking
         """
+        if parent_aggregation is not None and parent_aggregation not in self.PARENT_AGGREGATIONS:
+            raise ValueError(f"Unsupported parent_aggregation: {parent_aggregation}")
         self.bm25_weight = bm25_weight
         self.embedding_weight = embedding_weight
         self.vote_weight = vote_weight
         self.faiss_manager = faiss_manager
         self.embedding_model = embedding_model
         self.l2_decay_beta = l2_decay_beta
-        print(f"--- [HybridRetriever.__init__] Initialization completed: Weights(BM25={bm25_weight}, Emb={embedding_weight}, Vote={vote_weight}), L2 Decay Beta={l2_decay_beta} ---")
+        self.parent_aggregation = parent_aggregation
+        self.max_passages_per_parent = max_passages_per_parent
+        print(f"--- [HybridRetriever.__init__] Initialization completed: Weights(BM25={bm25_weight}, Emb={embedding_weight}, Vote={vote_weight}), L2 Decay Beta={l2_decay_beta}, Parent aggregation={parent_aggregation} ---")
 
     def retrieve(self, query, top_k=80, relevance_threshold=0.6):
         """
@@ -27,139 +36,29 @@ class HybridRetriever:
         
         This method implements the hybrid ranking process mentioned in the demo:
         Step 1: Dual Search - FAISS handles semantic similarity while BM25 provides keyword relevance
-        Step 2: Score Fusion - Merges results using document IDs as keys
+        Step 2: Score Fusion - Merges results using FAISS row ids (shared by BM25 and FAISS) as keys
         Step 3: Normalization - Standardizes different scoring mechanisms
         Step 4: Ranking - Applies weighted fusion and threshold filtering
         """
         print(f"\n--- [HybridRetriever.retrieve] Start processing query: '{query}' (Top {top_k}, Threshold {relevance_threshold}) ---")
 
         # [DEMO SECTION 1] Step 1: Dual Search - Retrieve original results
+        # Both engines return FAISS row ids, the canonical integer id shared by BM25 and FAISS
         # Slightly increase BM25 retrieval count to capture more potentially relevant IDs
-        bm25_docs = self.faiss_manager.search_bm25(query, 200)
-        embedding_docs = self.faiss_manager.search(query, 200) # Embedding search (returns L2 distance)
-
-        print(f"--- [HybridRetriever.retrieve] Original BM25 result count: {len(bm25_docs)}, Original Embedding result count: {len(embedding_docs)} ---")
-
-        # [DEMO SECTION 2] Step 2: Score Fusion - Merge and fill scores
-        all_docs = {} # Use doc_id as the key
-
-        # Process BM25 documents
-        print("--- [HybridRetriever.retrieve] Processing BM25 documents and their raw scores: ---")
-        for doc, score in bm25_docs:
-            doc_id = doc.metadata.get('doc_id') or doc.metadata.get('id')
-            if not doc_id: continue # Skip if there's no valid ID
-
-            if doc_id not in all_docs:
-                all_docs[doc_id] = {
-                    'doc': doc,
-                    'bm25_score': float(score) if isinstance(score, np.number) else score,
-                    'embedding_score': float('inf'), # Initialize L2 distance to inf for BM25-only docs
-                    'vote_score': self.get_doc_vote_score(doc),
-                    'metadata': doc.metadata
-                }
-            else:
-                # Doc already exists (e.g., from a previous source, though unlikely here), update BM25 score
-                all_docs[doc_id]['bm25_score'] = float(score) if isinstance(score, np.number) else score
-
-        # Process Embedding documents (L2 distances)
-        print("--- [HybridRetriever.retrieve] Processing Embedding documents and their raw L2 scores: ---")
-        raw_embedding_scores_read = [] # For debugging: track actually read scores
-        for doc, l2_distance in embedding_docs:
-            doc_id = doc.metadata.get('doc_id') or doc.metadata.get('id')
-            if not doc_id: continue
-
-            valid_l2 = None
-            # 1. Ensure l2_distance is a valid, non-negative float
-            if isinstance(l2_distance, (int, float, np.number)) and not math.isinf(l2_distance) and not math.isnan(l2_distance) and l2_distance >= 0:
-                valid_l2 = float(l2_distance)
-                raw_embedding_scores_read.append(valid_l2)
-
-            if doc_id in all_docs:
-                # 2. If previously found by BM25, update L2 score
-                if valid_l2 is not None:
-                    all_docs[doc_id]['embedding_score'] = valid_l2
-            else:
-                # 3. Document found only by Embedding
-                all_docs[doc_id] = {
-                    'doc': doc,
-                    'bm25_score': 0.0,
-                    'embedding_score': valid_l2 if valid_l2 is not None else float('inf'),
-                    'vote_score': self.get_doc_vote_score(doc),
-                    'metadata': doc.metadata
-                }
-
-        print(f"--- [HybridRetriever.retrieve] Total documents after merge: {len(all_docs)} ---")
-
-        if not all_docs: return []
-
-        # [DEMO SECTION 3] Step 3: Normalization - Extract score lists for normalization
-        doc_ids_list = list(all_docs.keys()) # Maintain consistent order
-        bm25_scores = [all_docs[doc_id]['bm25_score'] for doc_id in doc_ids_list]
-        embedding_l2_distances = [all_docs[doc_id]['embedding_score'] for doc_id in doc_ids_list]
-        vote_scores = [all_docs[doc_id]['vote_score'] for doc_id in doc_ids_list]
-
-        print(f"--- [HybridRetriever.retrieve] Extracted L2 distance list for normalization (Top 10, inf means invalid): {embedding_l2_distances[:10]} ---")
-
-        # Normalize all scores
-        print("--- [HybridRetriever.retrieve] Start normalizing all scores ---")
-        bm25_normalized = self.normalize(bm25_scores)
-        embedding_normalized = self.normalize_l2_exponential_decay(embedding_l2_distances, self.l2_decay_beta)
-        vote_normalized = self.normalize(vote_scores)
-
-        print(f"  Normalized BM25 scores (Top 10): {bm25_normalized[:10]}")
-        print(f"  Normalized Embedding scores (Exp Decay L2^2, beta={self.l2_decay_beta}) (Top 10): {embedding_normalized[:10]}")
-        print(f"  Normalized Vote scores (Top 10): {vote_normalized[:10]}")
-
-        # [DEMO SECTION 4] Step 4: Ranking - Combine scores and filter
-        final_docs_data = []
-        print("--- [HybridRetriever.retrieve] Compute final hybrid scores and apply threshold filter ---")
-        passed_threshold_count = 0
-
-        for i, doc_id in enumerate(doc_ids_list):
-            if i >= len(embedding_normalized) or i >= len(bm25_normalized) or i >= len(vote_normalized):
-                print(f"!!! [HybridRetriever.retrieve] Warning: index {i} exceeds score list boundaries, skipping doc ID {doc_id}")
-                continue
-
-            norm_emb = embedding_normalized[i]
-            norm_bm25 = bm25_normalized[i]
-            norm_vote = vote_normalized[i]
-
-            # Calculate weighted fusion score
-            combined_score = (
-                norm_emb * self.embedding_weight +
-                norm_bm25 * self.bm25_weight +
-                norm_vote * self.vote_weight
-            )
-
-            if combined_score >= relevance_threshold:
-                passed_threshold_count += 1
-                doc_entry = all_docs[doc_id]
-                doc_object = doc_entry['doc']
-
-                # Update metadata with current normalized scores
-                doc_object.metadata['relevance_score'] = combined_score
-                doc_object.metadata['normalized_embedding_score'] = norm_emb
-                doc_object.metadata['normalized_bm25_score'] = norm_bm25
-                doc_object.metadata['normalized_vote_score'] = norm_vote
-                doc_object.metadata['raw_l2_distance'] = doc_entry['embedding_score']
-                doc_object.metadata['bm25_score'] = doc_entry['bm25_score']
-
-                final_docs_data.append((doc_id, combined_score, doc_object))
+        bm25_rows, bm25_raw_scores = self.faiss_manager.search_bm25_rows(query, 200)
+        embedding_rows, embedding_raw_l2 = self.faiss_manager.search_rows(query, 200) # Embedding search (returns L2 distance)
 
-        print(f"--- [HybridRetriever.retrieve] {passed_threshold_count} documents remained after threshold filtering ---")
+        print(f"--- [HybridRetriever.retrieve] Original BM25 result count: {len(bm25_rows)}, Original Embedding result count: {len(embedding_rows)} ---")
 
-        if not final_docs_data: return []
-
-        # Sort and return Top K
-        final_docs_data.sort(key=lambda x: x[1], reverse=True)
-
-        top_docs = [doc_object for _, _, doc_object in final_docs_data[:top_k]]
+        top_docs = self._rank_candidates(
+            bm25_rows, bm25_raw_scores, embedding_rows, embedding_raw_l2, top_k, relevance_threshold
+        )
 
         # Final check before returning
         if top_docs:
             print("--- [HybridRetriever.retrieve] Final metadata check for top returned documents (Top 5): ---")
             for rank, doc in enumerate(top_docs[:5], 1):
-                print(f"  Rank {rank} (ID: {doc.metadata.get('doc_id') or doc.metadata.get('id')}): Metadata snippet = {{ "
+                print(f"  Rank {rank} (Row ID: {doc.metadata.get('row_id')}): Metadata snippet = {{ "
                       f"'relevance_score': {doc.metadata.get('relevance_score'):.4f}, "
                       f"'normalized_embedding_score': {doc.metadata.get('normalized_embedding_score'):.4f}, "
                       f"'normalized_bm25_score': {doc.metadata.get('normalized_bm25_score'):.4f}, "
@@ -172,29 +71,220 @@ class HybridRetriever:
         print(f"--- [HybridRetriever.retrieve] Retrieval complete. Returning {len(top_docs)} documents ---")
         return top_docs
 
+    def retrieve_batch(self, queries, top_k=80, relevance_threshold=0.6):
+        """
+        [DEMO SECTION] Batched retrieval for offline evaluation and bulk re-ranking
+
+        Same ranking as retrieve, but all queries are embedded in one forward pass and
+        searched with a single index.search over the query matrix; BM25 statistics and
+        term weights are shared by the whole batch. Returns one document list per query.
+        """
+        queries = list(queries)
+        print(f"\n--- [HybridRetriever.retrieve_batch] Start processing {len(queries)} queries (Top {top_k}, Threshold {relevance_threshold}) ---")
+        if not queries:
+            return []
+
+        # [DEMO SECTION 1] Step 1: Dual Search for the whole batch
+        bm25_hits = self.faiss_manager.search_bm25_rows_batch(queries, 200)
+        embedding_hits = self.faiss_manager.search_rows_batch(queries, 200)
+
+        # [DEMO SECTION 2-4] Fusion and ranking per query
+        results = [
+            self._rank_candidates(bm25_rows, bm25_scores, embedding_rows, embedding_l2, top_k, relevance_threshold, verbose=False)
+            for (bm25_rows, bm25_scores), (embedding_rows, embedding_l2) in zip(bm25_hits, embedding_hits)
+        ]
+        print(f"--- [HybridRetriever.retrieve_batch] Retrieval complete. Returning {sum(len(docs) for docs in results)} documents for {len(queries)} queries ---")
+        return results
+
+    def _rank_candidates(self, bm25_rows, bm25_raw_scores, embedding_rows, embedding_raw_l2, top_k, relevance_threshold, verbose=True):
+        """
+        [DEMO SECTION 2-4] Fuse, normalize and rank the candidates of one query
+
+        Shared by retrieve and retrieve_batch; returns the top documents with score metadata.
+        verbose=False silences the per-query debug output (used for batches).
+        """
+        log = print if verbose else (lambda *args, **kwargs: None)
+        # [DEMO SECTION 2] Step 2: Score Fusion - Scatter both result lists onto the candidate row ids
+        doc_rows, bm25_scores, embedding_l2_distances = self.fuse_rows(
+            bm25_rows, bm25_raw_scores, embedding_rows, embedding_raw_l2
+        )
+
+        log(f"--- [HybridRetriever.retrieve] Total documents after merge: {len(doc_rows)} ---")
+
+        if not len(doc_rows): return []
+
+        # Vote scores come from metadata, so only the candidate rows are read from the docstore
+        docs = [self.faiss_manager.get_document(row) for row in doc_rows.tolist()]
+        vote_scores = self.get_candidate_vote_scores(docs)
+        has_doc = np.fromiter((doc is not None for doc in docs), dtype=bool, count=len(docs))
+
+        log(f"--- [HybridRetriever.retrieve] Extracted L2 distance list for normalization (Top 10, inf means invalid): {embedding_l2_distances[:10]} ---")
+
+        # [DEMO SECTION 3] Step 3: Normalization - array operations over the candidate score vectors
+        log("--- [HybridRetriever.retrieve] Start normalizing all scores ---")
+        combined, bm25_normalized, embedding_normalized, vote_normalized = self.fuse_scores(
+            bm25_scores, embedding_l2_distances, vote_scores
+        )
+
+        log(f"  Normalized BM25 scores (Top 10): {bm25_normalized[:10]}")
+        log(f"  Normalized Embedding scores (Exp Decay L2^2, beta={self.l2_decay_beta}) (Top 10): {embedding_normalized[:10]}")
+        log(f"  Normalized Vote scores (Top 10): {vote_normalized[:10]}")
+
+        # [DEMO SECTION 4] Step 4: Ranking - Threshold filter and top-k selection
+        log("--- [HybridRetriever.retrieve] Compute final hybrid scores and apply threshold filter ---")
+        if self.parent_aggregation is None:
+            top_slots, passed_threshold_count = self.select_top_k(combined, top_k, relevance_threshold, eligible=has_doc)
+            top_groups = [(slots, combined[slots[0]]) for slots in top_slots.reshape(-1, 1)]
+        else:
+            # Passages of the same thread share a parent_id; the thread is ranked by its aggregated passage
+            # scores and the threshold applies to that parent score (so 'sum' can lift several weaker passages)
+            candidates = np.flatnonzero(has_doc)
+            parent_keys = [self.get_parent_key(docs[i], row) for i, row in zip(candidates.tolist(), doc_rows[candidates].tolist())]
+            top_groups, passed_threshold_count = self.select_top_parents(
+                combined, candidates, parent_keys, top_k, self.parent_aggregation, relevance_threshold
+            )
+
+        log(f"--- [HybridRetriever.retrieve] {passed_threshold_count} documents remained after threshold filtering ---")
+
+        if not len(top_groups): return []
+
+        # Only the returned documents get their metadata updated with the scores
+        top_docs = []
+        for slots, parent_score in top_groups:
+            # The best passage provides the scores; the parent's most relevant passages (in text order) form the content
+            slots = slots[:self.max_passages_per_parent]
+            i = int(slots[0])
+            doc_object = docs[i]
+            if len(slots) > 1:
+                passages = sorted(slots.tolist(), key=lambda slot: docs[slot].metadata.get('chunk_index', 0))
+                doc_object.page_content = "\n...\n".join(docs[slot].page_content for slot in passages)
+                doc_object.metadata['passage_rows'] = [int(doc_rows[slot]) for slot in passages]
+            doc_object.metadata['source'] = self.faiss_manager.platform
+            doc_object.metadata['relevance_score'] = float(parent_score)
+            doc_object.metadata['normalized_embedding_score'] = float(embedding_normalized[i])
+            doc_object.metadata['normalized_bm25_score'] = float(bm25_normalized[i])
+            doc_object.metadata['normalized_vote_score'] = float(vote_normalized[i])
+            doc_object.metadata['raw_l2_distance'] = float(embedding_l2_distances[i])
+            doc_object.metadata['bm25_score'] = float(bm25_scores[i])
+            top_docs.append(doc_object)
+        return top_docs
+
+    @staticmethod
+    def get_parent_key(doc, row):
+        """Passages written by the chunking indexer carry a parent_id; older documents are their own parent"""
+        parent_id = doc.metadata.get('parent_id')
+        return f"parent:{parent_id}" if parent_id is not None else f"row:{row}"
+
+    @staticmethod
+    def select_top_parents(combined, candidates, parent_keys, top_k, aggregation='max', relevance_threshold=None):
+        """
+        [DEMO SECTION 4] Aggregate passage scores per parent ('max' or 'sum'), threshold the parent
+        scores and select the top-k parents
+
+        candidates holds the candidate indexes to aggregate, parent_keys their parent keys.
+        Returns (list of (candidate indexes of the parent sorted by score descending, parent score),
+        number of parents above the threshold); ties keep first-seen order, so documents without
+        passages rank exactly like select_top_k.
+        """
+        if not len(candidates):
+            return [], 0
+        _, first_seen, inverse = np.unique(np.asarray(parent_keys), return_index=True, return_inverse=True)
+        order = np.argsort(first_seen, kind='stable')
+        group_of_unique = np.empty_like(order)
+        group_of_unique[order] = np.arange(len(order))
+        groups = group_of_unique[inverse.reshape(-1)]
+
+        scores = combined[candidates]
+        if aggregation == 'sum':
+            parent_scores = np.zeros(len(order))
+            np.add.at(parent_scores, groups, scores)
+        else:
+            parent_scores = np.full(len(order), -np.inf)
+            np.maximum.at(parent_scores, groups, scores)
+
+        passed = np.arange(len(order))
+        if relevance_threshold is not None:
+            passed = np.flatnonzero(parent_scores >= relevance_threshold)
+        top_groups = []
+        for group in passed[SparseBM25.top_n_from_scores(parent_scores[passed], top_k)].tolist():
+            members = np.flatnonzero(groups == group)
+            members = members[np.argsort(-scores[members], kind='stable')]
+            top_groups.append((candidates[members], parent_scores[group]))
+        return top_groups, len(passed)
+
+    @staticmethod
+    def fuse_rows(bm25_rows, bm25_scores, embedding_rows, embedding_l2):
+        """
+        [DEMO SECTION 2] Merge BM25 and FAISS hits keyed by FAISS row id
+
+        Candidates keep first-seen order (BM25 hits first, then embedding-only hits).
+        Returns (rows, bm25_scores, l2_distances); BM25 misses score 0.0 and
+        embedding misses (or invalid distances) get an L2 distance of inf.
+        """
+        bm25_rows = np.asarray(bm25_rows, dtype=np.int64)
+        embedding_rows = np.asarray(embedding_rows, dtype=np.int64)
+        all_rows = np.concatenate([bm25_rows, embedding_rows])
+        unique_rows, first_seen, inverse = np.unique(all_rows, return_index=True, return_inverse=True)
+        order = np.argsort(first_seen, kind='stable')
+        slot_of_unique = np.empty_like(order)
+        slot_of_unique[order] = np.arange(len(order))
+        slots = slot_of_unique[inverse]
+
+        fused_bm25 = np.zeros(len(order), dtype=np.float64)
+        np.add.at(fused_bm25, slots[:len(bm25_rows)], np.asarray(bm25_scores, dtype=np.float64))
+
+        embedding_l2 = np.asarray(embedding_l2, dtype=np.float64)
+        valid = np.isfinite(embedding_l2) & (embedding_l2 >= 0)
+        fused_l2 = np.full(len(order), np.inf)
+        fused_l2[slots[len(bm25_rows):][valid]] = embedding_l2[valid]
+        return unique_rows[order], fused_bm25, fused_l2
+
+    def fuse_scores(self, bm25_scores, embedding_l2_distances, vote_scores):
+        """
+        [DEMO SECTION 3] Normalize the three candidate score vectors and combine them
+
+        Returns (combined, bm25_normalized, embedding_normalized, vote_normalized) as numpy arrays.
+        """
+        bm25_normalized = self.normalize(bm25_scores)
+        embedding_normalized = self.normalize_l2_exponential_decay(embedding_l2_distances, self.l2_decay_beta)
+        vote_normalized = self.normalize(vote_scores)
+        combined = self.combine_scores(bm25_normalized, embedding_normalized, vote_normalized)
+        return combined, bm25_normalized, embedding_normalized, vote_normalized
+
+    @staticmethod
+    def select_top_k(combined, top_k, relevance_threshold, eligible=None):
+        """
+        [DEMO SECTION 4] Threshold filter plus top-k selection via argpartition
+
+        Ties keep candidate order, matching a stable descending sort.
+        Returns (selected candidate indexes, number of candidates above the threshold).
+        """
+        passed = combined >= relevance_threshold
+        if eligible is not None:
+            passed &= eligible
+        passed = np.flatnonzero(passed)
+        return passed[SparseBM25.top_n_from_scores(combined[passed], top_k)], len(passed)
+
     def normalize(self, scores):
         """
         [DEMO SECTION 3] Normalize scores to [0, 1] range
         
         This method standardizes different scoring mechanisms to ensure fair comparison
-        between BM25, embedding, and vote scores.
+        between BM25, embedding, and vote scores. inf / None (nan) entries are treated as
+        missing and map to 0.0. Returns a numpy array.
         """
-        if not scores:
-            return []
-        valid_scores = [s for s in scores if s != float('inf') and s is not None]
-        if not valid_scores:
-            return [0.0] * len(scores)
-        min_score = min(valid_scores)
-        max_score = max(valid_scores)
+        scores = np.asarray(scores, dtype=np.float64)
+        if scores.size == 0:
+            return scores
+        valid = ~(np.isposinf(scores) | np.isnan(scores))
+        if not valid.any():
+            return np.zeros(len(scores))
+        min_score = scores[valid].min()
+        max_score = scores[valid].max()
         if max_score - min_score < 1e-9:
-            return [0.5 if max_score != 0 else 0.0] * len(scores)
-        normalized_scores = []
-        for score in scores:
-            if score == float('inf') or score is None:
-                normalized_scores.append(0.0)
-            else:
-                clamped_score = max(min_score, min(score, max_score))
-                normalized_scores.append((clamped_score - min_score) / (max_score - min_score))
+            return np.full(len(scores), 0.5 if max_score != 0 else 0.0)
+        normalized_scores = (np.clip(scores, min_score, max_score) - min_score) / (max_score - min_score)
+        normalized_scores[~valid] = 0.0
         return normalized_scores
 
     def normalize_l2_exponential_decay(self, l2_distances, beta):
@@ -204,41 +294,15 @@ class HybridRetriever:
         This method converts L2 distances from FAISS into similarity scores (0,1] range.
         Score = exp(-beta * L2_distance^2)
         
-        This is part of the normalization process that standardizes different scoring mechanisms.
+        Invalid distances (inf, nan, negative) and exponents above 709 (exp overflow) score 0.0.
+        Returns a numpy array.
         """
-        normalized_scores = []
-
-        for l2 in l2_distances:
-            score = 0.0
-            try:
-                # 1. Strictly validate input
-                if isinstance(l2, (int, float, np.number)) and not math.isinf(l2) and not math.isnan(l2) and l2 >= 0:
-                    # 2. Explicitly convert to float
-                    l2_float = float(l2)
-                    l2_squared = l2_float**2
-                    exponent_arg = -beta * l2_squared
-
-                    # 3. Prevent overflow on exp() function
-                    if exponent_arg > 709:
-                        print(f"    [ExpDecay] Warning: exponent {exponent_arg:.2f} too large (L2={l2_float}, beta={beta}), set score to 0.0")
-                        score = 0.0
-                    else:
-                        calculated_score = math.exp(exponent_arg)
-                        score = max(0.0, min(calculated_score, 1.0))
-                else:
-                    score = 0.0
-            except ValueError as ve:
-                print(f"!!! [ExpDecay] ValueError during score calculation (original L2={l2}): {ve}, set score to 0.0")
-                score = 0.0
-            except OverflowError as oe:
-                print(f"!!! [ExpDecay] OverflowError during score calculation (original L2={l2}): {oe}, set score to 0.0")
-                score = 0.0
-            except Exception as e:
-                print(f"!!! [ExpDecay] Unexpected error during score calculation (original L2={l2}): {e}, set score to 0.0")
-                score = 0.0
-
-            normalized_scores.append(score)
-
+        l2 = np.asarray(l2_distances, dtype=np.float64)
+        valid = np.isfinite(l2) & (l2 >= 0)
+        exponent_arg = -beta * np.square(np.where(valid, l2, 0.0))
+        valid &= exponent_arg <= 709
+        normalized_scores = np.zeros(len(l2))
+        normalized_scores[valid] = np.clip(np.exp(exponent_arg[valid]), 0.0, 1.0)
         return normalized_scores
 
     def combine_scores(self, bm25_results, embedding_results, vote_scores):
@@ -248,13 +312,31 @@ class HybridRetriever:
         This method implements the weighted fusion algorithm mentioned in the demo:
         combined_score = norm_emb * embedding_weight + norm_bm25 * bm25_weight + norm_vote * vote_weight
         """
-        final_scores = []
-        for bm25_score, embedding_score, vote_score in zip(bm25_results, embedding_results, vote_scores):
-            combined_score = (self.bm25_weight * bm25_score +
-                              self.embedding_weight * embedding_score +
-                              self.vote_weight * vote_score)
-            final_scores.append(combined_score)
-        return final_scores
+        return (np.asarray(embedding_results, dtype=np.float64) * self.embedding_weight +
+                np.asarray(bm25_results, dtype=np.float64) * self.bm25_weight +
+                np.asarray(vote_scores, dtype=np.float64) * self.vote_weight)
+
+    @staticmethod
+    def get_candidate_vote_scores(docs):
+        """
+        [DEMO SECTION 2] Vote scores (max of upvotes / likes / vote_score) for a candidate list
+
+        Missing documents or documents without any vote field score 0; returns a numpy array.
+        """
+        votes = np.zeros(len(docs))
+        missing = 0
+        for i, doc in enumerate(docs):
+            if doc is None:
+                continue
+            metadata = doc.metadata
+            upvotes, likes, vote_score = metadata.get('upvotes'), metadata.get('likes'), metadata.get('vote_score')
+            if upvotes is None and likes is None and vote_score is None:
+                missing += 1
+                continue
+            votes[i] = max(upvotes or 0, likes or 0, vote_score or 0)
+        if missing:
+            print(f"!!! [HybridRetriever.get_candidate_vote_scores] No vote data found for {missing}/{len(docs)} candidates")
+        return votes
 
     def get_vote_scores(self, documents):
         """
@@ -0,0 +1,149 @@
+# FAISS 索引工厂: 精确检索 (flat) 与近似最近邻检索 (IVF-Flat / IVF-PQ / HNSW / 标量量化)
+
+import json
+import logging
+import math
+import os
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_PARAMS_FILE = "index_params.json"
+
+# 每种索引类型的默认参数; nlist 为 None 时根据向量数自动选择
+DEFAULT_INDEX_PARAMS = {
+    'flat': {},
+    'ivf_flat': {'nlist': None, 'nprobe': 16},
+    'ivf_pq': {'nlist': None, 'nprobe': 16, 'm': 64, 'nbits': 8},
+    'hnsw': {'m': 32, 'ef_construction': 200, 'ef_search': 128},
+    'sq8': {},
+}
+INDEX_TYPES = tuple(DEFAULT_INDEX_PARAMS)
+
+# faiss 建议每个聚类中心至少有 39 个训练样本
+MIN_POINTS_PER_CENTROID = 39
+
+# 添加向量前需要训练的索引类型; 向量数少于 MIN_TRAINING_VECTORS 时直接使用 flat 即可
+TRAINED_INDEX_TYPES = ('ivf_flat', 'ivf_pq', 'sq8')
+MIN_TRAINING_VECTORS = 10000
+
+
+def resolve_params(index_type, params=None, num_vectors=None):
+    """合并默认参数与自定义参数，并在需要时根据向量数确定 nlist"""
+    if index_type not in DEFAULT_INDEX_PARAMS:
+        raise ValueError(f"Unsupported index type: {index_type}, expected one of {INDEX_TYPES}")
+    resolved = dict(DEFAULT_INDEX_PARAMS[index_type])
+    resolved.update(params or {})
+    if 'nlist' in resolved and not resolved['nlist']:
+        if not num_vectors:
+            raise ValueError(f"{index_type} requires nlist or a known number of training vectors")
+        nlist = int(4 * math.sqrt(num_vectors))
+        resolved['nlist'] = max(1, min(nlist, num_vectors // MIN_POINTS_PER_CENTROID))
+    return resolved
+
+
+def build_index(index_type, dimension, params):
+    """根据类型创建一个空索引 (IVF / PQ / SQ 类型在添加向量前需要先训练)"""
+    if index_type == 'flat':
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == 'ivf_flat':
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, params['nlist'], faiss.METRIC_L2)
+        index.own_fields = True
+        quantizer.this.disown()
+    elif index_type == 'ivf_pq':
+        if dimension % params['m'] != 0:
+            raise ValueError(f"ivf_pq: dimension {dimension} is not divisible by m={params['m']}")
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, params['nlist'], params['m'], params['nbits'])
+        index.own_fields = True
+        quantizer.this.disown()
+    elif index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, params['m'])
+        index.hnsw.efConstruction = params['ef_construction']
+    elif index_type == 'sq8':
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    else:
+        raise ValueError(f"Unsupported index type: {index_type}, expected one of {INDEX_TYPES}")
+    apply_search_params(index, index_type, params)
+    return index
+
+
+def apply_search_params(index, index_type, params):
+    """设置查询期参数 (IVF 的 nprobe / HNSW 的 efSearch)"""
+    if index_type in ('ivf_flat', 'ivf_pq') and 'nprobe' in params:
+        faiss.extract_index_ivf(index).nprobe = params['nprobe']
+    elif index_type == 'hnsw' and 'ef_search' in params:
+        index.hnsw.efSearch = params['ef_search']
+
+
+def detect_index_type(index):
+    """根据 faiss 索引对象推断类型 (用于没有 index_params.json 的旧索引)"""
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVFFlat):
+        return 'ivf_flat'
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return 'sq8'
+    return 'flat'
+
+
+def reconstruct_all(index, batch_size=65536):
+    """取出索引中的全部向量 (flat 为原始向量, 量化索引为近似重建)"""
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    vectors = np.empty((index.ntotal, index.d), dtype=np.float32)
+    for start in range(0, index.ntotal, batch_size):
+        count = min(batch_size, index.ntotal - start)
+        vectors[start:start + count] = index.reconstruct_n(start, count)
+    return vectors
+
+
+def train_index(index, vectors, sample_size=100000, seed=42):
+    """在已有向量的随机样本上训练索引"""
+    if index.is_trained:
+        return
+    if len(vectors) > sample_size:
+        rows = np.random.default_rng(seed).choice(len(vectors), size=sample_size, replace=False)
+        sample = vectors[np.sort(rows)]
+    else:
+        sample = vectors
+    logger.info(f"Training {type(index).__name__} on {len(sample)} vectors...")
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+
+
+def build_trained_index(index_type, vectors, params=None, sample_size=100000, batch_size=65536):
+    """
+    用已有向量构建新类型的索引: 解析参数 -> 训练 -> 分批添加。
+    行号顺序与输入向量保持一致, 因此 index_to_docstore_id 无需改动。
+    返回 (index, resolved_params)。
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    resolved = resolve_params(index_type, params, num_vectors=len(vectors))
+    index = build_index(index_type, vectors.shape[1], resolved)
+    train_index(index, vectors, sample_size=sample_size)
+    for start in range(0, len(vectors), batch_size):
+        index.add(vectors[start:start + batch_size])
+    return index, resolved
+
+
+def save_index_params(index_dir, index_type, params):
+    path = os.path.join(index_dir, INDEX_PARAMS_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({'index_type': index_type, 'params': params}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_index_params(index_dir):
+    """读取 index_params.json，不存在时返回 (None, {})"""
+    path = os.path.join(index_dir, INDEX_PARAMS_FILE)
+    if not os.path.exists(path):
+        return None, {}
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get('index_type'), data.get('params', {})
@@ -2,8 +2,12 @@
 
 import logging
 from typing import List
+from django.db import transaction
 from django_apps.search.models import RedditContent, StackOverflowContent, RednoteContent, ContentIndex
 from .faiss_manager import FaissManager
+from .embedding_cache import get_embedding_cache
+from .embedding_batcher import TokenBudgetBatcher, get_tokenizer, sequential_embed_batches
+from .chunker import TextChunker
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -15,10 +19,20 @@ class Indexer:
         'rednote': RednoteContent
     }
 
-    def __init__(self, embedding_model, faiss_manager: FaissManager, batch_size=128):
+    def __init__(self, embedding_model, faiss_manager: FaissManager, batch_size=128, embedding_pool=None, chunker=None):
+        """
+        :param embedding_pool: 可选的 EmbeddingWorkerPool，指定后文档 embedding 交给多进程 worker 计算
+        :param chunker: 长文档切分器 (默认 TextChunker)，每个段落作为单独的 FAISS / BM25 文档写入
+        """
         self.embedding_model = embedding_model
         self.faiss_manager = faiss_manager
         self.batch_size = batch_size
+        self.embedding_pool = embedding_pool
+        self.chunker = chunker or TextChunker()
+        # 按 token 长度分桶组批, 避免短评论和长回答混在一批里被 padding 到同样长度
+        self.batcher = TokenBudgetBatcher(tokenizer=get_tokenizer(embedding_model))
+        # 按内容哈希缓存 embedding, 重复抓取 / 重建索引时相同内容不再重新推理
+        self.embedding_cache = get_embedding_cache(embedding_model)
 
     def index_platform_content(self, platform: str, unindexed_queryset=None):
         if platform not in self.PLATFORM_MODEL_MAP:
@@ -27,80 +41,168 @@ class Indexer:
         logger.info(f"Indexing {platform} content into FAISS + DB metadata...")
         model_class = self.PLATFORM_MODEL_MAP[platform]
 
-        # 如果没有未被indexed数据，return即可
-        if not unindexed_queryset:
-            return 
+        # 如果没有未被indexed数据，return即可 (QuerySet 用 exists()，避免把整个 queryset 载入内存)
+        if unindexed_queryset is None or self._is_empty(unindexed_queryset):
+            return 0
         
-        # 记录处理的数量
-        indexed_count = 0
-
-        # 初始化 FAISS store 和 BM25
-        if not self.faiss_manager.faiss_store:
-            # Only get texts from unindexed queryset
-            unindexed_texts = [obj.content for obj in unindexed_queryset if obj.content]
-            if unindexed_texts:
-                logger.info(f"初始化 FAISS 索引，包含 {len(unindexed_texts)} 个文档")
-                self.faiss_manager.initialize_store(unindexed_texts)
-
-        content_objects = unindexed_queryset
-        
-        # 处理每个内容对象
-        for obj in content_objects:
-            # 跳过内容为空的对象
-            if not obj.content:
-                logger.warning(f"Skipping object with ID {obj.id} due to empty content")
-                continue
-            
-            # 生成唯一ID
-            doc_id = str(uuid.uuid4())
-            with open("doc_id.txt", "a", encoding="utf-8") as f:
-                    f.write(f"{doc_id}\n")
-            
-            # 准备元数据
-            metadata = {
-                'source': platform,
-                'thread_id': obj.thread_id,
-                'content_type': obj.content_type,
-                'author': obj.author_name,
-                'doc_id': doc_id
-            }
-            
-            
-            # 添加特定平台的元数据
-            if platform == 'reddit':
-                metadata['subreddit'] = obj.subreddit
-                metadata['upvotes'] = getattr(obj, 'upvotes', 0)
-            elif platform == 'stackoverflow':
-                metadata['tags'] = getattr(obj, 'tags', [])
-                metadata['vote_score'] = getattr(obj, 'vote_score', 0)
-            elif platform == 'rednote':
-                metadata['tags'] = getattr(obj, 'tags', [])
-                metadata['likes'] = getattr(obj, 'likes', 0)
-            
-            # 生成 embedding
-            embeddings = self.embedding_model.embed_documents([obj.content])
-            
-            # 添加到 FAISS
-            self.faiss_manager.add_texts(
-                texts=[obj.content], 
-                metadatas=[metadata],
-                embeddings=embeddings  # 提供 embeddings 参数
-            )
-            
-            # 使用_index_content处理数据库记录和内容清理
-            self._index_content(obj, platform)
+        # 按块处理: 每块一次 embedding 前向、一次写入 FAISS; 数据库记录在快照发布成功后才写入
+        indexed = []
+        for chunk in self._iter_chunks(unindexed_queryset):
+            indexed.extend(self._index_chunk(chunk, platform))
+            logger.info(f"已索引 {platform} 内容 {len(indexed)} 条")
+
+        if not indexed:
+            logger.info(f"没有新的 {platform} 内容需要索引")
+            return 0
 
-            indexed_count += 1
+        # 保存索引到磁盘，发布失败时不写数据库 (内容保留，下次增量索引会重新处理)
+        self._save_index_or_raise(platform)
+        for start in range(0, len(indexed), self.batch_size):
+            self._bulk_index_content(indexed[start:start + self.batch_size], platform)
+        logger.info(f"已完成 {platform} 内容索引 ({len(indexed)} 条) 并保存到磁盘")
+        return len(indexed)
 
-        # 保存索引到磁盘
-        if indexed_count > 0:
-            self.faiss_manager.save_index()
-            logger.info(f"已完成 {platform} 内容索引 ({indexed_count} 条) 并保存到磁盘")
+    def _save_index_or_raise(self, platform: str):
+        """发布新快照并保存 embedding 缓存; save_index() 返回 False (例如其他进程已发布更新的版本) 时抛出 RuntimeError"""
+        if not self.faiss_manager.save_index():
+            raise RuntimeError(f"保存 {platform} 索引失败，快照未发布")
+        self._save_embedding_cache()
+
+    @staticmethod
+    def _is_empty(queryset):
+        if hasattr(queryset, 'exists'):
+            return not queryset.exists()
+        return not queryset
+
+    def _iter_chunks(self, queryset):
+        """
+        每次读取 batch_size 个对象。QuerySet 按主键分页 (pk > 上一块的最后一个 pk)，
+        这样在处理过程中清空 content 字段不会影响后续分页，也不会一次性载入整个表。
+        """
+        if not hasattr(queryset, 'filter'):
+            items = list(queryset)
+            for start in range(0, len(items), self.batch_size):
+                yield items[start:start + self.batch_size]
+            return
+
+        queryset = queryset.order_by('pk')
+        last_pk = None
+        while True:
+            page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(page[:self.batch_size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
+
+    def _index_chunk(self, objects, platform: str):
+        """对一块内容对象做 embedding 并写入 FAISS (不写数据库)，返回写入的对象"""
+        # 跳过内容为空的对象
+        skipped = [obj.id for obj in objects if not obj.content]
+        if skipped:
+            logger.warning(f"Skipping objects with IDs {skipped} due to empty content")
+        objects = [obj for obj in objects if obj.content]
+        if not objects:
+            return []
+
+        # 生成唯一ID
+        doc_ids = [str(uuid.uuid4()) for _ in objects]
+        with open("doc_id.txt", "a", encoding="utf-8") as f:
+            f.write("".join(f"{doc_id}\n" for doc_id in doc_ids))
+
+        # 长内容切成有重叠的段落，每个段落带上所属帖子的 parent_id
+        texts, metadatas = [], []
+        for obj, doc_id in zip(objects, doc_ids):
+            passages = self.chunker.split(obj.content) or [obj.content]
+            texts.extend(passages)
+            metadatas.extend(self._passage_metadata(self._build_metadata(obj, platform, doc_id), doc_id, len(passages)))
+        if len(texts) > len(objects):
+            logger.info(f"{len(objects)} 条内容切分为 {len(texts)} 个段落")
+
+        self._add_passages(texts, metadatas)
+        # 内容已写入索引，等待保存期间不再持有正文
+        for obj in objects:
+            obj.content = None
+        return objects
+
+    def _add_passages(self, texts, metadatas):
+        """生成 embedding (整块一次) 并直接写入 FAISS"""
+        embeddings = self._batch_create_embeddings(texts)
+        faiss_store = self.faiss_manager.faiss_store
+        if not faiss_store or faiss_store.index.ntotal == 0:
+            # 还没有索引: 直接用这块的向量建索引 (FAISS store 和 BM25)，不再单独 embedding 一遍
+            logger.info(f"初始化 FAISS 索引，包含 {len(texts)} 个文档")
+            self.faiss_manager.initialize_store_from_embeddings(texts, embeddings, metadatas)
         else:
-            logger.info(f"没有新的 {platform} 内容需要索引")
+            self.faiss_manager.add_embeddings(texts, embeddings, metadatas)
+
+    @staticmethod
+    def _build_metadata(obj, platform: str, doc_id: str):
+        # 准备元数据
+        metadata = {
+            'source': platform,
+            'thread_id': obj.thread_id,
+            'content_type': obj.content_type,
+            'author': obj.author_name,
+            'doc_id': doc_id
+        }
 
+        # 添加特定平台的元数据
+        if platform == 'reddit':
+            metadata['subreddit'] = obj.subreddit
+            metadata['upvotes'] = getattr(obj, 'upvotes', 0)
+        elif platform == 'stackoverflow':
+            metadata['tags'] = getattr(obj, 'tags', [])
+            metadata['vote_score'] = getattr(obj, 'vote_score', 0)
+        elif platform == 'rednote':
+            metadata['tags'] = getattr(obj, 'tags', [])
+            metadata['likes'] = getattr(obj, 'likes', 0)
+        return metadata
+
+    @staticmethod
+    def _passage_metadata(metadata, parent_id: str, passage_count: int):
+        """同一帖子的每个段落: 复制帖子的元数据，并记录 parent_id / 段落序号 / 段落总数"""
+        return [
+            {**metadata, 'parent_id': parent_id, 'chunk_index': index, 'chunk_count': passage_count}
+            for index in range(passage_count)
+        ]
+
+    def _bulk_index_content(self, objects, source: str):
+        """
+        _index_content 的批量版本: 一次查询已存在的 thread_id，一次 bulk_create，一次 update 清空 content。
+        已经有 ContentIndex 记录的 thread 与逐条处理时一样跳过 (不创建记录、不清空 content)。
+        """
+        try:
+            existing = set(
+                ContentIndex.objects.filter(source=source, thread_id__in={obj.thread_id for obj in objects})
+                .values_list('thread_id', flat=True)
+            )
+            seen = set(existing)
+            records, cleared_ids = [], []
+            for obj in objects:
+                if obj.thread_id in seen:
+                    logger.debug(f"[DB] Content already indexed (source={source}, id={obj.id}), skip.")
+                    continue
+                seen.add(obj.thread_id)
+                records.append(ContentIndex(
+                    source=source,
+                    thread_id=obj.thread_id,
+                    content_type=obj.content_type,
+                    author_name=obj.author_name,
+                    created_at=obj.created_at
+                ))
+                cleared_ids.append(obj.id)
+
+            with transaction.atomic():
+                ContentIndex.objects.bulk_create(records)
+                # Clear content field after successful indexing to save storage
+                self.PLATFORM_MODEL_MAP[source].objects.filter(id__in=cleared_ids).update(content=None)
+            logger.info(f"[DB] Created {len(records)} records and cleared content for {len(cleared_ids)} {source} objects.")
+
+        except Exception as e:
+            logger.error(f"[DB] Error bulk indexing {len(objects)} {source} objects: {str(e)}")
+            raise
 
-        
     def _index_content(self, content_obj, source: str):
         try:
             if ContentIndex.objects.filter(source=source, thread_id=content_obj.thread_id).exists():
@@ -128,12 +230,23 @@ class Indexer:
         if not texts:
             return []
         texts = [self._preprocess_text(t) for t in texts]
-        embeddings = []
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i:i + self.batch_size]
-            batch_embeddings = self.embedding_model.embed_documents(batch)
-            embeddings.extend(batch_embeddings)
-        return embeddings
+        if self.embedding_cache is not None:
+            return self.embedding_cache.embed_documents(texts, self._embed_in_batches)
+        return self._embed_in_batches(texts)
+
+    def _embed_in_batches(self, texts: List[str]):
+        if self.embedding_pool is not None:
+            embed_batches = self.embedding_pool.embed_batches
+        else:
+            embed_batches = sequential_embed_batches(self.embedding_model)
+        return self.batcher.embed(texts, embed_batches)
+
+    def _save_embedding_cache(self):
+        if self.embedding_cache is not None:
+            self.embedding_cache.save()
+            stats = self.embedding_cache.stats()
+            logger.info(f"Embedding cache: {stats['entries']} entries, hit rate {stats['hit_rate']:.1%} "
+                        f"({stats['hits']} hits / {stats['misses']} misses)")
 
     def _preprocess_text(self, text: str): # TO BE DONE: 还可以被很大程度上完善
         if not isinstance(text, str):
@@ -144,14 +257,8 @@ class Indexer:
         max_length = 512
         return text[:max_length] if len(text) > max_length else text
     
-    def index_crawled_item(self, db_obj, raw_text: str, save_index=True):
-        """对爬虫抓到的一条记录 db_obj + 文本 raw_text 做embedding并写入FAISS, 并给db_obj设置embedding_key"""
-        if db_obj.embedding_key:
-            logger.info(f"[index_crawled_item] {db_obj} has embedding_key={db_obj.embedding_key}, skip.")
-            return
-        
-        embeddings = self._batch_create_embeddings([raw_text])
-        emb = embeddings[0]
+    @staticmethod
+    def _crawled_metadata(db_obj):
         meta_dict = {
             "source": db_obj.source,
             "thread_id": db_obj.thread_id,
@@ -166,12 +273,55 @@ class Indexer:
             meta_dict["vote_score"] = getattr(db_obj, 'vote_score', 0)
         elif db_obj.source == 'rednote':
             meta_dict["likes"] = getattr(db_obj, 'likes', 0)
+        return meta_dict
+
+    def index_crawled_items(self, db_objs, platform: str):
+        """
+        index_crawled_item 的批量版本 (后台索引队列使用): 所有帖子的段落一次 embedding、一次写入 FAISS，
+        快照发布成功后才写 embedding_key、清空 content 并创建 ContentIndex。
+        保存失败时抛出 RuntimeError，数据库保持不变。返回写入的条数。
+        """
+        objects = [obj for obj in db_objs if not obj.embedding_key and obj.content]
+        if not objects:
+            return 0
+
+        texts, metadatas = [], []
+        for obj in objects:
+            passages = self.chunker.split(obj.content) or [obj.content]
+            meta_dict = self._crawled_metadata(obj)
+            texts.extend(passages)
+            metadatas.extend(self._passage_metadata(meta_dict, meta_dict["id"], len(passages)))
+        if len(texts) > len(objects):
+            logger.info(f"{len(objects)} 条抓取内容切分为 {len(texts)} 个段落")
+        self._add_passages(texts, metadatas)
+
+        self._save_index_or_raise(platform)
+
+        # 快照已发布: 写入 embedding_key 并清空 content，再创建 ContentIndex 记录
+        for obj in objects:
+            obj.embedding_key = generate_embedding_key(obj)
+            obj.content = None
+        with transaction.atomic():
+            self.PLATFORM_MODEL_MAP[platform].objects.bulk_update(objects, ['embedding_key', 'content'])
+            self._bulk_index_content(objects, platform)
+        logger.info(f"[index_crawled_items] Embedded {len(objects)} {platform} items")
+        return len(objects)
+
+    def index_crawled_item(self, db_obj, raw_text: str, save_index=True):
+        """对爬虫抓到的一条记录 db_obj + 文本 raw_text 做embedding并写入FAISS, 并给db_obj设置embedding_key"""
+        if db_obj.embedding_key:
+            logger.info(f"[index_crawled_item] {db_obj} has embedding_key={db_obj.embedding_key}, skip.")
+            return
+        
+        passages = self.chunker.split(raw_text) or [raw_text]
+        embeddings = self._batch_create_embeddings(passages)
+        meta_dict = self._crawled_metadata(db_obj)
         
-        # Add to FAISS
+        # Add to FAISS (每个段落一条)
         self.faiss_manager.add_texts(
-            texts=[raw_text],
-            metadatas=[meta_dict],
-            embeddings=[emb]
+            texts=passages,
+            metadatas=self._passage_metadata(meta_dict, meta_dict["id"], len(passages)),
+            embeddings=embeddings
         )
 
         # Update embedding_key ### -> 需要修改逻辑
@@ -186,6 +336,7 @@ class Indexer:
         # Only save if explicitly requested (for batches)
         if save_index:
             self.faiss_manager.save_index()
+            self._save_embedding_cache()
 
         # 暂时逻辑是：同时写入ContentIndex数据 -> 可视化被indexing的所有数据(以近去掉content字段)
         ContentIndex.objects.create(
@@ -0,0 +1,198 @@
+# 后台索引队列: 实时抓取的内容写入 IndexingJob 表，由 process_indexing_queue 进程按平台合并成批 (embedding + 写入 + 保存一次)
+
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Callable, Iterable
+
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Max, Min
+from django.utils import timezone
+
+from django_apps.search.models import IndexingJob, RedditContent, StackOverflowContent, RednoteContent
+
+logger = logging.getLogger(__name__)
+
+PLATFORM_MODEL_MAP = {
+    'reddit': RedditContent,
+    'stackoverflow': StackOverflowContent,
+    'rednote': RednoteContent
+}
+
+
+class IndexingWorker:
+    """
+    数据库中的索引队列:
+      - enqueue(): 请求线程只插入 IndexingJob 记录，立即返回; Web 进程不会启动写入线程
+      - 写入线程 (只在 process_indexing_queue 命令中运行) 每次取一个平台的待处理记录 (最多 batch_size 条)，
+        调用 process_fn(posts, platform) 一次性写入索引并保存
+      - 领取任务时用 claim_token 标记 (只更新仍为 pending 的记录，再按 token 读回)，
+        同时运行多个写入者时每个任务也只会被一个写入者处理
+      - 失败的记录重试 max_attempts 次后标记为 failed; 超过 stale_after 仍为 running 的记录 (进程中断) 会被重新放回队列
+    进程重启后未完成的记录会继续处理。
+    """
+
+    def __init__(self, process_fn: Callable, batch_size: int = 200, poll_interval: float = 5.0,
+                 max_attempts: int = 3, stale_after: timedelta = timedelta(minutes=10)):
+        """
+        :param process_fn: process_fn(posts, platform) -> {"success": bool, "message": str, ...}
+        """
+        self.process_fn = process_fn
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.last_batch = None  # 最近一批的平台 / 条数 / 耗时 / 完成时间
+
+    def enqueue(self, posts: Iterable, platform: str) -> int:
+        """把抓取到的内容加入队列，返回加入的条数"""
+        object_ids = list(dict.fromkeys(post.id for post in posts if getattr(post, 'id', None) is not None))
+        if not object_ids:
+            return 0
+        IndexingJob.objects.bulk_create([IndexingJob(platform=platform, object_id=object_id) for object_id in object_ids])
+        logger.info(f"[IndexingWorker] 已加入 {len(object_ids)} 条 {platform} 索引任务")
+        return len(object_ids)
+
+    def start(self):
+        """在当前进程启动写入线程 (已启动时不做任何事)，供 process_indexing_queue 使用"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="indexing-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_forever(self):
+        logger.info("[IndexingWorker] 写入线程已启动")
+        while not self._stop.is_set():
+            # 长期运行的线程需要自己回收失效的数据库连接
+            close_old_connections()
+            try:
+                processed = self.process_pending()
+            except Exception as e:
+                logger.error(f"[IndexingWorker] 处理索引队列时出错: {str(e)}", exc_info=True)
+                processed = 0
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def process_pending(self) -> int:
+        """处理一个平台的一批待处理任务，返回处理的任务数 (没有任务时返回 0)"""
+        self._requeue_stale()
+        platform, jobs = self._claim_batch()
+        if not jobs:
+            return 0
+
+        start_time = time.time()
+        object_ids = list(dict.fromkeys(job.object_id for job in jobs))
+        # 已有 embedding_key 的内容已经写入过索引 (例如重试前的部分成功)，不再重复处理
+        posts = [
+            post for post in PLATFORM_MODEL_MAP[platform].objects.filter(id__in=object_ids)
+            if not post.embedding_key
+        ]
+        error = None
+        if posts:
+            try:
+                result = self.process_fn(posts, platform) or {}
+                if not result.get('success', True):
+                    error = result.get('message', 'indexing failed')
+            except Exception as e:
+                logger.error(f"[IndexingWorker] {platform} 批量索引失败: {str(e)}", exc_info=True)
+                error = str(e)
+        self._finish(jobs, error)
+
+        duration = time.time() - start_time
+        self.last_batch = {
+            'platform': platform,
+            'jobs': len(jobs),
+            'posts': len(posts),
+            'duration': round(duration, 2),
+            'error': error,
+            'finished_at': timezone.now().isoformat(),
+        }
+        logger.info(f"[IndexingWorker] 完成 {platform} 批次: {len(jobs)} 个任务 ({len(posts)} 条内容)，耗时 {duration:.2f}s")
+        return len(jobs)
+
+    def stats(self):
+        """
+        队列深度 (各平台待处理 / 处理中 / 失败数)、最早待处理任务的等待时间 (lag) 以及最近完成任务的时间。
+        last_batch 只在运行写入线程的进程 (process_indexing_queue) 中有值。
+        """
+        now = timezone.now()
+        platforms = {}
+        rows = IndexingJob.objects.exclude(status=IndexingJob.STATUS_DONE).values('platform', 'status').annotate(
+            count=Count('id'), oldest=Min('created_at')
+        )
+        for row in rows:
+            entry = platforms.setdefault(row['platform'], {'pending': 0, 'running': 0, 'failed': 0, 'lag_seconds': 0.0})
+            entry[row['status']] = row['count']
+            if row['status'] == IndexingJob.STATUS_PENDING and row['oldest']:
+                entry['lag_seconds'] = round((now - row['oldest']).total_seconds(), 1)
+        return {
+            'worker_alive': self._thread is not None and self._thread.is_alive(),
+            'last_finished_at': (
+                IndexingJob.objects.filter(finished_at__isnull=False).aggregate(last=Max('finished_at'))['last']
+            ),
+            'queue_depth': sum(entry['pending'] + entry['running'] for entry in platforms.values()),
+            'lag_seconds': max((entry['lag_seconds'] for entry in platforms.values()), default=0.0),
+            'platforms': platforms,
+            'last_batch': self.last_batch,
+        }
+
+    def _claim_batch(self):
+        """
+        取出最早有待处理任务的平台，把该平台的一批任务标记为 running 并写入本次的 claim_token。
+        只有仍为 pending 的记录会被更新，再按 token 读回，其他写入者先领取的任务不会出现在结果中。
+        """
+        while True:
+            token = uuid.uuid4().hex
+            with transaction.atomic():
+                oldest = IndexingJob.objects.filter(status=IndexingJob.STATUS_PENDING).order_by('created_at', 'id').first()
+                if oldest is None:
+                    return None, []
+                job_ids = list(
+                    IndexingJob.objects.filter(status=IndexingJob.STATUS_PENDING, platform=oldest.platform)
+                    .order_by('created_at', 'id').values_list('id', flat=True)[:self.batch_size]
+                )
+                claimed = IndexingJob.objects.filter(id__in=job_ids, status=IndexingJob.STATUS_PENDING).update(
+                    status=IndexingJob.STATUS_RUNNING, started_at=timezone.now(), claim_token=token
+                )
+            if claimed:
+                jobs = list(IndexingJob.objects.filter(claim_token=token, status=IndexingJob.STATUS_RUNNING))
+                return oldest.platform, jobs
+            # 这批任务刚被其他写入者领取，重新选择
+
+    def _finish(self, jobs, error):
+        """只更新仍属于本次领取的任务 (超时后被放回队列并由其他写入者领取的不再修改)"""
+        now = timezone.now()
+        owned = IndexingJob.objects.filter(
+            id__in=[job.id for job in jobs], claim_token=jobs[0].claim_token, status=IndexingJob.STATUS_RUNNING
+        )
+        if error is None:
+            owned.update(status=IndexingJob.STATUS_DONE, finished_at=now, error=None)
+            return
+        # 失败: 未超过重试次数的放回队列，其余标记为 failed
+        owned.filter(attempts__lt=self.max_attempts - 1).update(
+            status=IndexingJob.STATUS_PENDING, attempts=F('attempts') + 1, error=error, finished_at=now
+        )
+        owned.update(status=IndexingJob.STATUS_FAILED, attempts=F('attempts') + 1, error=error, finished_at=now)
+
+    def _requeue_stale(self):
+        cutoff = timezone.now() - self.stale_after
+        count = IndexingJob.objects.filter(status=IndexingJob.STATUS_RUNNING, started_at__lt=cutoff).update(
+            status=IndexingJob.STATUS_PENDING
+        )
+        if count:
+            logger.warning(f"[IndexingWorker] {count} 个超时的 running 任务已重新放回队列")
@@ -0,0 +1,78 @@
+# ONNX Runtime 的 CPU embedding 后端: 与 HuggingFaceEmbeddings 相同的模型和向量空间，推理更快 (可选 int8 动态量化)
+#
+# 导出与量化 (只需做一次):
+#   optimum-cli export onnx --model Alibaba-NLP/gte-multilingual-base --task feature-extraction \
+#       --trust-remote-code model_cache/gte-multilingual-base-onnx
+#   python -c "from onnxruntime.quantization import quantize_dynamic, QuantType; \
+#       quantize_dynamic('model_cache/gte-multilingual-base-onnx/model.onnx', \
+#                        'model_cache/gte-multilingual-base-onnx/model_quantized.onnx', weight_type=QuantType.QInt8)"
+# 导出后用 python manage.py check_embedding_parity 对比 torch 后端的结果。
+
+import logging
+import os
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .embedding_batcher import TokenBudgetBatcher
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    加载导出到本地目录的 ONNX 模型 (以及同目录下的 tokenizer)，实现 langchain 的 Embeddings 接口。
+    与 get_embeddings() 中的 torch 后端保持一致: 取 CLS 向量并做 L2 归一化 (gte-multilingual-base 的 pooling 方式)。
+    输入按 token 长度分桶、按 token 预算组批 (TokenBudgetBatcher)，减少 padding。
+    """
+
+    def __init__(self, model_name: str, model_path: str, quantized: bool = False, batch_size: int = 32,
+                 max_length: Optional[int] = None, num_threads: Optional[int] = None, max_batch_tokens: int = 8192):
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError("The onnx embedding backend requires `onnxruntime` and `transformers`") from e
+
+        model_file = os.path.join(model_path, ONNX_QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(f"ONNX model not found: {model_file}")
+
+        # embedding 缓存按 model_name 区分，量化模型的向量与 fp32 略有差异，因此使用不同的名字
+        self.model_name = f"{model_name}:onnx-int8" if quantized else f"{model_name}:onnx"
+        self.batch_size = batch_size
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.max_length = max_length or min(self.tokenizer.model_max_length, 8192)
+        self.batcher = TokenBudgetBatcher(
+            max_tokens=max_batch_tokens, max_batch_size=batch_size, max_length=self.max_length, tokenizer=self.tokenizer
+        )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        logger.info(f"Loaded ONNX embedding model {model_file} (quantized={quantized})")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.batcher.embed(texts, lambda batches: [self._embed_batch(batch) for batch in batches])
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        inputs = {name: np.asarray(value, dtype=np.int64) for name, value in encoded.items() if name in self._input_names}
+        output = self.session.run(None, inputs)[0]
+        # feature-extraction 导出的输出是 last_hidden_state (batch, seq, dim)，取 CLS
+        embeddings = output[:, 0] if output.ndim == 3 else output
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
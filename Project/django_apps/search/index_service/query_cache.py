@@ -0,0 +1,171 @@
+# 查询向量缓存: 相同 (或只差空白的) 查询不再重复调用 embedding 模型，带 TTL 的 LRU，可选用 Django cache 跨进程共享
+
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 3600
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+class QueryEmbeddingCache:
+    """
+    进程内 LRU 缓存，key 为 (模型名, 规范化后的查询文本):
+      - 条目超过 max_entries 时淘汰最久未使用的，超过 ttl 秒的条目视为未命中
+      - 指定 django_cache_alias 时，进程内未命中会再查 Django cache (例如 Redis)，计算结果同时写入两层
+    hits / misses 统计的是是否跳过了模型推理 (Django cache 命中也算命中，另计 shared_hits)。
+    """
+
+    def __init__(self, model_name: str, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS,
+                 django_cache_alias: Optional[str] = None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.django_cache_alias = django_cache_alias
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (过期时间, 向量)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Unicode NFC，去掉首尾空白并把连续空白合并为一个空格"""
+        return _WHITESPACE_RE.sub(' ', unicodedata.normalize("NFC", query)).strip()
+
+    def cache_key(self, query: str) -> str:
+        digest = hashlib.blake2b(self.normalize_query(query).encode("utf-8"), digest_size=16).hexdigest()
+        return f"query_embedding:{self.model_name}:{digest}"
+
+    def embed_query(self, query: str, embed_fn: Callable[[str], list]) -> np.ndarray:
+        """返回单个查询的向量 (float32)，未命中时调用 embed_fn(query)"""
+        return self.embed_queries([query], lambda queries: [embed_fn(queries[0])])[0]
+
+    def embed_queries(self, queries: List[str], embed_many_fn: Callable[[List[str]], list]) -> np.ndarray:
+        """
+        批量版本: 只把未命中的 (去重后的) 查询交给 embed_many_fn 计算。
+        返回 (len(queries), dim) 的 float32 矩阵。
+        """
+        keys = [self.cache_key(query) for query in queries]
+        vectors = [self._get(key) for key in keys]
+
+        missing = {}  # key -> 第一次出现的查询
+        for key, query, vector in zip(keys, queries, vectors):
+            if vector is None:
+                missing.setdefault(key, query)
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+        if missing:
+            computed = np.asarray(embed_many_fn(list(missing.values())), dtype=np.float32)
+            computed_by_key = dict(zip(missing.keys(), computed))
+            for key, vector in computed_by_key.items():
+                self._put(key, vector)
+            vectors = [vector if vector is not None else computed_by_key[key] for key, vector in zip(keys, vectors)]
+        if not vectors:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack(vectors).astype(np.float32, copy=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'model_name': self.model_name,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, vector = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return vector
+                del self._entries[key]
+
+        shared = self._shared_cache()
+        if shared is None:
+            return None
+        try:
+            vector = shared.get(key)
+        except Exception as e:
+            logger.warning(f"Query embedding cache: Django cache lookup failed: {e}")
+            return None
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self.shared_hits += 1
+        self._put(key, vector, shared=False)
+        return vector
+
+    def _put(self, key, vector, shared=True):
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)  # 缓存中的向量会被多个请求共用
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if shared:
+            cache = self._shared_cache()
+            if cache is not None:
+                try:
+                    cache.set(key, vector, timeout=self.ttl)
+                except Exception as e:
+                    logger.warning(f"Query embedding cache: Django cache write failed: {e}")
+
+    def _shared_cache(self):
+        if not self.django_cache_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.django_cache_alias]
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_query_embedding_cache(embedding_model) -> Optional[QueryEmbeddingCache]:
+    """
+    返回该 embedding 模型共享的查询向量缓存 (进程内每个模型一个实例)。
+    settings.QUERY_EMBEDDING_CACHE_SIZE 为 0 时关闭缓存，返回 None。
+    """
+    max_entries, ttl, alias = DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS, None
+    if settings.configured:
+        max_entries = getattr(settings, 'QUERY_EMBEDDING_CACHE_SIZE', DEFAULT_MAX_ENTRIES)
+        ttl = getattr(settings, 'QUERY_EMBEDDING_CACHE_TTL', DEFAULT_TTL_SECONDS)
+        alias = getattr(settings, 'QUERY_EMBEDDING_CACHE_ALIAS', None)
+    if not max_entries:
+        return None
+    model_name = getattr(embedding_model, 'model_name', None) or type(embedding_model).__name__
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = QueryEmbeddingCache(model_name, max_entries=max_entries, ttl=ttl, django_cache_alias=alias)
+            _caches[model_name] = cache
+        return cache
@@ -0,0 +1,221 @@
+# 多平台索引注册表: 每个平台常驻一个 FaissManager, 请求按平台借用, 不再在全局实例上来回切换平台
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .docstore import MmapDocstore
+from .faiss_manager import FaissManager
+from ..utils import get_embeddings
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_PLATFORMS = ('reddit', 'stackoverflow', 'rednote')
+
+
+class IndexRegistry:
+    """
+    按平台缓存已加载的 FaissManager (共享同一个 embedding 模型):
+      - get(platform): 只读借用，首次访问时从磁盘加载，之后常驻内存，不会触发 set_platform
+      - writer(platform): 写入方 (index_content / 实时抓取后的索引) 使用，同一平台的写操作串行执行;
+        写入在单独加载的 manager 上进行，保存 (发布新快照) 后才替换常驻的 manager，读取方不会看到正在修改的实例
+      - 可选 LRU 淘汰: max_resident 限制常驻平台数，memory_budget_mb 限制估算内存占用
+      - 快照热更新: get() 每隔 refresh_interval 秒检查一次 CURRENT，其他进程发布新版本后在后台线程加载并替换
+    被淘汰或被替换的 manager 只是不再被注册表引用，正在使用它的请求仍可以正常完成。
+    """
+
+    def __init__(self, embedding_model=None, base_index_dir="faiss_index", max_resident=None, memory_budget_mb=None,
+                 index_type="flat", index_params=None, refresh_interval=5.0):
+        """
+        :param embedding_model: 共享的 embedding 模型，默认调用 get_embeddings()
+        :param base_index_dir: 基础索引目录，与 FaissManager 相同
+        :param max_resident: 最多常驻的平台数，None 表示不限制
+        :param memory_budget_mb: 常驻索引的估算内存上限 (MB)，None 表示不限制
+        :param index_type: 新建索引时的向量索引类型, 见 index_factory.INDEX_TYPES
+        :param index_params: 新建索引时的索引参数
+        :param refresh_interval: 检查磁盘上是否有新快照的间隔 (秒)，None 表示不检查
+        """
+        self.embedding_model = embedding_model or get_embeddings()
+        self.base_index_dir = base_index_dir
+        self.max_resident = max_resident
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.index_type = index_type
+        self.index_params = index_params
+        self.refresh_interval = refresh_interval
+
+        self._managers = OrderedDict()  # platform -> FaissManager, 按最近使用排序
+        self._sizes = {}  # platform -> 估算的内存占用 (bytes)
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._write_locks = {}
+        self._checked_at = {}  # platform -> 上次检查快照版本的时间 (monotonic)
+        self._refreshing = set()  # 正在后台加载新版本的平台
+
+    @staticmethod
+    def normalize_platform(platform):
+        return platform.lower() if isinstance(platform, str) and platform else 'reddit'
+
+    def get(self, platform) -> FaissManager:
+        """返回该平台已加载的 FaissManager (只读使用)"""
+        platform = self.normalize_platform(platform)
+        with self._lock:
+            manager = self._managers.get(platform)
+            if manager is not None:
+                self._managers.move_to_end(platform)
+            else:
+                load_lock = self._load_locks.setdefault(platform, threading.Lock())
+        if manager is not None:
+            self._check_for_update(platform, manager)
+            return manager
+
+        # 同一平台只加载一次，不同平台可以并行加载
+        with load_lock:
+            with self._lock:
+                manager = self._managers.get(platform)
+                if manager is not None:
+                    self._managers.move_to_end(platform)
+                    return manager
+
+            manager = self._load(platform)
+
+            with self._lock:
+                self._managers[platform] = manager
+                self._sizes[platform] = self._estimate_bytes(manager)
+                self._evict(keep=platform)
+        return manager
+
+    def preload(self, platforms=SUPPORTED_PLATFORMS):
+        """预先加载指定平台的索引 (例如在 worker 启动时调用)"""
+        for platform in platforms:
+            self.get(platform)
+
+    @contextmanager
+    def writer(self, platform):
+        """
+        获取平台的写权限，返回一个写入专用的 FaissManager (从磁盘上最新的快照单独加载，不与 get() 的读取方共享)。
+        退出时如果该 manager 已保存为新的快照版本，再把它替换为常驻的 manager; 未保存或写入出错时直接丢弃。
+        写入期间内存中同时存在新旧两份索引。
+        """
+        platform = self.normalize_platform(platform)
+        with self._lock:
+            write_lock = self._write_locks.setdefault(platform, threading.Lock())
+        with write_lock:
+            manager = self._load(platform)
+            yield manager
+            self._install(platform, manager)
+
+    def resident_platforms(self):
+        with self._lock:
+            return list(self._managers.keys())
+
+    def _new_manager(self, platform) -> FaissManager:
+        return FaissManager(
+            self.embedding_model, base_index_dir=self.base_index_dir, platform=platform,
+            index_type=self.index_type, index_params=self.index_params
+        )
+
+    def _load(self, platform) -> FaissManager:
+        manager = self._new_manager(platform)
+        if not manager.load_index():
+            logger.warning(f"平台 {platform} 的索引加载失败，创建空索引")
+            manager.create_empty_index()
+        logger.info(f"[IndexRegistry] 已加载平台 {platform} 的索引 ({manager.get_index_size()} 条)")
+        return manager
+
+    def _install(self, platform, manager):
+        """写入方保存后替换常驻的 manager (只替换为更新的快照版本)"""
+        if manager.snapshot_version is None or manager.is_stale():
+            logger.warning(f"[IndexRegistry] 平台 {platform} 的写入没有发布新的快照，丢弃写入用的 manager")
+            return
+        with self._lock:
+            resident = self._managers.get(platform)
+            if resident is not None and resident.snapshot_version is not None \
+                    and resident.snapshot_version >= manager.snapshot_version:
+                return
+            self._managers[platform] = manager
+            self._managers.move_to_end(platform)
+            self._sizes[platform] = self._estimate_bytes(manager)
+            self._evict(keep=platform)
+        logger.info(f"[IndexRegistry] 平台 {platform} 已切换到写入后的快照版本 {manager.snapshot_version} "
+                    f"({manager.get_index_size()} 条)")
+
+    def _check_for_update(self, platform, manager):
+        """按 refresh_interval 节流地检查快照版本，有新版本时启动后台加载，本次请求仍使用当前的 manager"""
+        if self.refresh_interval is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at.get(platform, 0.0) < self.refresh_interval or platform in self._refreshing:
+                return
+            self._checked_at[platform] = now
+        if not manager.is_stale():
+            return
+        with self._lock:
+            if platform in self._refreshing:
+                return
+            self._refreshing.add(platform)
+        threading.Thread(
+            target=self._reload, args=(platform, manager), name=f"index-refresh-{platform}", daemon=True
+        ).start()
+
+    def _reload(self, platform, stale_manager):
+        """加载 CURRENT 指向的新快照并替换注册表中的引用，返回新的 manager (放弃时返回 None)"""
+        try:
+            manager = self._new_manager(platform)
+            if not manager.load_index():
+                logger.warning(f"[IndexRegistry] 平台 {platform} 的新快照加载失败，继续使用当前版本")
+                return None
+            with self._lock:
+                # 加载期间平台被淘汰或已被替换 (例如写入方发布了新版本) 时放弃
+                if self._managers.get(platform) is not stale_manager:
+                    return None
+                self._managers[platform] = manager
+                self._sizes[platform] = self._estimate_bytes(manager)
+                self._evict(keep=platform)
+            logger.info(f"[IndexRegistry] 平台 {platform} 已切换到快照版本 {manager.snapshot_version} "
+                        f"({manager.get_index_size()} 条)")
+            return manager
+        except Exception as e:
+            logger.error(f"[IndexRegistry] 重新加载平台 {platform} 的索引时出错: {str(e)}")
+            return None
+        finally:
+            with self._lock:
+                self._refreshing.discard(platform)
+
+    def _evict(self, keep=None):
+        """按 LRU 顺序淘汰平台，直到满足数量和内存限制 (调用方需持有 self._lock)"""
+        while self._over_budget():
+            victim = next((p for p in self._managers if p != keep), None)
+            if victim is None:
+                break
+            self._managers.pop(victim)
+            self._sizes.pop(victim, None)
+            logger.info(f"[IndexRegistry] 淘汰平台 {victim} 的常驻索引")
+
+    def _over_budget(self):
+        if self.max_resident is not None and len(self._managers) > self.max_resident:
+            return True
+        if self.memory_budget_bytes is not None and sum(self._sizes.values()) > self.memory_budget_bytes:
+            return True
+        return False
+
+    @staticmethod
+    def _estimate_bytes(manager: FaissManager):
+        """估算一个平台索引的常驻内存: 向量 + 文档存储 + BM25 数组"""
+        total = 0
+        store = manager.faiss_store
+        if store is not None and store.index is not None:
+            total += store.index.ntotal * store.index.d * 4
+        docstore = getattr(store, 'docstore', None)
+        if isinstance(docstore, MmapDocstore):
+            # mmap 的文档数据按访问换入，按数据文件大小计算上限
+            total += docstore.data_end()
+        elif isinstance(getattr(docstore, '_dict', None), dict):
+            total += sum(len(doc.page_content) for doc in docstore._dict.values())
+        bm25 = manager.bm25
+        for name in ('doc_ids', 'term_freqs', 'indptr', 'doc_len', 'idf'):
+            array = getattr(bm25, name, None)
+            total += getattr(array, 'nbytes', 0)
+        return total
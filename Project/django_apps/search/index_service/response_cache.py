@@ -0,0 +1,158 @@
+# 搜索响应缓存: 相同查询 + 平台 + 模型 + 分类 + 索引版本直接返回上次的回答，跳过检索和两次 LLM 调用
+
+import hashlib
+import logging
+import re
+import threading
+from typing import Callable, Optional
+
+from django.conf import settings
+
+from .query_cache import QueryEmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_ALIAS = 'search_responses'
+DEFAULT_TTL_SECONDS = 600
+_CLASSIFICATION_RE = re.compile(r">(\d+)<")
+
+
+class SearchResponseCache:
+    """
+    基于 Django cache 的搜索响应缓存 (后端可以是 locmem / 文件 / Redis，条数上限与淘汰由后端的 MAX_ENTRIES 决定):
+      - 响应的 key 为 (接口, 规范化后的查询, 平台, llm_model, 分类, 索引版本)，索引发布新快照或追加内容后自然失效;
+        混合搜索每次都会把抓取的内容写入索引，不传索引版本，只依靠 TTL 过期
+      - 查询分类只与 (查询, llm_model) 有关，单独缓存，命中时连分类的 LLM 调用也省掉
+      - 回答会用到对话记忆 (非推荐类且 recent_memory 不为空) 时默认不读也不写缓存，见 should_use()
+    只缓存 result / metadata / llm_model，history 每次按会话重新读取。
+    hits / misses / bypassed 为本进程的统计。
+    """
+
+    def __init__(self, cache_alias: Optional[str] = DEFAULT_CACHE_ALIAS, ttl: float = DEFAULT_TTL_SECONDS,
+                 bypass_with_memory: bool = True):
+        """
+        :param cache_alias: settings.CACHES 中的别名，None 表示关闭缓存
+        :param ttl: 响应和分类的过期秒数
+        :param bypass_with_memory: 回答依赖会话记忆时是否跳过缓存
+        """
+        self.cache_alias = cache_alias
+        self.ttl = ttl
+        self.bypass_with_memory = bypass_with_memory
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.classification_hits = 0
+        self.classification_misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.cache_alias)
+
+    @staticmethod
+    def index_version(faiss_manager) -> str:
+        """快照版本 + 条数: 旧的平铺目录或尚未保存的追加同样会改变版本"""
+        return f"{faiss_manager.snapshot_version}:{faiss_manager.get_index_size()}"
+
+    def make_key(self, endpoint, query, platform, llm_model, classification, index_version=None) -> str:
+        normalized = QueryEmbeddingCache.normalize_query(query)
+        raw = "\x00".join(str(part) for part in (normalized, platform, llm_model, classification, index_version))
+        digest = hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+        return f"search_response:{endpoint}:{digest}"
+
+    def should_use(self, recent_memory, classification, no_cache=False) -> bool:
+        """推荐类 (1) 的回答不使用对话记忆，其余分类在有记忆时回答因会话而异"""
+        if not self.enabled:
+            return False
+        if no_cache or (self.bypass_with_memory and recent_memory and classification != '1'):
+            with self._lock:
+                self.bypassed += 1
+            return False
+        return True
+
+    def get(self, key) -> Optional[dict]:
+        payload = self._cache_get(key) if key else None
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if payload is not None:
+            print(f"--- [SearchResponseCache.get] 命中响应缓存 {key} ---")
+        return payload
+
+    def set(self, key, payload: dict):
+        """payload 为 {'result', 'metadata', 'llm_model'}; key 为 None (本次请求不使用缓存) 时不写入"""
+        if not key:
+            return
+        if self._cache_set(key, dict(payload), self.ttl):
+            with self._lock:
+                self.stores += 1
+
+    def classify(self, query: str, llm_model: str, classify_fn: Callable[[str, str], str]) -> str:
+        """返回分类编号 ('1' - '6')，未命中时调用 classify_fn(query, llm_model) 并解析 >N< 格式"""
+        key = None
+        if self.enabled:
+            digest = hashlib.blake2b(QueryEmbeddingCache.normalize_query(query).encode("utf-8"),
+                                     digest_size=16).hexdigest()
+            key = f"search_classification:{llm_model}:{digest}"
+            classification = self._cache_get(key)
+            if classification is not None:
+                with self._lock:
+                    self.classification_hits += 1
+                return classification
+            with self._lock:
+                self.classification_misses += 1
+
+        classification = _CLASSIFICATION_RE.search(classify_fn(query, llm_model)).group(1)
+        if key:
+            self._cache_set(key, classification, self.ttl)
+        return classification
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            classified = self.classification_hits + self.classification_misses
+            return {
+                'enabled': self.enabled,
+                'cache_alias': self.cache_alias,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'stores': self.stores,
+                'hit_rate': self.hits / total if total else 0.0,
+                'classification_hits': self.classification_hits,
+                'classification_misses': self.classification_misses,
+                'classification_hit_rate': self.classification_hits / classified if classified else 0.0,
+            }
+
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.cache_alias]
+
+    def _cache_get(self, key):
+        # 缓存后端不可用 (例如 Redis 断开) 时按未命中处理，不影响搜索
+        try:
+            return self._cache().get(key)
+        except Exception as e:
+            logger.warning(f"Search response cache: lookup failed: {e}")
+            return None
+
+    def _cache_set(self, key, value, timeout) -> bool:
+        try:
+            self._cache().set(key, value, timeout=timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"Search response cache: write failed: {e}")
+            return False
+
+
+def get_response_cache() -> SearchResponseCache:
+    """按 settings 创建搜索响应缓存; SEARCH_RESPONSE_CACHE_ALIAS 为 None 时关闭"""
+    return SearchResponseCache(
+        cache_alias=getattr(settings, 'SEARCH_RESPONSE_CACHE_ALIAS', DEFAULT_CACHE_ALIAS),
+        ttl=getattr(settings, 'SEARCH_RESPONSE_CACHE_TTL', DEFAULT_TTL_SECONDS),
+        bypass_with_memory=getattr(settings, 'SEARCH_RESPONSE_CACHE_BYPASS_WITH_MEMORY', True),
+    )
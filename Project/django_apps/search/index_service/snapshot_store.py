@@ -0,0 +1,180 @@
+# 索引快照: 每次保存写入一个新的版本目录，写完后原子地替换 CURRENT 指针
+#
+# 目录结构 (faiss_index/<platform>/):
+#   CURRENT                    当前版本号 (例如 "000012")，通过临时文件 + os.replace 替换
+#   snapshots/000012/          index.faiss / index_params.json / BM25 文件 / snapshot.json (pickle 存储时还有 index.pkl)
+#   docstore-000012/           MmapDocstore，只追加写入，多个快照共享; 快照通过 snapshot.json 中的 rows 只看到自己的前缀
+#                              重建索引时使用新的目录，旧快照引用的文档不会被覆盖 (旧的平铺目录中的文档存储为 ".")
+#   writer.lock                写入锁: 检查版本 -> 追加文档 -> 发布 期间持有 flock 排他锁，多个进程的写入依次进行
+# 读取方只读取 CURRENT 指向的完整目录，写入中断时 CURRENT 仍指向上一个完整版本。
+# 比 CURRENT 新的目录可能属于其他进程正在写入的快照，清理时只删除超过 ABANDONED_AFTER 未修改的。
+
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: 没有 flock，不做跨进程的写入互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+MANIFEST_FILE = "snapshot.json"
+DOCSTORE_DIR_PREFIX = "docstore-"
+WRITER_LOCK_NAME = "writer.lock"
+DEFAULT_KEEP = 3
+ABANDONED_AFTER = 24 * 3600  # 未发布的快照 / 未被引用的文档存储目录超过该秒数未修改时视为写入中断留下的
+
+
+def snapshot_path(index_dir: str, version: int) -> str:
+    return os.path.join(index_dir, SNAPSHOTS_DIR, f"{version:06d}")
+
+
+def current_version(index_dir: str) -> Optional[int]:
+    """读取 CURRENT 指向的版本号，没有快照 (旧的平铺目录或空目录) 时返回 None"""
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def read_manifest(index_dir: str, version: int) -> dict:
+    with open(os.path.join(snapshot_path(index_dir, version), MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_versions(index_dir: str):
+    root = os.path.join(index_dir, SNAPSHOTS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(name) for name in os.listdir(root) if name.isdigit())
+
+
+def _next_version(index_dir: str) -> int:
+    return max(list_versions(index_dir) + [current_version(index_dir) or 0]) + 1
+
+
+def new_snapshot_dir(index_dir: str):
+    """创建下一个版本的目录，返回 (version, path)。上次写入中断留下的残缺目录不会被复用"""
+    while True:
+        version = _next_version(index_dir)
+        path = snapshot_path(index_dir, version)
+        try:
+            os.makedirs(path)
+            return version, path
+        except FileExistsError:
+            continue  # 其他进程同时创建了同一个版本
+
+
+def new_docstore_dir(index_dir: str) -> str:
+    """新建文档存储的目录 (以下一个版本号命名，发布时由快照的 snapshot.json 引用)。已存在的目录不会被复用"""
+    version = _next_version(index_dir)
+    while True:
+        path = os.path.join(index_dir, f"{DOCSTORE_DIR_PREFIX}{version:06d}")
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            version += 1  # 其他进程同时在重建索引
+
+
+@contextmanager
+def writer_lock(index_dir: str):
+    """
+    对平台目录下的 writer.lock 加阻塞的 flock 排他锁 (进程退出时自动释放)。
+    保存快照时从检查 CURRENT 到发布新版本都在锁内进行: 其他进程的写入会等待，之后检查版本时发现索引已更新而放弃。
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, WRITER_LOCK_NAME), "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def publish(index_dir: str, version: int, manifest: dict):
+    """写入 snapshot.json 并把 CURRENT 切换到该版本 (目录中的其他文件必须已经写完)"""
+    path = snapshot_path(index_dir, version)
+    manifest = dict(manifest, version=version, created_at=time.time())
+    _write_atomic(os.path.join(path, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=2))
+    _fsync_dir(path)
+    _write_atomic(os.path.join(index_dir, CURRENT_FILE), f"{version:06d}\n")
+    _fsync_dir(index_dir)
+
+
+def prune(index_dir: str, keep: int = DEFAULT_KEEP, abandoned_after: float = ABANDONED_AFTER):
+    """
+    删除比 CURRENT 旧的版本，只保留最近 keep 个。
+    比 CURRENT 新的目录可能是其他进程尚未发布的快照，只有超过 abandoned_after 秒未修改时才当作写入中断留下的删除。
+    其他进程仍在使用的旧版本文件已经加载或 mmap 到内存，删除目录不影响它们。
+    """
+    current = current_version(index_dir)
+    if current is None:
+        return []
+    versions = list_versions(index_dir)
+    older = [v for v in versions if v < current]
+    removed = older[:max(0, len(older) - (keep - 1))]
+    removed += [v for v in versions if v > current and _is_abandoned(snapshot_path(index_dir, v), abandoned_after)]
+    for version in removed:
+        shutil.rmtree(snapshot_path(index_dir, version), ignore_errors=True)
+
+    # 不再被任何保留的快照引用的文档存储目录 (同样可能属于正在进行的写入，按修改时间判断)
+    referenced = set()
+    for version in list_versions(index_dir):
+        try:
+            referenced.add(os.path.normpath(read_manifest(index_dir, version).get('docstore_dir', '.')))
+        except (OSError, ValueError):
+            continue
+    for name in os.listdir(index_dir):
+        suffix = name[len(DOCSTORE_DIR_PREFIX):]
+        if name.startswith(DOCSTORE_DIR_PREFIX) and suffix.isdigit() and name not in referenced \
+                and _is_abandoned(os.path.join(index_dir, name), abandoned_after):
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+    if removed:
+        logger.info(f"已删除 {index_dir} 下的旧快照: {removed}")
+    return removed
+
+
+def _is_abandoned(path: str, abandoned_after: float) -> bool:
+    """目录及其中的文件都超过 abandoned_after 秒未修改"""
+    try:
+        mtimes = [os.path.getmtime(path)]
+        mtimes += [entry.stat().st_mtime for entry in os.scandir(path)]
+    except OSError:
+        return False
+    return time.time() - max(mtimes) > abandoned_after
+
+
+def _write_atomic(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _fsync_dir(path: str):
+    # 目录项 (新文件 / rename) 落盘; 部分平台不支持对目录 fsync
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
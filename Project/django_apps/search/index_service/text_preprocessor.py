@@ -4,108 +4,246 @@ from nltk.corpus import stopwords
 import re
 import string
 import os # 用于加载停用词表
+import logging
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
 
 # 定义停用词表文件路径 (假设放在 text_preprocessor.py 同目录下)
 STOPWORDS_PATH = os.path.join(os.path.dirname(__file__), 'stopwords.txt')
 
-class TextPreprocessor:
-    def __init__(self):
-        # 下载nltk需要的资源
+# 预编译的规则 (快速分词路径使用, 结果与原实现逐字一致)
+_PUNCTUATION_RE = re.compile(f'[{string.punctuation}]')
+# 与上面的正则匹配的字符完全相同 (注意反斜杠不在其中)，用 str.translate 一次替换
+_PUNCTUATION_TABLE = str.maketrans({c: ' ' for c in string.punctuation if _PUNCTUATION_RE.match(c)})
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]')
+# 去掉 ASCII 标点后，nltk.word_tokenize (Treebank 规则) 仍会改变切分结果的只有:
+# 单独切出的 Unicode 引号 / 破折号，以及 cannot / gonna 等缩写的拆分 (punkt 分句只在 .?! 处切分，这些已被替换)
+_NLTK_SPLIT_CHARS_RE = re.compile('[«“‘„»”’\u2012-\u2015]')
+_NLTK_CONTRACTIONS_RE = re.compile(r'(?i)\b(?:(can)(not)|(gim)(me)|(gon)(na)|(got)(ta)|(lem)(me))\b|\b(wan)(na)(?=\s|$)')
+# 启动时用这些文本对比快速路径与 nltk 的结果，不一致 (nltk 版本规则变化) 时英文回退到 nltk.word_tokenize
+_NLTK_PROBES = (
+    "i cannot believe you gotta see this   it s wanna be gonna\tlemme gimme",
+    "“smart quotes” ‘single’ «guillemets» „low“ en–dash em—dash ‒ ―",
+    "back\\slash café naïve 100 2024 x y",
+)
+
+
+# 并行分词: 少于该条数时 fork 进程 + 加载 jieba 的开销大于收益，直接串行处理
+PARALLEL_MIN_TEXTS = 5000
+PARALLEL_CHUNK_SIZE = 500
+
+_worker_preprocessor = None
+
+
+def default_workers() -> int:
+    return max(1, min(8, (os.cpu_count() or 1) - 1))
+
+
+def _init_worker(fast: bool, jieba_cache_dir: Optional[str]):
+    """worker 进程初始化: 每个进程只加载一次 jieba 词典和停用词表"""
+    global _worker_preprocessor
+    _worker_preprocessor = TextPreprocessor(fast=fast, cache_size=0, jieba_cache_dir=jieba_cache_dir)
+    _worker_preprocessor._ensure_loaded()
+
+
+def _preprocess_chunk(texts: List[str]) -> List[str]:
+    return [_worker_preprocessor.preprocess_text(text) for text in texts]
+
+
+_nltk_resources_checked = {}
+_jieba_lock = Lock()
+_jieba_initialized = False
+_preprocessor = None
+_preprocessor_lock = Lock()
+
+
+def get_preprocessor() -> "TextPreprocessor":
+    """进程内共享的 TextPreprocessor (所有 FaissManager 共用一份停用词表和 jieba 词典，资源在第一次分词时加载)"""
+    global _preprocessor
+    if _preprocessor is None:
+        with _preprocessor_lock:
+            if _preprocessor is None:
+                _preprocessor = TextPreprocessor(jieba_cache_dir=_jieba_cache_dir_setting())
+    return _preprocessor
+
+
+def _jieba_cache_dir_setting() -> Optional[str]:
+    try:
+        from django.conf import settings
+        return getattr(settings, 'JIEBA_CACHE_DIR', None)
+    except Exception:
+        # 未配置 Django settings (例如独立脚本) 时使用 jieba 默认的临时目录
+        return None
+
+
+def _ensure_nltk_resource(path: str, package: str) -> bool:
+    """在本地 nltk_data 中查找资源 (每个进程只检查一次)，缺失时不在请求路径上下载，由调用方使用备用实现"""
+    if path not in _nltk_resources_checked:
         try:
-            nltk.download('punkt')  # 基础分词器
-            nltk.download('punkt_tab')  # punkt标签
-            nltk.download('stopwords')  # 停用词
-            nltk.download('averaged_perceptron_tagger')  # 词性标注器
-        except LookupError as e:
-            print(f"Warning: Error downloading NLTK data: {e}")
-            
-        # 初始化英文停用词 - 先获取NLTK基础停用词，然后添加570个词
-        base_en_stopwords = set(stopwords.words('english'))
-        
-        # 添加570个英文停用词，但排除单个字母
-        additional_en_stopwords = set([
-            "a's", "able", "about", "above", "according", "accordingly", "across", "actually", "after", 
-            "afterwards", "again", "against", "ain't", "all", "allow", "allows", "almost", "alone", "along", 
-            "already", "also", "although", "always", "am", "among", "amongst", "an", "and", "another", "any", 
-            "anybody", "anyhow", "anyone", "anything", "anyway", "anyways", "anywhere", "apart", "appear", 
-            "appreciate", "appropriate", "are", "aren't", "around", "as", "aside", "ask", "asking", "associated", 
-            "at", "available", "away", "awfully", "be", "became", "because", "become", "becomes", "becoming", 
-            "been", "before", "beforehand", "behind", "being", "believe", "below", "beside", "besides", "best", 
-            "better", "between", "beyond", "both", "brief", "but", "by", "c'mon", "c's", "came", "can", 
-            "can't", "cannot", "cant", "cause", "causes", "certain", "certainly", "changes", "clearly", "co", 
-            "com", "come", "comes", "concerning", "consequently", "consider", "considering", "contain", "containing", 
-            "contains", "corresponding", "could", "couldn't", "course", "currently", "definitely", "described", 
-            "despite", "did", "didn't", "different", "do", "does", "doesn't", "doing", "don't", "done", "down", 
-            "downwards", "during", "each", "edu", "eg", "eight", "either", "else", "elsewhere", "enough", 
-            "entirely", "especially", "et", "etc", "even", "ever", "every", "everybody", "everyone", "everything", 
-            "everywhere", "ex", "exactly", "example", "except", "far", "few", "fifth", "first", "five", 
-            "followed", "following", "follows", "for", "former", "formerly", "forth", "four", "from", "further", 
-            "furthermore", "get", "gets", "getting", "given", "gives", "go", "goes", "going", "gone", "got", 
-            "gotten", "greetings", "had", "hadn't", "happens", "hardly", "has", "hasn't", "have", "haven't", 
-            "having", "he", "he's", "hello", "help", "hence", "her", "here", "here's", "hereafter", "hereby", 
-            "herein", "hereupon", "hers", "herself", "hi", "him", "himself", "his", "hither", "hopefully", "how", 
-            "howbeit", "however", "i'd", "i'll", "i'm", "i've", "ie", "if", "ignored", "immediate", "in", 
-            "inasmuch", "inc", "indeed", "indicate", "indicated", "indicates", "inner", "insofar", "instead", 
-            "into", "inward", "is", "isn't", "it", "it'd", "it'll", "it's", "its", "itself", "just", 
-            "keep", "keeps", "kept", "know", "known", "knows", "last", "lately", "later", "latter", "latterly", 
-            "least", "less", "lest", "let", "let's", "like", "liked", "likely", "little", "look", "looking", 
-            "looks", "ltd", "mainly", "many", "may", "maybe", "me", "mean", "meanwhile", "merely", "might", 
-            "more", "moreover", "most", "mostly", "much", "must", "my", "myself", "name", "namely", "nd", 
-            "near", "nearly", "necessary", "need", "needs", "neither", "never", "nevertheless", "new", "next", 
-            "nine", "no", "nobody", "non", "none", "noone", "nor", "normally", "not", "nothing", "novel", "now", 
-            "nowhere", "obviously", "of", "off", "often", "oh", "ok", "okay", "old", "on", "once", "one", 
-            "ones", "only", "onto", "or", "other", "others", "otherwise", "ought", "our", "ours", "ourselves", 
-            "out", "outside", "over", "overall", "own", "particular", "particularly", "per", "perhaps", 
-            "placed", "please", "plus", "possible", "presumably", "probably", "provides", "que", "quite", 
-            "qv", "rather", "rd", "re", "really", "reasonably", "regarding", "regardless", "regards", 
-            "relatively", "respectively", "right", "said", "same", "saw", "say", "saying", "says", "second", 
-            "secondly", "see", "seeing", "seem", "seemed", "seeming", "seems", "seen", "self", "selves", "sensible", 
-            "sent", "serious", "seriously", "seven", "several", "shall", "she", "should", "shouldn't", "since", 
-            "six", "so", "some", "somebody", "somehow", "someone", "something", "sometime", "sometimes", "somewhat", 
-            "somewhere", "soon", "sorry", "specified", "specify", "specifying", "still", "sub", "such", "sup", 
-            "sure", "t's", "take", "taken", "tell", "tends", "th", "than", "thank", "thanks", "thanx", 
-            "that", "that's", "thats", "the", "their", "theirs", "them", "themselves", "then", "thence", "there", 
-            "there's", "thereafter", "thereby", "therefore", "therein", "theres", "thereupon", "these", "they", 
-            "they'd", "they'll", "they're", "they've", "think", "third", "this", "thorough", "thoroughly", "those", 
-            "though", "three", "through", "throughout", "thru", "thus", "to", "together", "too", "took", "toward", 
-            "towards", "tried", "tries", "truly", "try", "trying", "twice", "two", "un", "under", "unfortunately", 
-            "unless", "unlikely", "until", "unto", "up", "upon", "us", "use", "used", "useful", "uses", "using", 
-            "usually", "uucp", "value", "various", "very", "via", "viz", "vs", "want", "wants", "was", 
-            "wasn't", "way", "we", "we'd", "we'll", "we're", "we've", "welcome", "well", "went", "were", "weren't", 
-            "what", "what's", "whatever", "when", "whence", "whenever", "where", "where's", "whereafter", "whereas", 
-            "whereby", "wherein", "whereupon", "wherever", "whether", "which", "while", "whither", "who", "who's", 
-            "whoever", "whole", "whom", "whose", "why", "will", "willing", "wish", "with", "within", "without", 
-            "won't", "wonder", "would", "wouldn't", "yes", "yet", "you", "you'd", "you'll", "you're", 
-            "you've", "your", "yours", "yourself", "yourselves", "zero"
-        ])
-        
-        # 合并NLTK基础停用词和额外的英文停用词
-        self.en_stopwords = base_en_stopwords.union(additional_en_stopwords)
-        
-        # 初始化中文停用词 - 先定义基础中文停用词，然后加载文件中的中文停用词
-        base_cn_stopwords = set([
-            '的', '了', '是', '在', '和', '有', '为', '对', '与', '不', 
-            '也', '就', '都', '很', '一个', '这个', '这些', '而', '上', 
-            '下', '中', '出', '等', '要', '以', '能', '会', '你', '我',
-            '他', '她', '它', '这', '那', '个', '们', '把', '但', '来',
-            '去', '说', '看', '将', '到', '着', '从', '并', '及', '或'
-        ])
-        
-        # 从文件加载中文停用词并合并
-        file_cn_stopwords = self._load_chinese_stopwords(STOPWORDS_PATH)
-        self.cn_stopwords = base_cn_stopwords.union(file_cn_stopwords)
-        
-        # 初始化jieba
+            nltk.data.find(path)
+            found = True
+        except LookupError:
+            logger.warning(f"NLTK resource '{package}' is not available, using fallback; "
+                           f"run `python -m nltk.downloader {package}` to install it")
+            found = False
+        _nltk_resources_checked[path] = found
+    return _nltk_resources_checked[path]
+
+
+def _initialize_jieba(cache_dir: Optional[str] = None):
+    """加载 jieba 前缀词典: cache_dir 中已有 jieba.cache 时直接读取 (marshal)，否则生成后写入该目录"""
+    global _jieba_initialized
+    with _jieba_lock:
+        if _jieba_initialized:
+            return
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            jieba.dt.tmp_dir = cache_dir
         jieba.initialize()
+        _jieba_initialized = True
 
-        print(f"--- [TextPreprocessor.__init__] Initializing TextPreprocessor ---")
-        print(f"--- [TextPreprocessor.__init__] English stopwords: {len(self.en_stopwords)} words (NLTK: {len(base_en_stopwords)}, Additional: {len(additional_en_stopwords)}) ---")
-        print(f"--- [TextPreprocessor.__init__] Chinese stopwords: {len(self.cn_stopwords)} words (Base: {len(base_cn_stopwords)}, File: {len(file_cn_stopwords)}) ---")
-        try:
-            list(jieba.cut("测试jieba加载"))
-            print("--- [TextPreprocessor.__init__] jieba loaded successfully. ---")
-        except Exception as e:
-            print(f"!!! [TextPreprocessor.__init__] Error loading jieba: {e}")
+
+def _split_english(text: str) -> List[str]:
+    """已去掉 ASCII 标点的英文文本的快速切分，与 nltk.word_tokenize 结果一致"""
+    if not text.isascii():
+        text = _NLTK_SPLIT_CHARS_RE.sub(r' \g<0> ', text)
+    if 'nn' in text or 'mm' in text or 'tt' in text:  # 所有缩写规则都包含 nn / mm / tt
+        text = _NLTK_CONTRACTIONS_RE.sub(_split_contraction, text)
+    return text.split()
+
+
+def _split_contraction(match) -> str:
+    parts = [part for part in match.groups() if part is not None]
+    return f" {parts[0]} {parts[1]} "
+
+
+# 额外的 570 个英文停用词，但排除单个字母 (与 NLTK 基础停用词合并使用)
+ADDITIONAL_EN_STOPWORDS = frozenset([
+    "a's", "able", "about", "above", "according", "accordingly", "across", "actually", "after", 
+    "afterwards", "again", "against", "ain't", "all", "allow", "allows", "almost", "alone", "along", 
+    "already", "also", "although", "always", "am", "among", "amongst", "an", "and", "another", "any", 
+    "anybody", "anyhow", "anyone", "anything", "anyway", "anyways", "anywhere", "apart", "appear", 
+    "appreciate", "appropriate", "are", "aren't", "around", "as", "aside", "ask", "asking", "associated", 
+    "at", "available", "away", "awfully", "be", "became", "because", "become", "becomes", "becoming", 
+    "been", "before", "beforehand", "behind", "being", "believe", "below", "beside", "besides", "best", 
+    "better", "between", "beyond", "both", "brief", "but", "by", "c'mon", "c's", "came", "can", 
+    "can't", "cannot", "cant", "cause", "causes", "certain", "certainly", "changes", "clearly", "co", 
+    "com", "come", "comes", "concerning", "consequently", "consider", "considering", "contain", "containing", 
+    "contains", "corresponding", "could", "couldn't", "course", "currently", "definitely", "described", 
+    "despite", "did", "didn't", "different", "do", "does", "doesn't", "doing", "don't", "done", "down", 
+    "downwards", "during", "each", "edu", "eg", "eight", "either", "else", "elsewhere", "enough", 
+    "entirely", "especially", "et", "etc", "even", "ever", "every", "everybody", "everyone", "everything", 
+    "everywhere", "ex", "exactly", "example", "except", "far", "few", "fifth", "first", "five", 
+    "followed", "following", "follows", "for", "former", "formerly", "forth", "four", "from", "further", 
+    "furthermore", "get", "gets", "getting", "given", "gives", "go", "goes", "going", "gone", "got", 
+    "gotten", "greetings", "had", "hadn't", "happens", "hardly", "has", "hasn't", "have", "haven't", 
+    "having", "he", "he's", "hello", "help", "hence", "her", "here", "here's", "hereafter", "hereby", 
+    "herein", "hereupon", "hers", "herself", "hi", "him", "himself", "his", "hither", "hopefully", "how", 
+    "howbeit", "however", "i'd", "i'll", "i'm", "i've", "ie", "if", "ignored", "immediate", "in", 
+    "inasmuch", "inc", "indeed", "indicate", "indicated", "indicates", "inner", "insofar", "instead", 
+    "into", "inward", "is", "isn't", "it", "it'd", "it'll", "it's", "its", "itself", "just", 
+    "keep", "keeps", "kept", "know", "known", "knows", "last", "lately", "later", "latter", "latterly", 
+    "least", "less", "lest", "let", "let's", "like", "liked", "likely", "little", "look", "looking", 
+    "looks", "ltd", "mainly", "many", "may", "maybe", "me", "mean", "meanwhile", "merely", "might", 
+    "more", "moreover", "most", "mostly", "much", "must", "my", "myself", "name", "namely", "nd", 
+    "near", "nearly", "necessary", "need", "needs", "neither", "never", "nevertheless", "new", "next", 
+    "nine", "no", "nobody", "non", "none", "noone", "nor", "normally", "not", "nothing", "novel", "now", 
+    "nowhere", "obviously", "of", "off", "often", "oh", "ok", "okay", "old", "on", "once", "one", 
+    "ones", "only", "onto", "or", "other", "others", "otherwise", "ought", "our", "ours", "ourselves", 
+    "out", "outside", "over", "overall", "own", "particular", "particularly", "per", "perhaps", 
+    "placed", "please", "plus", "possible", "presumably", "probably", "provides", "que", "quite", 
+    "qv", "rather", "rd", "re", "really", "reasonably", "regarding", "regardless", "regards", 
+    "relatively", "respectively", "right", "said", "same", "saw", "say", "saying", "says", "second", 
+    "secondly", "see", "seeing", "seem", "seemed", "seeming", "seems", "seen", "self", "selves", "sensible", 
+    "sent", "serious", "seriously", "seven", "several", "shall", "she", "should", "shouldn't", "since", 
+    "six", "so", "some", "somebody", "somehow", "someone", "something", "sometime", "sometimes", "somewhat", 
+    "somewhere", "soon", "sorry", "specified", "specify", "specifying", "still", "sub", "such", "sup", 
+    "sure", "t's", "take", "taken", "tell", "tends", "th", "than", "thank", "thanks", "thanx", 
+    "that", "that's", "thats", "the", "their", "theirs", "them", "themselves", "then", "thence", "there", 
+    "there's", "thereafter", "thereby", "therefore", "therein", "theres", "thereupon", "these", "they", 
+    "they'd", "they'll", "they're", "they've", "think", "third", "this", "thorough", "thoroughly", "those", 
+    "though", "three", "through", "throughout", "thru", "thus", "to", "together", "too", "took", "toward", 
+    "towards", "tried", "tries", "truly", "try", "trying", "twice", "two", "un", "under", "unfortunately", 
+    "unless", "unlikely", "until", "unto", "up", "upon", "us", "use", "used", "useful", "uses", "using", 
+    "usually", "uucp", "value", "various", "very", "via", "viz", "vs", "want", "wants", "was", 
+    "wasn't", "way", "we", "we'd", "we'll", "we're", "we've", "welcome", "well", "went", "were", "weren't", 
+    "what", "what's", "whatever", "when", "whence", "whenever", "where", "where's", "whereafter", "whereas", 
+    "whereby", "wherein", "whereupon", "wherever", "whether", "which", "while", "whither", "who", "who's", 
+    "whoever", "whole", "whom", "whose", "why", "will", "willing", "wish", "with", "within", "without", 
+    "won't", "wonder", "would", "wouldn't", "yes", "yet", "you", "you'd", "you'll", "you're", 
+    "you've", "your", "yours", "yourself", "yourselves", "zero"
+])
+
+# 基础中文停用词 (与 stopwords.txt 合并使用)
+BASE_CN_STOPWORDS = frozenset([
+    '的', '了', '是', '在', '和', '有', '为', '对', '与', '不', 
+    '也', '就', '都', '很', '一个', '这个', '这些', '而', '上', 
+    '下', '中', '出', '等', '要', '以', '能', '会', '你', '我',
+    '他', '她', '它', '这', '那', '个', '们', '把', '但', '来',
+    '去', '说', '看', '将', '到', '着', '从', '并', '及', '或'
+])
+
+
+class TextPreprocessor:
+    # 分词规则或停用词表发生变化时递增, 使磁盘上缓存的 BM25 索引失效
+    TOKENIZER_VERSION = 1
+
+    def __init__(self, fast: bool = True, cache_size: int = 4096, cache_max_length: int = 256,
+                 jieba_cache_dir: Optional[str] = None):
+        """
+        构造时不加载任何资源; 服务中请使用 get_preprocessor() 获取进程内共享的实例。
+
+        :param fast: 使用预编译规则的快速分词路径 (输出与原实现一致，TOKENIZER_VERSION 不变); False 时使用原实现
+        :param cache_size: 分词结果 LRU 缓存的条数 (查询等重复出现的短文本)，0 表示不缓存
+        :param cache_max_length: 只缓存不超过该长度的文本，语料中的长文档不进入缓存
+        :param jieba_cache_dir: jieba 前缀词典缓存 (jieba.cache) 所在目录，默认为系统临时目录
+        """
+        self.fast = fast
+        self.cache_size = cache_size
+        self.cache_max_length = cache_max_length
+        self._cache = OrderedDict()
+        self._cache_lock = Lock()
+        self.jieba_cache_dir = jieba_cache_dir
+        # 停用词 / jieba 词典在第一次分词时才加载 (见 _ensure_loaded)
+        self._load_lock = Lock()
+        self._loaded = False
+        self.en_stopwords = frozenset()
+        self.cn_stopwords = frozenset()
+        self._fast_english = False
+        self._word_tokenize = nltk.word_tokenize
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self._load_resources()
+                self._loaded = True
+
+    def _load_resources(self):
+        print(f"--- [TextPreprocessor._load_resources] Initializing TextPreprocessor ---")
+        # 初始化英文停用词 - NLTK基础停用词 + 额外的570个词
+        base_en_stopwords = set(stopwords.words('english')) if _ensure_nltk_resource('corpora/stopwords', 'stopwords') else set()
+        self.en_stopwords = frozenset(base_en_stopwords.union(ADDITIONAL_EN_STOPWORDS))
+
+        # 初始化中文停用词 - 基础中文停用词 + 文件中的中文停用词
+        file_cn_stopwords = self._load_chinese_stopwords(STOPWORDS_PATH)
+        self.cn_stopwords = frozenset(BASE_CN_STOPWORDS.union(file_cn_stopwords))
+
+        _initialize_jieba(self.jieba_cache_dir)
+        self._fast_english = self.fast and self._check_fast_english()
+        if not self._fast_english:
+            # 原实现 / 回退路径使用 nltk.word_tokenize，需要 punkt 分句模型; 缺失时不分句，直接按 Treebank 规则切分
+            if not _ensure_nltk_resource('tokenizers/punkt_tab/english/', 'punkt_tab'):
+                self._word_tokenize = nltk.tokenize.NLTKWordTokenizer().tokenize
+
+        print(f"--- [TextPreprocessor._load_resources] English stopwords: {len(self.en_stopwords)} words (NLTK: {len(base_en_stopwords)}, Additional: {len(ADDITIONAL_EN_STOPWORDS)}) ---")
+        print(f"--- [TextPreprocessor._load_resources] Chinese stopwords: {len(self.cn_stopwords)} words (Base: {len(BASE_CN_STOPWORDS)}, File: {len(file_cn_stopwords)}) ---")
 
     def _load_chinese_stopwords(self, filepath):
         """从文件加载中文停用词列表"""
@@ -128,6 +266,18 @@ class TextPreprocessor:
         """从文件加载停用词列表 - 已弃用，保留兼容性"""
         return self._load_chinese_stopwords(filepath)
 
+    def _check_fast_english(self) -> bool:
+        try:
+            treebank = nltk.tokenize.NLTKWordTokenizer()
+            for probe in _NLTK_PROBES:
+                if _split_english(probe) != treebank.tokenize(probe):
+                    print("--- [TextPreprocessor._check_fast_english] 快速英文切分与当前 nltk 版本不一致，回退到 nltk.word_tokenize ---")
+                    return False
+        except Exception as e:
+            print(f"!!! [TextPreprocessor._check_fast_english] 无法校验快速英文切分, 回退到 nltk.word_tokenize: {e}")
+            return False
+        return True
+
     def preprocess_text(self, text: str) -> str:
         """
         对中英文混合文本进行预处理
@@ -136,10 +286,54 @@ class TextPreprocessor:
             text: 输入的文本字符串
             
         Returns:
-            处理后的文本字符串
+            处理后的文本字符串 (即 tokenize() 的结果用空格拼接)
         """
+        if not self.fast:
+            return self._preprocess_text_legacy(text)
+        return " ".join(self.tokenize(text))
+
+    def tokenize(self, text: str) -> List[str]:
+        """返回分词 + 去停用词后的词列表 (与 preprocess_text().split() 相同)"""
+        if not text or not isinstance(text, str):
+            return []
+        if not self.fast:
+            return self._preprocess_text_legacy(text).split()
+        self._ensure_loaded()
+        if not self.cache_size or len(text) > self.cache_max_length:
+            return list(self._tokenize(text))
+        with self._cache_lock:
+            tokens = self._cache.get(text)
+            if tokens is not None:
+                self._cache.move_to_end(text)
+                return list(tokens)
+        tokens = self._tokenize(text)
+        with self._cache_lock:
+            self._cache[text] = tokens
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(tokens)
+
+    def _tokenize(self, text: str) -> tuple:
+        text = text.lower().translate(_PUNCTUATION_TABLE)
+        if _CJK_RE.search(text) is None:
+            words = _split_english(text) if self._fast_english else self._word_tokenize(text)
+            en_stopwords = self.en_stopwords
+            return tuple(word for word in words if len(word) > 1 and word not in en_stopwords and not word.isspace())
+
+        en_stopwords, cn_stopwords, cjk_search = self.en_stopwords, self.cn_stopwords, _CJK_RE.search
+        tokens = []
+        for word in jieba.cut(text):
+            if len(word) <= 1 or word.isspace():
+                continue
+            if word not in (cn_stopwords if cjk_search(word) else en_stopwords):
+                tokens.append(word)
+        return tuple(tokens)
+
+    def _preprocess_text_legacy(self, text: str) -> str:
+        """原实现 (fast=False 以及 benchmark_tokenizer 对比时使用)"""
         if not text or not isinstance(text, str):
             return ""
+        self._ensure_loaded()
             
         # 1. 基础清洗
         # 转小写、移除标点符号
@@ -174,7 +368,7 @@ class TextPreprocessor:
             words = filtered_words
         else:
             # 纯英文文本使用nltk分词
-            words = nltk.word_tokenize(text)
+            words = self._word_tokenize(text)
             # 去除停用词(英文)
             words = [word for word in words 
                     if word.strip() 
@@ -189,6 +383,45 @@ class TextPreprocessor:
         # 4. 拼接结果
         return " ".join(words)
 
-    def process_batch(self, texts: list) -> list:
-        """批量处理文本"""
-        return [self.preprocess_text(text) for text in texts]
+    def process_batch(self, texts: list, workers: Optional[int] = None, min_parallel: int = PARALLEL_MIN_TEXTS) -> list:
+        """
+        批量处理文本，结果与逐条调用 preprocess_text 相同。
+        文本数不少于 min_parallel 且 workers > 1 时分片交给多个进程处理 (见 iter_batch)。
+        """
+        return list(self.iter_batch(texts, workers=workers, min_parallel=min_parallel))
+
+    def iter_batch(self, texts: list, workers: Optional[int] = None, min_parallel: int = PARALLEL_MIN_TEXTS,
+                   chunk_size: int = PARALLEL_CHUNK_SIZE) -> Iterator[str]:
+        """
+        按原顺序逐条产出 preprocess_text 的结果。
+        并行时语料按 chunk_size 分片，同时在途的分片不超过 workers * 2 个 (内存有界)，按提交顺序取回结果;
+        进程池出错时剩余文本回退为串行处理。
+        """
+        workers = default_workers() if workers is None else workers
+        if workers <= 1 or len(texts) < max(min_parallel, chunk_size * 2):
+            for text in texts:
+                yield self.preprocess_text(text)
+            return
+
+        print(f"--- [TextPreprocessor.iter_batch] 使用 {workers} 个进程并行分词 {len(texts)} 个文本 ---")
+        done = 0  # 已产出的文本数
+        try:
+            # 与 embedding worker pool 一致使用 spawn (父进程中可能已有 torch / 数据库连接等线程状态)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(self.fast, self.jieba_cache_dir)) as executor:
+                pending = deque()
+                next_start = 0
+                while next_start < len(texts) or pending:
+                    while next_start < len(texts) and len(pending) < workers * 2:
+                        pending.append(executor.submit(_preprocess_chunk, texts[next_start:next_start + chunk_size]))
+                        next_start += chunk_size
+                    for result in pending.popleft().result():
+                        yield result
+                        done += 1
+        except Exception as e:
+            logger.warning(f"并行分词失败，剩余 {len(texts) - done} 个文本改为串行处理: {str(e)}")
+            for text in texts[done:]:
+                yield self.preprocess_text(text)
+
+    def tokenize_batch(self, texts: list) -> List[List[str]]:
+        return [self.tokenize(text) for text in texts]
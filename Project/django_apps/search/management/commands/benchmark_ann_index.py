@@ -0,0 +1,137 @@
+"""
+对比近似最近邻索引 (IVF-Flat / IVF-PQ / HNSW / SQ8) 与 flat 精确索引的召回率和延迟。
+查询来自 index_service/test_data_{platform}.json，以 flat 索引的 top-k 作为标准答案。
+
+示例:
+    python manage.py benchmark_ann_index --source reddit
+    python manage.py benchmark_ann_index --source rednote --index-types hnsw --ef-search 32 64 128
+    python manage.py benchmark_ann_index --source reddit --index-types hnsw --apply   # 将 hnsw 写回磁盘索引
+"""
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from django_apps.search.index_service import index_factory
+from django_apps.search.index_service.faiss_manager import FaissManager
+from django_apps.search.utils import get_embeddings
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'index_service')
+
+
+class Command(BaseCommand):
+    help = 'Report recall@k / latency of ANN index types against the flat FAISS index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', type=str, default='reddit', help='Platform (reddit, stackoverflow, rednote)')
+        parser.add_argument('--index-types', nargs='+', default=['ivf_flat', 'ivf_pq', 'hnsw', 'sq8'],
+                            choices=[t for t in index_factory.INDEX_TYPES if t != 'flat'])
+        parser.add_argument('--k', type=int, default=10, help='Top-k used for recall')
+        parser.add_argument('--nprobe', nargs='+', type=int, default=[1, 4, 16, 64], help='nprobe values for IVF indexes')
+        parser.add_argument('--ef-search', nargs='+', type=int, default=[16, 64, 128, 256], help='efSearch values for HNSW')
+        parser.add_argument('--nlist', type=int, default=None, help='IVF list count (default: derived from index size)')
+        parser.add_argument('--pq-m', type=int, default=64, help='IVF-PQ sub-quantizer count')
+        parser.add_argument('--apply', action='store_true',
+                            help='Migrate the on-disk index to the (single) given index type after benchmarking')
+
+    def handle(self, *args, **options):
+        platform = options['source'].lower()
+        k = options['k']
+
+        embedding_model = get_embeddings()
+        manager = FaissManager(embedding_model, platform=platform)
+        if not manager.load_index() or manager.faiss_store.index.ntotal == 0:
+            raise CommandError(f"No index found for platform {platform}")
+        if manager.index_type != 'flat':
+            self.stdout.write(self.style.WARNING(
+                f"Index for {platform} is already {manager.index_type}; ground truth is computed from reconstructed vectors"
+            ))
+
+        vectors = index_factory.reconstruct_all(manager.faiss_store.index)
+        queries = self._load_queries(platform)
+        query_vectors = np.asarray(embedding_model.embed_documents(queries), dtype=np.float32)
+        self.stdout.write(f"Platform {platform}: {len(vectors)} vectors (dim={vectors.shape[1]}), {len(queries)} queries, k={k}\n")
+
+        flat_index, _ = index_factory.build_trained_index('flat', vectors)
+        _, ground_truth = flat_index.search(query_vectors, k)
+        flat_latency = self._measure_latency(flat_index, query_vectors, k)
+        self._report('flat', {}, 1.0, flat_latency, flat_index)
+
+        for index_type in options['index_types']:
+            params = {}
+            if index_type in ('ivf_flat', 'ivf_pq') and options['nlist']:
+                params['nlist'] = options['nlist']
+            if index_type == 'ivf_pq':
+                params['m'] = options['pq_m']
+            start = time.perf_counter()
+            try:
+                index, resolved = index_factory.build_trained_index(index_type, vectors, params)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{index_type}: build failed: {e}"))
+                continue
+            self.stdout.write(f"\n{index_type}: built in {time.perf_counter() - start:.2f}s")
+
+            for search_params in self._search_param_grid(index_type, options):
+                resolved.update(search_params)
+                index_factory.apply_search_params(index, index_type, resolved)
+                _, ids = index.search(query_vectors, k)
+                recall = self._recall(ids, ground_truth)
+                latency = self._measure_latency(index, query_vectors, k)
+                self._report(index_type, search_params, recall, latency, index)
+
+        if options['apply']:
+            if len(options['index_types']) != 1:
+                raise CommandError("--apply requires exactly one --index-types value")
+            index_type = options['index_types'][0]
+            params = {'nlist': options['nlist']} if options['nlist'] and index_type.startswith('ivf') else {}
+            if index_type == 'ivf_pq':
+                params['m'] = options['pq_m']
+            resolved = manager.migrate_index(index_type, params)
+            self.stdout.write(self.style.SUCCESS(f"\nMigrated {platform} index to {index_type} with params {resolved}"))
+
+    @staticmethod
+    def _load_queries(platform):
+        path = os.path.join(TEST_DATA_DIR, f"test_data_{platform}.json")
+        if not os.path.exists(path):
+            raise CommandError(f"Test data not found: {path}")
+        with open(path, "r", encoding="utf-8") as f:
+            return [item["query"] for item in json.load(f)]
+
+    @staticmethod
+    def _search_param_grid(index_type, options):
+        if index_type in ('ivf_flat', 'ivf_pq'):
+            return [{'nprobe': nprobe} for nprobe in options['nprobe']]
+        if index_type == 'hnsw':
+            return [{'ef_search': ef} for ef in options['ef_search']]
+        return [{}]
+
+    @staticmethod
+    def _recall(ids, ground_truth):
+        hits = 0
+        total = 0
+        for found, expected in zip(ids, ground_truth):
+            expected = set(expected[expected >= 0].tolist())
+            hits += len(expected.intersection(found[found >= 0].tolist()))
+            total += len(expected)
+        return hits / total if total else 0.0
+
+    @staticmethod
+    def _measure_latency(index, query_vectors, k):
+        """逐条查询计时 (与线上一次一个查询的方式一致)，返回毫秒列表"""
+        latencies = []
+        for row in range(len(query_vectors)):
+            start = time.perf_counter()
+            index.search(query_vectors[row:row + 1], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return np.asarray(latencies)
+
+    def _report(self, index_type, search_params, recall, latencies, index):
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+        params = ", ".join(f"{key}={value}" for key, value in search_params.items()) or "-"
+        self.stdout.write(
+            f"  {index_type:<9} {params:<16} recall@k={recall:.4f}  "
+            f"latency mean={latencies.mean():.3f}ms p95={np.percentile(latencies, 95):.3f}ms  size={size_mb:.1f}MB"
+        )
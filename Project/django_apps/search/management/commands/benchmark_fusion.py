@@ -0,0 +1,141 @@
+"""
+HybridRetriever 融合阶段的微基准: 旧的逐条 Python 实现 vs 向量化实现。
+使用合成的 BM25 / 向量检索候选 (默认 200 + 200)，不需要加载索引或模型。
+
+示例:
+    python manage.py benchmark_fusion
+    python manage.py benchmark_fusion --candidates 400 --repeat 2000
+"""
+import math
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from django_apps.search.index_service.hybrid_retriever import HybridRetriever
+
+
+def legacy_normalize(scores):
+    """retrieve 中原有的逐条归一化实现 (仅用于对比)"""
+    if not scores:
+        return []
+    valid_scores = [s for s in scores if s != float('inf') and s is not None]
+    if not valid_scores:
+        return [0.0] * len(scores)
+    min_score = min(valid_scores)
+    max_score = max(valid_scores)
+    if max_score - min_score < 1e-9:
+        return [0.5 if max_score != 0 else 0.0] * len(scores)
+    normalized_scores = []
+    for score in scores:
+        if score == float('inf') or score is None:
+            normalized_scores.append(0.0)
+        else:
+            clamped_score = max(min_score, min(score, max_score))
+            normalized_scores.append((clamped_score - min_score) / (max_score - min_score))
+    return normalized_scores
+
+
+def legacy_l2_decay(l2_distances, beta):
+    normalized_scores = []
+    for l2 in l2_distances:
+        score = 0.0
+        try:
+            if isinstance(l2, (int, float, np.number)) and not math.isinf(l2) and not math.isnan(l2) and l2 >= 0:
+                exponent_arg = -beta * float(l2) ** 2
+                score = 0.0 if exponent_arg > 709 else max(0.0, min(math.exp(exponent_arg), 1.0))
+        except (ValueError, OverflowError):
+            score = 0.0
+        normalized_scores.append(score)
+    return normalized_scores
+
+
+def legacy_fusion(retriever, bm25_hits, embedding_hits, votes, top_k, threshold):
+    """原 retrieve 的合并 / 归一化 / 打分 / 排序流程，返回排序后的行号列表"""
+    all_docs = {}
+    for row, score in bm25_hits:
+        all_docs[row] = {'bm25_score': score, 'embedding_score': float('inf'), 'vote_score': votes[row]}
+    for row, l2 in embedding_hits:
+        valid_l2 = l2 if not math.isinf(l2) and not math.isnan(l2) and l2 >= 0 else None
+        if row in all_docs:
+            if valid_l2 is not None:
+                all_docs[row]['embedding_score'] = valid_l2
+        else:
+            all_docs[row] = {'bm25_score': 0.0, 'embedding_score': valid_l2 if valid_l2 is not None else float('inf'),
+                             'vote_score': votes[row]}
+    rows = list(all_docs.keys())
+    bm25_normalized = legacy_normalize([all_docs[r]['bm25_score'] for r in rows])
+    embedding_normalized = legacy_l2_decay([all_docs[r]['embedding_score'] for r in rows], retriever.l2_decay_beta)
+    vote_normalized = legacy_normalize([all_docs[r]['vote_score'] for r in rows])
+    final_docs_data = []
+    for i, row in enumerate(rows):
+        combined_score = (
+            embedding_normalized[i] * retriever.embedding_weight +
+            bm25_normalized[i] * retriever.bm25_weight +
+            vote_normalized[i] * retriever.vote_weight
+        )
+        if combined_score >= threshold:
+            final_docs_data.append((row, combined_score))
+    final_docs_data.sort(key=lambda x: x[1], reverse=True)
+    return [row for row, _ in final_docs_data[:top_k]]
+
+
+def vectorized_fusion(retriever, bm25_rows, bm25_scores, embedding_rows, embedding_l2, votes, top_k, threshold):
+    rows, fused_bm25, fused_l2 = retriever.fuse_rows(bm25_rows, bm25_scores, embedding_rows, embedding_l2)
+    combined, _, _, _ = retriever.fuse_scores(fused_bm25, fused_l2, votes[rows])
+    top_slots, _ = retriever.select_top_k(combined, top_k, threshold)
+    return rows[top_slots]
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark of HybridRetriever score fusion: per-item Python vs NumPy'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=200, help='Candidates per engine (BM25 and FAISS)')
+        parser.add_argument('--corpus-size', type=int, default=10000)
+        parser.add_argument('--overlap', type=float, default=0.3, help='Fraction of FAISS hits also found by BM25')
+        parser.add_argument('--top-k', type=int, default=80)
+        parser.add_argument('--threshold', type=float, default=0.1)
+        parser.add_argument('--repeat', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        n = options['candidates']
+        top_k, threshold = options['top_k'], options['threshold']
+        retriever = HybridRetriever(None, None, bm25_weight=0.55, embedding_weight=0.35, vote_weight=0.1, l2_decay_beta=4.0)
+        votes = rng.integers(0, 5000, size=options['corpus_size']).astype(np.float64)
+
+        trials = []
+        for _ in range(options['repeat']):
+            bm25_rows = rng.choice(options['corpus_size'], size=n, replace=False)
+            bm25_scores = np.sort(rng.gamma(2.0, 3.0, size=n))[::-1]
+            shared = bm25_rows[:int(n * options['overlap'])]
+            others = np.setdiff1d(np.arange(options['corpus_size']), bm25_rows)
+            embedding_rows = np.concatenate([shared, rng.choice(others, size=n - len(shared), replace=False)])
+            rng.shuffle(embedding_rows)
+            embedding_l2 = np.sort(rng.uniform(0.2, 1.4, size=n))
+            trials.append((bm25_rows, bm25_scores, embedding_rows, embedding_l2))
+
+        legacy_times, vector_times, mismatches = [], [], 0
+        for bm25_rows, bm25_scores, embedding_rows, embedding_l2 in trials:
+            bm25_hits = list(zip(bm25_rows.tolist(), bm25_scores.tolist()))
+            embedding_hits = list(zip(embedding_rows.tolist(), embedding_l2.tolist()))
+            start = time.perf_counter()
+            legacy = legacy_fusion(retriever, bm25_hits, embedding_hits, votes, top_k, threshold)
+            legacy_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            vectorized = vectorized_fusion(retriever, bm25_rows, bm25_scores, embedding_rows, embedding_l2,
+                                           votes, top_k, threshold)
+            vector_times.append(time.perf_counter() - start)
+            mismatches += legacy != vectorized.tolist()
+
+        legacy_us = np.median(legacy_times) * 1e6
+        vector_us = np.median(vector_times) * 1e6
+        self.stdout.write(f"{n}+{n} candidates, top_k={top_k}, threshold={threshold}, {len(trials)} trials")
+        self.stdout.write(f"  legacy (per-item Python): median {legacy_us:.1f} us")
+        self.stdout.write(f"  vectorized (NumPy):       median {vector_us:.1f} us")
+        self.stdout.write(f"  speedup: {legacy_us / vector_us:.1f}x")
+        style = self.style.SUCCESS if mismatches == 0 else self.style.ERROR
+        self.stdout.write(style(f"  ordering mismatches: {mismatches}/{len(trials)}"))
@@ -0,0 +1,94 @@
+"""
+TextPreprocessor 分词基准: 原实现 vs 快速路径 (不缓存 / LRU 缓存)，并逐条检查输出是否一致。
+文本来自 index_service/test_data_rednote.json 与 test_data_reddit.json 的查询，
+以及数据库中 Reddit / Rednote 内容的前 N 条 (模拟 BM25 建索引时的语料)。
+
+示例:
+    python manage.py benchmark_tokenizer
+    python manage.py benchmark_tokenizer --documents 5000 --repeat 5
+"""
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_apps.search.index_service.text_preprocessor import TextPreprocessor
+from django_apps.search.models import RedditContent, RednoteContent
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'index_service')
+TEST_DATA_FILES = ('test_data_rednote.json', 'test_data_reddit.json')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the fast TextPreprocessor tokenizer path against the original implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=2000,
+                            help='Number of Reddit and Rednote documents to load from the database (per platform)')
+        parser.add_argument('--repeat', type=int, default=3, help='Passes over the corpus per mode')
+        parser.add_argument('--query-repeat', type=int, default=50,
+                            help='Passes over the test queries (repeated queries exercise the LRU cache)')
+
+    def handle(self, *args, **options):
+        queries = self._load_queries()
+        documents = self._load_documents(options['documents'])
+        if not queries and not documents:
+            raise CommandError("No test queries or documents found")
+        self.stdout.write(f"{len(queries)} queries, {len(documents)} documents\n")
+
+        legacy = TextPreprocessor(fast=False)
+        fast = TextPreprocessor(cache_size=0)
+        cached = TextPreprocessor()
+
+        mismatches = [text for text in queries + documents if legacy.preprocess_text(text) != fast.preprocess_text(text)]
+        if mismatches:
+            for text in mismatches[:5]:
+                self.stdout.write(f"  mismatch: {text[:120]!r}")
+            raise CommandError(f"Fast tokenizer output differs from the original for {len(mismatches)} texts")
+        self.stdout.write(self.style.SUCCESS("Fast tokenizer output matches the original for every text"))
+
+        for label, texts, repeat in (('documents', documents, options['repeat']),
+                                     ('queries', queries, options['query_repeat'])):
+            if not texts:
+                continue
+            results = {
+                'original': self._time(legacy.preprocess_text, texts, repeat),
+                'fast': self._time(fast.tokenize, texts, repeat),
+                'fast+cache': self._time(cached.tokenize, texts, repeat),
+            }
+            baseline = results['original']
+            self.stdout.write(f"\n{label} ({len(texts)} texts x {repeat}):")
+            for name, seconds in results.items():
+                self.stdout.write(
+                    f"  {name:<11} {len(texts) * repeat / seconds:>10.0f} texts/s  speedup={baseline / seconds:.2f}x"
+                )
+
+    @staticmethod
+    def _time(fn, texts, repeat):
+        fn(texts[0])  # 预热 (jieba 词典等)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                fn(text)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _load_queries():
+        queries = []
+        for name in TEST_DATA_FILES:
+            path = os.path.join(TEST_DATA_DIR, name)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    queries.extend(item["query"] for item in json.load(f))
+        return queries
+
+    @staticmethod
+    def _load_documents(limit):
+        documents = []
+        for model in (RedditContent, RednoteContent):
+            for title, content in model.objects.values_list('thread_title', 'content')[:limit]:
+                text = f"{title or ''} {content or ''}".strip()
+                if text:
+                    documents.append(text)
+        return documents
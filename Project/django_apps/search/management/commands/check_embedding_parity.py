@@ -0,0 +1,101 @@
+"""
+对比 ONNX 后端与 torch 后端的 embedding: 逐条余弦相似度、检索 top-k 重合率与 CPU 吞吐。
+文本来自 index_service/test_data_{platform}.json 的查询以及该平台索引中的前 N 篇文档。
+
+示例:
+    python manage.py check_embedding_parity --source reddit
+    python manage.py check_embedding_parity --source rednote --quantized --min-cosine 0.98
+"""
+import json
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from django_apps.search.index_service.faiss_manager import FaissManager
+from django_apps.search.utils import get_embeddings
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'index_service')
+
+
+class Command(BaseCommand):
+    help = 'Check that the ONNX embedding backend reproduces the torch backend vector space'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', type=str, default='reddit', help='Platform (reddit, stackoverflow, rednote)')
+        parser.add_argument('--onnx-path', type=str, default=None,
+                            help='Exported ONNX model directory (default: settings.EMBEDDING_ONNX_MODEL_PATH)')
+        parser.add_argument('--quantized', action='store_true', help='Check the int8 quantized model')
+        parser.add_argument('--documents', type=int, default=200, help='Number of indexed documents to embed')
+        parser.add_argument('--k', type=int, default=10, help='Top-k used for retrieval overlap')
+        parser.add_argument('--min-cosine', type=float, default=0.99,
+                            help='Fail when any text falls below this cosine similarity')
+
+    def handle(self, *args, **options):
+        platform = options['source'].lower()
+        onnx_path = options['onnx_path'] or getattr(settings, 'EMBEDDING_ONNX_MODEL_PATH', None)
+
+        torch_model = get_embeddings(backend='torch')
+        onnx_model = get_embeddings(backend='onnx', onnx_model_path=onnx_path, onnx_quantized=options['quantized'])
+
+        manager = FaissManager(torch_model, platform=platform)
+        has_index = manager.load_index() and manager.faiss_store.index.ntotal > 0
+        queries = self._load_queries(platform)
+        documents = []
+        if has_index:
+            for doc in manager.iter_documents():
+                if len(documents) >= options['documents']:
+                    break
+                if doc is not None and doc.page_content:
+                    documents.append(doc.page_content[:512])
+        texts = queries + documents
+        if not texts:
+            raise CommandError(f"No queries or documents found for platform {platform}")
+        self.stdout.write(f"Embedding {len(queries)} queries and {len(documents)} documents with both backends\n")
+
+        torch_vectors, torch_seconds = self._embed(torch_model, texts)
+        onnx_vectors, onnx_seconds = self._embed(onnx_model, texts)
+        cosine = np.sum(torch_vectors * onnx_vectors, axis=1) / np.maximum(
+            np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1), 1e-12
+        )
+        self.stdout.write(
+            f"cosine similarity: min={cosine.min():.5f} p1={np.percentile(cosine, 1):.5f} mean={cosine.mean():.5f}"
+        )
+        self.stdout.write(
+            f"throughput: torch={len(texts) / torch_seconds:.1f} texts/s  onnx={len(texts) / onnx_seconds:.1f} texts/s  "
+            f"speedup={torch_seconds / onnx_seconds:.2f}x"
+        )
+
+        if has_index and queries:
+            k = options['k']
+            _, torch_rows = manager.faiss_store.index.search(torch_vectors[:len(queries)], k)
+            _, onnx_rows = manager.faiss_store.index.search(onnx_vectors[:len(queries)], k)
+            overlap = np.mean([
+                len(set(a[a >= 0].tolist()) & set(b[b >= 0].tolist())) / max(1, len(a[a >= 0]))
+                for a, b in zip(torch_rows, onnx_rows)
+            ])
+            self.stdout.write(f"retrieval overlap@{k} on the {platform} index: {overlap:.4f}")
+
+        if cosine.min() < options['min_cosine']:
+            raise CommandError(
+                f"ONNX embeddings diverge from torch: min cosine {cosine.min():.5f} < {options['min_cosine']}"
+            )
+        self.stdout.write(self.style.SUCCESS("ONNX backend matches the torch vector space"))
+
+    @staticmethod
+    def _load_queries(platform):
+        path = os.path.join(TEST_DATA_DIR, f"test_data_{platform}.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return [item["query"] for item in json.load(f)]
+
+    @staticmethod
+    def _embed(model, texts):
+        # 先预热一次，避免把首次推理的初始化开销算进吞吐
+        model.embed_documents(texts[:1])
+        start = time.perf_counter()
+        vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+        return vectors, time.perf_counter() - start
@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.http import HttpRequest, QueryDict
-from django_apps.search.views import index_content
+from django_apps.search.views import index_content, run_incremental_indexing
 from django_apps.search.index_service.base import IndexService
+from django_apps.search.index_service.embedding_pool import EmbeddingWorkerPool
 import os
 import logging
 
@@ -13,6 +14,12 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--source', type=str, help='Specify source platform (reddit, stackoverflow, rednote)')
         parser.add_argument('--initialize', action='store_true', help='Initialize new empty index if not exists')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='Embed with N worker processes (each loads its own model copy); 0 = in-process')
+        parser.add_argument('--threads-per-worker', type=int, default=None,
+                            help='Torch threads per worker process (default: CPU count / workers)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Items indexed per chunk when using --workers (default: max(128, 64 * workers))')
 
     def handle(self, *args, **options):
         source = options.get('source')
@@ -41,6 +48,20 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(f'Initialization completed for {source}'))
             return
         
+        # 多进程 embedding: 直接调用增量索引流程, 整个回填期间复用同一个 worker pool
+        workers = options.get('workers') or 0
+        if workers > 0:
+            platforms = [source] if source else ['reddit', 'stackoverflow', 'rednote']
+            batch_size = options.get('batch_size') or max(128, 64 * workers)
+            self.stdout.write(f'Embedding with {workers} worker processes (chunk size {batch_size})')
+            try:
+                with EmbeddingWorkerPool(workers, threads_per_worker=options.get('threads_per_worker')) as pool:
+                    run_incremental_indexing(platforms, embedding_pool=pool, batch_size=batch_size)
+                self.stdout.write(self.style.SUCCESS('Successfully indexed content'))
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'Error during indexing: {str(e)}'))
+            return
+
         # 创建模拟请求
         request = HttpRequest()
         request.method = 'POST'
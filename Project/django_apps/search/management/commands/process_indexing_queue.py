@@ -0,0 +1,35 @@
+"""
+在当前进程中处理后台索引队列 (IndexingJob)。
+Web 进程只把任务写入队列，索引由这个命令处理: 部署时以 --forever 作为独立的写入进程运行。
+
+示例:
+    python manage.py process_indexing_queue            # 处理完当前队列后退出
+    python manage.py process_indexing_queue --forever  # 持续运行
+"""
+from django.core.management.base import BaseCommand
+
+from django_apps.search.views import indexing_worker
+
+
+class Command(BaseCommand):
+    help = 'Process pending background indexing jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forever', action='store_true', help='Keep polling the queue instead of exiting when it is empty')
+
+    def handle(self, *args, **options):
+        if options['forever']:
+            self.stdout.write('Processing indexing queue (Ctrl+C to stop)')
+            indexing_worker.run_forever()
+            return
+
+        total = 0
+        while True:
+            processed = indexing_worker.process_pending()
+            if not processed:
+                break
+            total += processed
+        stats = indexing_worker.stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {total} indexing jobs; queue depth {stats['queue_depth']}, failed {sum(p['failed'] for p in stats['platforms'].values())}"
+        ))
@@ -91,16 +91,16 @@ class Command(BaseCommand):
             ]
             
             self.stdout.write('\nRunning semantic search tests...')
-            for test_case in test_cases:
+            # 所有测试查询一次批量检索
+            batch_results = index_service.faiss_search_batch(
+                [test_case['query'] for test_case in test_cases],
+                top_k=1,
+                filter_values=[test_case['subreddit'] for test_case in test_cases]
+            )
+            for test_case, results in zip(test_cases, batch_results):
                 self.stdout.write(f"\n=== Test: {test_case['description']} ===")
                 self.stdout.write(f"Query: {test_case['query']}")
                 
-                results = index_service.faiss_search(
-                    query=test_case['query'],
-                    top_k=1,
-                    filter_value=test_case['subreddit']
-                )
-                
                 relevant_results = [
                     doc for doc in results 
                     if doc.metadata.get('subreddit') == test_case['subreddit']
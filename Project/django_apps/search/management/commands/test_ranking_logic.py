@@ -68,12 +68,14 @@ class Command(BaseCommand):
                 # }
             ]
             
-            for query_data in test_queries:
+            batch_results = index_service.faiss_search_batch(
+                [query_data['query'] for query_data in test_queries], top_k=5
+            )
+            for query_data, results in zip(test_queries, batch_results):
                 self.stdout.write(f"\n{'='*60}")
                 self.stdout.write(self.style.SUCCESS(f"\n{query_data['description']}"))
                 self.stdout.write(f"Query: {query_data['query']}\n")
                 
-                results = index_service.faiss_search(query_data['query'], top_k=5)
                 if not results:
                     raise Exception(f"No results found for query: {query_data['query']}")
                 
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.19 on 2026-10-17 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0007_redditcontent_content_rednotecontent_content_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IndexingJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("platform", models.CharField(max_length=50)),
+                ("object_id", models.BigIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0)),
+                ("error", models.TextField(blank=True, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "db_table": "indexing_job",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "platform"],
+                        name="indexing_jo_status_d98085_idx",
+                    ),
+                    models.Index(
+                        fields=["created_at"], name="indexing_jo_created_15b832_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-17 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("search", "0008_indexingjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="indexingjob",
+            name="claim_token",
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+    ]
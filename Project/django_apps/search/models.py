@@ -101,4 +101,39 @@ class RednoteContent(BaseContent):
         return [tag.strip() for tag in (self.tags or '').split(',') if tag.strip()]
 
     class Meta(BaseContent.Meta):
-        db_table = 'rednote_content'
\ No newline at end of file
+        db_table = 'rednote_content'
+
+class IndexingJob(models.Model):
+    """
+    后台索引队列: 实时抓取到的每条内容一条记录，由 process_indexing_queue 的写入线程按平台合并成批处理
+    (一次 embedding + 写入 FAISS + 保存)，请求线程不再直接修改索引。
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    platform = models.CharField(max_length=50)  # 'reddit', 'stackoverflow' or 'rednote'
+    object_id = models.BigIntegerField()  # 对应平台内容表的主键
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    claim_token = models.CharField(max_length=32, null=True, blank=True, db_index=True)  # 领取该任务的写入者
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'indexing_job'
+        app_label = 'search'
+        indexes = [
+            models.Index(fields=['status', 'platform']),
+            models.Index(fields=['created_at']),
+        ]
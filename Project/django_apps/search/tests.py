@@ -1,3 +1,262 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from langchain.docstore.document import Document
+from rank_bm25 import BM25Okapi
+
+from django_apps.search.index_service import snapshot_store
+from django_apps.search.index_service.bm25_engine import SparseBM25
+from django_apps.search.index_service.docstore import MmapDocstore
+from django_apps.search.index_service.indexing_queue import IndexingWorker
+from django_apps.search.models import IndexingJob, RedditContent
+
+# "python" 出现在超过一半的文档中 (IDF 为负，走 epsilon 下限)
+CORPUS = [
+    ["python", "list", "comprehension", "python"],
+    ["python", "django", "orm", "query"],
+    ["rust", "borrow", "checker"],
+    ["python", "faiss", "index", "vector", "search"],
+    ["hotpot", "chengdu", "food"],
+    ["python", "asyncio", "event", "loop", "loop"],
+    [],
+]
+QUERIES = [
+    ["python"],
+    ["python", "loop"],
+    ["faiss", "vector", "index"],
+    ["food", "unknown"],
+    ["unknown"],
+]
+
+
+class SparseBM25Tests(SimpleTestCase):
+    """SparseBM25 的分数必须与 rank_bm25.BM25Okapi 一致 (包括增量追加和持久化之后)"""
+
+    def assertScoresMatch(self, sparse, corpus):
+        reference = BM25Okapi(corpus)
+        for query in QUERIES:
+            np.testing.assert_allclose(sparse.get_scores(query), reference.get_scores(query), rtol=1e-9, atol=1e-12)
+
+    def test_scores_match_bm25okapi(self):
+        self.assertScoresMatch(SparseBM25(CORPUS), CORPUS)
+
+    def test_top_n_matches_sorted_scores(self):
+        sparse = SparseBM25(CORPUS)
+        scores = BM25Okapi(CORPUS).get_scores(["python", "loop"])
+        expected = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:3]
+        top_indexes, top_scores = sparse.get_top_n(["python", "loop"], 3)
+        self.assertEqual(list(top_indexes), expected)
+        np.testing.assert_allclose(top_scores, scores[expected])
+
+    def test_add_documents_matches_rebuild(self):
+        sparse = SparseBM25(CORPUS[:3])
+        self.assertEqual(sparse.add_documents(CORPUS[3:]), list(range(3, len(CORPUS))))
+        self.assertEqual(len(sparse), len(CORPUS))
+        self.assertScoresMatch(sparse, CORPUS)
+        # 增量倒排表合并进 CSR 矩阵后结果不变
+        sparse.compact()
+        self.assertScoresMatch(sparse, CORPUS)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "bm25.npz")
+        sparse = SparseBM25(CORPUS[:4])
+        sparse.add_documents(CORPUS[4:])
+        sparse.save(path, "reddit:rows=7")
+
+        loaded = SparseBM25.load(path, "reddit:rows=7")
+        self.assertEqual(len(loaded), len(CORPUS))
+        self.assertScoresMatch(loaded, CORPUS)
+        # 加载后继续追加
+        loaded.add_documents([["python", "rust"]])
+        self.assertScoresMatch(loaded, CORPUS + [["python", "rust"]])
+
+        self.assertIsNone(SparseBM25.load(path, "reddit:rows=8"))
+        self.assertIsNone(SparseBM25.load(os.path.join(directory, "missing.npz"), "reddit:rows=7"))
+
+
+class MmapDocstoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def open(self, max_rows=None):
+        store = MmapDocstore(self.directory, max_rows=max_rows)
+        self.addCleanup(store.close)
+        return store
+
+    @staticmethod
+    def docs(start, texts):
+        return {str(start + i): Document(page_content=text, metadata={'row': start + i}) for i, text in enumerate(texts)}
+
+    def test_add_flush_and_reopen(self):
+        store = MmapDocstore.create(self.directory)
+        self.addCleanup(store.close)
+        store.add(self.docs(0, ["first", "第二个文档"]))
+        # 尚未 flush 的文档同样可以读取
+        self.assertEqual(store.get_document(1).page_content, "第二个文档")
+        self.assertEqual(store.flush(), 2)
+        self.assertEqual(store.flush(), 0)
+        self.assertEqual(store.data_end(), os.path.getsize(store.data_path))
+
+        reopened = self.open()
+        self.assertEqual(len(reopened), 2)
+        self.assertEqual([doc.page_content for doc in reopened.iter_documents()], ["first", "第二个文档"])
+        self.assertEqual(reopened.get_document(1).metadata, {'row': 1})
+        self.assertIsNone(reopened.get_document(2))
+        self.assertEqual(reopened.search("abc"), "ID abc not found.")
+
+    def test_ids_must_be_consecutive_rows(self):
+        store = MmapDocstore.create(self.directory)
+        self.addCleanup(store.close)
+        with self.assertRaises(ValueError):
+            store.add(self.docs(1, ["gap"]))
+
+    def test_max_rows_view(self):
+        store = MmapDocstore.create(self.directory)
+        self.addCleanup(store.close)
+        store.add(self.docs(0, ["a", "b", "unpublished record from an interrupted save"]))
+        store.flush()
+        size = os.path.getsize(store.data_path)
+
+        view = self.open(max_rows=2)
+        self.assertEqual(len(view), 2)
+        self.assertIsNone(view.get_document(2))
+        self.assertEqual(view.data_end(), store.data_end(2))
+
+        # 从视图末尾写入，覆盖视图之外的记录，文件不会被截短
+        view.add(self.docs(2, ["c"]))
+        self.assertEqual(view.flush(), 1)
+        self.assertEqual(view.max_rows, 3)
+        self.assertGreaterEqual(os.path.getsize(store.data_path), size)
+
+        published = self.open(max_rows=3)
+        self.assertEqual([doc.page_content for doc in published.iter_documents()], ["a", "b", "c"])
+
+
+class SnapshotStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.index_dir)
+
+    def publish(self, **manifest):
+        version, path = snapshot_store.new_snapshot_dir(self.index_dir)
+        snapshot_store.publish(self.index_dir, version, manifest)
+        return version
+
+    def test_publish_switches_current(self):
+        self.assertIsNone(snapshot_store.current_version(self.index_dir))
+        first = self.publish(rows=1)
+        second = self.publish(rows=2)
+        self.assertEqual((first, second), (1, 2))
+        self.assertEqual(snapshot_store.current_version(self.index_dir), 2)
+        manifest = snapshot_store.read_manifest(self.index_dir, 2)
+        self.assertEqual(manifest['rows'], 2)
+        self.assertEqual(manifest['version'], 2)
+
+    def test_prune_keeps_recent_and_unpublished_versions(self):
+        for rows in range(5):
+            self.publish(rows=rows)
+        unpublished, _ = snapshot_store.new_snapshot_dir(self.index_dir)
+
+        removed = snapshot_store.prune(self.index_dir, keep=2)
+        self.assertEqual(removed, [1, 2, 3])
+        self.assertEqual(snapshot_store.list_versions(self.index_dir), [4, 5, unpublished])
+
+        # 超过 abandoned_after 未修改的未发布目录视为写入中断留下的
+        snapshot_store.prune(self.index_dir, keep=2, abandoned_after=-1)
+        self.assertEqual(snapshot_store.list_versions(self.index_dir), [4, 5])
+
+    def test_prune_removes_unreferenced_docstore_dirs(self):
+        referenced = snapshot_store.new_docstore_dir(self.index_dir)
+        orphan = snapshot_store.new_docstore_dir(self.index_dir)
+        self.assertNotEqual(referenced, orphan)
+        self.publish(rows=0, docstore_dir=os.path.relpath(referenced, self.index_dir))
+
+        snapshot_store.prune(self.index_dir)
+        self.assertTrue(os.path.isdir(orphan))  # 可能属于正在重建索引的写入者
+        snapshot_store.prune(self.index_dir, abandoned_after=-1)
+        self.assertTrue(os.path.isdir(referenced))
+        self.assertFalse(os.path.isdir(orphan))
+
+
+class IndexingWorkerTests(TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.result = {"success": True}
+
+    def process(self, posts, platform):
+        self.calls.append((platform, sorted(post.id for post in posts)))
+        return self.result
+
+    @staticmethod
+    def post(thread_id, **fields):
+        return RedditContent.objects.create(
+            source='reddit', content_type='post', thread_id=thread_id, author_name='tester',
+            content=f"content of {thread_id}", created_at=timezone.now(), subreddit='python', **fields
+        )
+
+    def statuses(self):
+        return list(IndexingJob.objects.order_by('id').values_list('status', 'attempts'))
+
+    def test_process_pending_indexes_batch_and_marks_done(self):
+        posts = [self.post("t1"), self.post("t2")]
+        worker = IndexingWorker(self.process)
+        self.assertEqual(worker.enqueue(posts + posts[:1], 'reddit'), 2)
+
+        self.assertEqual(worker.process_pending(), 2)
+        self.assertEqual(self.calls, [('reddit', sorted(post.id for post in posts))])
+        self.assertEqual(self.statuses(), [(IndexingJob.STATUS_DONE, 0)] * 2)
+        self.assertEqual(worker.process_pending(), 0)
+        self.assertEqual(worker.stats()['queue_depth'], 0)
+
+    def test_failed_batch_is_retried_then_marked_failed(self):
+        self.result = {"success": False, "message": "snapshot not published"}
+        worker = IndexingWorker(self.process, max_attempts=2)
+        worker.enqueue([self.post("t1")], 'reddit')
+
+        worker.process_pending()
+        self.assertEqual(self.statuses(), [(IndexingJob.STATUS_PENDING, 1)])
+        self.assertEqual(IndexingJob.objects.get().error, "snapshot not published")
+        worker.process_pending()
+        self.assertEqual(self.statuses(), [(IndexingJob.STATUS_FAILED, 2)])
+        self.assertEqual(worker.process_pending(), 0)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_claimed_jobs_are_not_claimed_again(self):
+        worker = IndexingWorker(self.process)
+        worker.enqueue([self.post("t1"), self.post("t2")], 'reddit')
+
+        platform, jobs = worker._claim_batch()
+        self.assertEqual(platform, 'reddit')
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(len({job.claim_token for job in jobs}), 1)
+        self.assertEqual(IndexingWorker(self.process)._claim_batch(), (None, []))
+
+    def test_stale_jobs_are_requeued_and_old_claim_cannot_finish_them(self):
+        worker = IndexingWorker(self.process, stale_after=timedelta(minutes=1))
+        worker.enqueue([self.post("t1")], 'reddit')
+        _, jobs = worker._claim_batch()
+        IndexingJob.objects.update(started_at=timezone.now() - timedelta(minutes=5))
+
+        worker._requeue_stale()
+        self.assertEqual(self.statuses(), [(IndexingJob.STATUS_PENDING, 0)])
+        worker._finish(jobs, None)
+        self.assertEqual(self.statuses(), [(IndexingJob.STATUS_PENDING, 0)])
+
+    def test_posts_with_embedding_key_are_skipped(self):
+        worker = IndexingWorker(self.process)
+        worker.enqueue([self.post("t1", embedding_key="already-indexed")], 'reddit')
+
+        self.assertEqual(worker.process_pending(), 1)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.statuses(), [(IndexingJob.STATUS_DONE, 0)])
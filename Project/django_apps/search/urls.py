@@ -22,4 +22,6 @@ urlpatterns = [
     path('saveSession/', views.saveSession, name='saveSession'),
     path('deleteSession/', views.deleteSession, name='deleteSession'),
     path('deleteAllSession/', views.deleteAllSession, name='deleteAllSession'),
+    path('indexing_status/', views.indexing_status, name='indexing_status'),
+    path('search_cache_status/', views.search_cache_status, name='search_cache_status'),
 ]
\ No newline at end of file
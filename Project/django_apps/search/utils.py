@@ -1,12 +1,48 @@
 import torch
+from django.conf import settings
 from langchain_huggingface import HuggingFaceEmbeddings
 
-def get_embeddings():
+EMBEDDING_MODEL_NAME = "Alibaba-NLP/gte-multilingual-base"  # 或者用 bge-large-en 如果内存足够, 网速够快
+EMBEDDING_BACKENDS = ('torch', 'onnx')
+
+
+def get_embedding_backend_config():
+    """读取 settings 中的 embedding 后端配置 (未配置 Django 时使用 torch)"""
+    if not settings.configured:
+        return {'backend': 'torch'}
+    return {
+        'backend': getattr(settings, 'EMBEDDING_BACKEND', 'torch'),
+        'onnx_model_path': getattr(settings, 'EMBEDDING_ONNX_MODEL_PATH', None),
+        'onnx_quantized': getattr(settings, 'EMBEDDING_ONNX_QUANTIZED', False),
+    }
+
+
+def get_embeddings(backend=None, onnx_model_path=None, onnx_quantized=None, onnx_num_threads=None):
     """
     返回 BGE embedding 模型实例
+    :param backend: 'torch' (HuggingFaceEmbeddings) 或 'onnx' (ONNX Runtime, 同一模型导出)，默认读取 settings.EMBEDDING_BACKEND
+    :param onnx_model_path: ONNX 模型目录，默认读取 settings.EMBEDDING_ONNX_MODEL_PATH
+    :param onnx_quantized: 是否加载 int8 量化模型，默认读取 settings.EMBEDDING_ONNX_QUANTIZED
+    :param onnx_num_threads: ONNX Runtime 的线程数，默认使用全部 CPU
     """
-    model_name = "Alibaba-NLP/gte-multilingual-base"  # 或者用 bge-large-en 如果内存足够, 网速够快
-    
+    config = get_embedding_backend_config()
+    backend = backend or config['backend']
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend: {backend}, expected one of {EMBEDDING_BACKENDS}")
+    if backend == 'onnx':
+        from .index_service.onnx_embeddings import OnnxEmbeddings
+        onnx_model_path = onnx_model_path or config.get('onnx_model_path')
+        if not onnx_model_path:
+            raise ValueError("EMBEDDING_ONNX_MODEL_PATH must be set to use the onnx embedding backend")
+        return OnnxEmbeddings(
+            EMBEDDING_MODEL_NAME,
+            onnx_model_path,
+            quantized=config.get('onnx_quantized', False) if onnx_quantized is None else onnx_quantized,
+            num_threads=onnx_num_threads
+        )
+
+    model_name = EMBEDDING_MODEL_NAME
+
     model_kwargs = {
         'device': 'cuda' if torch.cuda.is_available() else 'cpu',
         # 添加代理设置
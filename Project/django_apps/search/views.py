@@ -11,10 +11,17 @@ from search_process.langchain_parser import parse_langchain_response
 from search_process.prompt_generator import generate_prompt
 from search_process.prompt_sender import send_prompt
 from search_process.query_classification.classification import classify_query
+from search_process.query_classification.local_classifier import LocalQueryClassifier
 from django_apps.memory.service import MemoryService
 from django_apps.search.models import RedditContent, StackOverflowContent, RednoteContent, ContentIndex
-from django_apps.search.index_service.base import IndexService
+from django_apps.search.index_service.registry import IndexRegistry
+from django_apps.search.index_service.indexer import Indexer
+from django_apps.search.index_service.result_processor import ResultProcessor
 from django_apps.search.index_service.hybrid_retriever import HybridRetriever
+from django_apps.search.index_service.indexing_queue import IndexingWorker
+from django_apps.search.index_service.response_cache import get_response_cache
+from django_apps.search.index_service.query_cache import get_query_embedding_cache
+from django.conf import settings
 from typing import List, Dict
 from langchain.docstore.document import Document
 from urllib.parse import quote
@@ -30,8 +37,42 @@ logger = logging.getLogger(__name__)
 # Initialize ThreadPoolExecutor
 executor = ThreadPoolExecutor(max_workers=5)
 
-# Initialize the shared index_service
-index_service = IndexService(platform="reddit")  # Declare a global variable to hold the shared instance
+# Shared per-platform index registry: each platform keeps its own resident FaissManager,
+# so requests never switch platforms on a shared instance
+index_registry = IndexRegistry(
+    max_resident=getattr(settings, 'INDEX_REGISTRY_MAX_RESIDENT', None),
+    memory_budget_mb=getattr(settings, 'INDEX_REGISTRY_MEMORY_BUDGET_MB', None),
+    index_type=getattr(settings, 'FAISS_INDEX_TYPE', 'flat'),
+    index_params=getattr(settings, 'FAISS_INDEX_PARAMS', None),
+    refresh_interval=getattr(settings, 'INDEX_SNAPSHOT_REFRESH_INTERVAL', 5.0)
+)
+result_processor = ResultProcessor()
+# 搜索响应缓存 (/search/ 与 /mix_search/ 共用)
+response_cache = get_response_cache()
+
+
+def embed_query_cached(query):
+    """经过查询向量缓存计算查询向量，分类时算出的向量在随后的检索中直接命中"""
+    embedding_model = index_registry.embedding_model
+    cache = get_query_embedding_cache(embedding_model)
+    if cache is None:
+        return embedding_model.embed_query(query)
+    return cache.embed_query(query, embedding_model.embed_query)
+
+
+# 本地查询分类器 (复用检索的 embedding 模型)，置信度低时才调用 LLM; QUERY_CLASSIFIER_MODE = 'llm' 时每次都调用 LLM
+query_classifier = None
+if getattr(settings, 'QUERY_CLASSIFIER_MODE', 'local') == 'local':
+    query_classifier = LocalQueryClassifier(
+        index_registry.embedding_model,
+        min_confidence=getattr(settings, 'QUERY_CLASSIFIER_MIN_CONFIDENCE', 0.5),
+        embed_query_fn=embed_query_cached
+    )
+
+
+def classify_search_query(search_query, llm_model):
+    return classify_query(search_query, llm_model, local_classifier=query_classifier)
+
 
 def search(request):
     """
@@ -43,7 +84,6 @@ def search(request):
     print("Request Method:", request.method)
     print("Request Headers:", request.headers)
     print("Request Body:", request.body)
-    global index_service
 
     logger.info("Received search request")
     logger.debug(f"Request method: {request.method}")
@@ -101,22 +141,35 @@ def search(request):
         #1. FAISS搜索
         if not platform:
             platform = 'reddit'
-        # 更新平台并确保加载了对应的索引
-        index_service.platform = platform
-        index_service.faiss_manager.set_platform(platform)
+        # 借用该平台常驻的索引 (首次访问时加载)，不修改共享状态
+        faiss_manager = index_registry.get(platform)
 
-        index_count = index_service.faiss_manager.get_index_size()
+        index_count = faiss_manager.get_index_size()
         logger.info(f"当前{platform}平台索引包含{index_count}条记录")
 
+        # 分类不依赖检索结果，先分类才能查响应缓存 (分类结果本身也会缓存)
+        start_time = datetime.now()
+        classification = response_cache.classify(search_query, llm_model, classify_search_query)
+        log_benchmark('Classify query', start_time)
+
+        cache_key = None
+        if response_cache.should_use(recent_memory, classification, no_cache=data.get('no_cache', False)):
+            cache_key = response_cache.make_key('search', search_query, platform, llm_model, classification,
+                                                response_cache.index_version(faiss_manager))
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return respond_from_cache(cached, session_id, search_query)
+
         # 初始化 HybridRetriever
         start_time = datetime.now()
         hybrid_retriever = HybridRetriever(
-            faiss_manager=index_service.faiss_manager,
-            embedding_model=index_service.embedding_model,
+            faiss_manager=faiss_manager,
+            embedding_model=index_registry.embedding_model,
             bm25_weight=0.55,
             embedding_weight=0.35,
             vote_weight=0.1,
-            l2_decay_beta=4.0
+            l2_decay_beta=4.0,
+            parent_aggregation='max'  # 长帖子切分后的段落按所属帖子合并
         )
         log_benchmark('Initialize Hybrid Retriever', start_time)
 
@@ -137,10 +190,6 @@ def search(request):
         # --- 结束关键打印 ---
 
         # 2. 生成prompt
-        start_time = datetime.now()
-        classification = re.search(r">(\d+)<", classify_query(search_query, llm_model)).group(1)
-        log_benchmark('Classify query', start_time)
-
         # 检查是否有搜索结果，如果没有且开启了实时抓取，则调用混合搜索
         if not retrieved_docs or len(retrieved_docs) < 1: # 改top_k的时候注意这里
             print(f"数据库中没有找到结果: {search_query}")
@@ -186,7 +235,7 @@ def search(request):
                 key=lambda d: d.metadata.get('relevance_score', 0),
                 reverse=True
             )[:5]
-            processed_results = index_service.result_processor.process_recommendations(
+            processed_results = result_processor.process_recommendations(
                 documents=top_for_prompt,
                 query=search_query,
                 top_k=5  # 可配置的推荐数量
@@ -195,6 +244,7 @@ def search(request):
             # 格式化推荐结果
             answer = format_recommendation_results(processed_results, search_query)
             metadata = {'query_type': 'recommendation', 'processing': 'direct'}
+            response_cache.set(cache_key, {'result': answer, 'metadata': metadata, 'llm_model': "recommendation_processor"})
             
             # 将对话添加到记忆
             MemoryService.add_to_memory(
@@ -226,6 +276,8 @@ def search(request):
         response = future.result()
         log_benchmark('Send prompt to LLM', start_time)
         answer, metadata = parse_langchain_response(response)
+        if answer != "No answer found!":  # LLM 调用失败时不缓存
+            response_cache.set(cache_key, {'result': answer, 'metadata': metadata, 'llm_model': llm_model})
         MemoryService.add_to_memory(session_id, search_query, answer)
 
     except Exception as e:
@@ -246,6 +298,50 @@ def search(request):
 
 
 
+def run_incremental_indexing(platforms, embedding_pool=None, batch_size=128):
+    """
+    对给定平台执行增量索引 (index_content 视图和 index_content 管理命令共用)。
+    :param embedding_pool: 可选的 EmbeddingWorkerPool，大批量回填时用多进程计算 embedding
+    :param batch_size: 每次从数据库读取并写入索引的条数
+    """
+    logger.info("Starting content indexing process (incremental).")
+    for platform in platforms:
+        logger.info(f"Processing platform: {platform}")
+        if platform not in ['reddit', 'stackoverflow', 'rednote']:
+            logger.warning(f"Unknown platform: {platform}, skip.")
+            continue
+
+        # 根据平台获取"未索引的"新内容
+        if platform == 'reddit':
+            model_cls = RedditContent
+        elif platform == 'stackoverflow':
+            model_cls = StackOverflowContent
+        else:  # 'rednote'
+            model_cls = RednoteContent
+
+        # *** 目前改成用threadid来判断是否重复
+        unindexed = model_cls.objects.exclude(
+        thread_id__in=ContentIndex.objects.filter(source=platform).values('thread_id')
+        )   
+
+        count_unindexed = unindexed.count()
+
+        if count_unindexed > 0:
+            logger.info(f"Found {count_unindexed} new {platform} items to index.")
+            # 调用 index_platform_content() 内部会：
+            # 1) 仅对 unindexed 数据做 embedding + add_texts
+            # 2) 调用 save_index() 发布新快照，失败时抛出异常 (数据库不变，下次重新索引)
+            # 3) 快照发布后将其写入 ContentIndex 并清空 content
+            # 写入期间持有该平台的写锁，索引由注册表加载 (不存在时会创建空索引)
+            with index_registry.writer(platform) as faiss_manager:
+                indexer = Indexer(index_registry.embedding_model, faiss_manager,
+                                  batch_size=batch_size, embedding_pool=embedding_pool)
+                indexer.index_platform_content(platform=platform, unindexed_queryset=unindexed)
+            logger.info(f"Saved FAISS index for {platform}")
+        else:
+            logger.info(f"No new {platform} items to index.")
+
+
 # Initialization of indexing and embeddings
 @require_POST
 def index_content(request):
@@ -257,72 +353,15 @@ def index_content(request):
       4. 保存合并后的索引到本地磁盘
     """
 
-    global index_service
-
-    results = {}
-
-    start_time = time.time()
-    logger.info("Starting content indexing process (incremental).")
-
     source_filter = request.POST.get('source')
     if not source_filter:
         platforms = ['reddit', 'stackoverflow', 'rednote']
     else:
         platforms = [source_filter]
 
+    start_time = time.time()
     try:
-        for platform in platforms:
-            logger.info(f"Processing platform: {platform}")
-            if platform not in ['reddit', 'stackoverflow', 'rednote']:
-                logger.warning(f"Unknown platform: {platform}, skip.")
-                continue
-
-            # 更新平台
-            index_service.platform = platform
-            index_service.faiss_manager.set_platform(platform)
-            
-            # 尝试加载已有索引
-            try:
-                loaded = index_service.faiss_manager.load_index()
-                if not loaded:
-                    logger.info(f"没有找到现有索引，为 {platform} 创建新索引")
-                    index_service.faiss_manager.create_empty_index()
-                    # 确保保存空索引
-                    index_service.faiss_manager.save_index()
-                    logger.info(f"空索引已创建并保存到磁盘：{platform}")
-            except Exception as e:
-                logger.error(f"加载或创建索引失败: {str(e)}")
-                results[platform] = f"error: {str(e)}"
-                continue
-
-            # 根据平台获取"未索引的"新内容
-            if platform == 'reddit':
-                model_cls = RedditContent
-            elif platform == 'stackoverflow':
-                model_cls = StackOverflowContent
-            else:  # 'rednote'
-                model_cls = RednoteContent
-
-            # *** 目前改成用threadid来判断是否重复
-            unindexed = model_cls.objects.exclude(
-            thread_id__in=ContentIndex.objects.filter(source=platform).values('thread_id')
-            )   
-
-            count_unindexed = unindexed.count()
-
-            if count_unindexed > 0:
-                logger.info(f"Found {count_unindexed} new {platform} items to index.")
-                # 调用 index_platform_content() 内部会：
-                # 1) 仅对 unindexed 数据做 embedding + add_texts
-                # 2) 将其写入 ContentIndex
-                # 3) 调用 save_index() 再写回磁盘
-                index_service.indexer.index_platform_content(platform=platform, unindexed_queryset=unindexed)
-                # 添加内容后保存索引
-                # index_service.faiss_manager.save_index()
-                logger.info(f"Saved FAISS index for {platform}")
-            else:
-                logger.info(f"No new {platform} items to index.")
-
+        run_incremental_indexing(platforms)
         duration = time.time() - start_time
         logger.info(f"Indexing completed in {duration:.2f} seconds.")
         return JsonResponse({
@@ -399,7 +438,7 @@ def handle_mixed_search(search_query, platform, session_id, llm_model, recent_me
     try:
         # 如果分类未提供，进行分类
         if classification is None:
-            classification = re.search(r">(\d+)<", classify_query(search_query, llm_model)).group(1)
+            classification = re.search(r">(\d+)<", classify_search_query(search_query, llm_model)).group(1)
             logger.info(f"查询'{search_query}'被分类为: {classification}")
         
         # 根据平台选择适当的爬虫
@@ -428,13 +467,8 @@ def handle_mixed_search(search_query, platform, session_id, llm_model, recent_me
                 # 抓取帖子
                 crawled_posts = fetch_and_store_reddit_posts(reddit, optimized_query, limit=5)
                 
-                # 在后台处理数据，进行embedding
-                import threading
-                threading.Thread(
-                    target=process_crawled_data_for_indexing,
-                    args=(crawled_posts, platform),
-                    daemon=True
-                ).start()
+                # 加入后台索引队列，由 process_indexing_queue 按平台批量 embedding 并保存
+                indexing_worker.enqueue(crawled_posts, platform)
                 
             except Exception as e:
                 logger.error(f"Reddit爬虫异常: {str(e)}", exc_info=True)
@@ -453,13 +487,8 @@ def handle_mixed_search(search_query, platform, session_id, llm_model, recent_me
                 fetcher = create_stackoverflow_instance()
                 crawled_posts = fetch_and_store_stackoverflow_questions(fetcher, search_query, limit=5)
                 
-                # 在后台处理数据，进行embedding
-                import threading
-                threading.Thread(
-                    target=process_crawled_data_for_indexing,
-                    args=(crawled_posts, platform),
-                    daemon=True
-                ).start()
+                # 加入后台索引队列，由 process_indexing_queue 按平台批量 embedding 并保存
+                indexing_worker.enqueue(crawled_posts, platform)
                 
             except Exception as e:
                 logger.error(f"StackOverflow爬虫异常: {str(e)}", exc_info=True)
@@ -506,13 +535,8 @@ def handle_mixed_search(search_query, platform, session_id, llm_model, recent_me
                 logger.info(f"Found {len(crawled_posts)} latest posts from database (IDs: {[p.id for p in crawled_posts]})")
                 
                 if crawled_posts:
-                    # 在后台处理数据，进行embedding
-                    import threading
-                    threading.Thread(
-                        target=process_crawled_data_for_indexing,
-                        args=(crawled_posts, platform),
-                        daemon=True
-                    ).start()
+                    # 加入后台索引队列，由 process_indexing_queue 按平台批量 embedding 并保存
+                    indexing_worker.enqueue(crawled_posts, platform)
                 else:
                     logger.warning("No posts found in database after external crawling")
                     
@@ -578,7 +602,7 @@ def handle_mixed_search(search_query, platform, session_id, llm_model, recent_me
                 # 尝试使用ResultProcessor，但准备好直接备用方案
                 if len(mock_retrieved_docs) > 0:
                     # 调用处理推荐
-                    processed_results = index_service.result_processor.process_recommendations(
+                    processed_results = result_processor.process_recommendations(
                         documents=mock_retrieved_docs,
                         query=search_query,
                         top_k=min(len(mock_retrieved_docs), 3)
@@ -753,7 +777,7 @@ def handle_pure_real_time_crawling(search_query, platform, session_id, llm_model
     try:
         # 如果分类未提供，进行分类
         if classification is None:
-            classification = re.search(r">(\d+)<", classify_query(search_query, llm_model)).group(1)
+            classification = re.search(r">(\d+)<", classify_search_query(search_query, llm_model)).group(1)
             logger.info(f"查询'{search_query}'被分类为: {classification}")
         
         # 根据平台选择适当的爬虫
@@ -782,13 +806,8 @@ def handle_pure_real_time_crawling(search_query, platform, session_id, llm_model
                 # 抓取帖子
                 crawled_posts = fetch_and_store_reddit_posts(reddit, optimized_query, limit=5)
                 
-                # 在后台处理数据，进行embedding
-                import threading
-                threading.Thread(
-                    target=process_crawled_data_for_indexing,
-                    args=(crawled_posts, platform),
-                    daemon=True
-                ).start()
+                # 加入后台索引队列，由 process_indexing_queue 按平台批量 embedding 并保存
+                indexing_worker.enqueue(crawled_posts, platform)
                 
             except Exception as e:
                 logger.error(f"Reddit爬虫异常: {str(e)}", exc_info=True)
@@ -807,13 +826,8 @@ def handle_pure_real_time_crawling(search_query, platform, session_id, llm_model
                 fetcher = create_stackoverflow_instance()
                 crawled_posts = fetch_and_store_stackoverflow_questions(fetcher, search_query, limit=5)
                 
-                # 在后台处理数据，进行embedding
-                import threading
-                threading.Thread(
-                    target=process_crawled_data_for_indexing,
-                    args=(crawled_posts, platform),
-                    daemon=True
-                ).start()
+                # 加入后台索引队列，由 process_indexing_queue 按平台批量 embedding 并保存
+                indexing_worker.enqueue(crawled_posts, platform)
                 
             except Exception as e:
                 logger.error(f"StackOverflow爬虫异常: {str(e)}", exc_info=True)
@@ -860,13 +874,8 @@ def handle_pure_real_time_crawling(search_query, platform, session_id, llm_model
                 logger.info(f"Found {len(crawled_posts)} latest posts from database (IDs: {[p.id for p in crawled_posts]})")
                 
                 if crawled_posts:
-                    # 在后台处理数据，进行embedding
-                    import threading
-                    threading.Thread(
-                        target=process_crawled_data_for_indexing,
-                        args=(crawled_posts, platform),
-                        daemon=True
-                    ).start()
+                    # 加入后台索引队列，由 process_indexing_queue 按平台批量 embedding 并保存
+                    indexing_worker.enqueue(crawled_posts, platform)
                 else:
                     logger.warning("No posts found in database after external crawling")
                     
@@ -932,7 +941,7 @@ def handle_pure_real_time_crawling(search_query, platform, session_id, llm_model
                 # 尝试使用ResultProcessor，但准备好直接备用方案
                 if len(mock_retrieved_docs) > 0:
                     # 调用处理推荐
-                    processed_results = index_service.result_processor.process_recommendations(
+                    processed_results = result_processor.process_recommendations(
                         documents=mock_retrieved_docs,
                         query=search_query,
                         top_k=min(len(mock_retrieved_docs), 3)
@@ -1155,12 +1164,39 @@ def mix_search(request):
     if session_id:
         recent_memory = MemoryService.get_recent_memory(session_id, limit=10, platform=platform)
     
+    # 响应缓存: 每次混合搜索抓取的内容都会写入索引，索引版本随之变化，因此 key 不包含索引版本，只依靠 TTL 过期
+    classification = None
+    cache_key = None
+    try:
+        classification = response_cache.classify(search_query, llm_model, classify_search_query)
+        if response_cache.should_use(recent_memory, classification, no_cache=data.get('no_cache', False)):
+            cache_key = response_cache.make_key('mix_search', search_query, platform, llm_model, classification)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                return respond_from_cache(cached, session_id, search_query)
+    except Exception as e:
+        logger.error(f"混合搜索响应缓存查询失败: {str(e)}", exc_info=True)
+
     # 调用混合搜索处理函数
     start_time = datetime.now()
-    result = handle_mixed_search(search_query, platform, session_id, llm_model, recent_memory)
+    result = handle_mixed_search(search_query, platform, session_id, llm_model, recent_memory, classification)
     log_benchmark("混合搜索",start_time)
+    if cache_key:
+        payload = json.loads(result.content.decode('utf-8'))
+        # 只缓存成功抓取并生成回答的响应
+        if payload.get('crawled') and payload.get('result') != "No answer found!":
+            response_cache.set(cache_key, {key: payload[key] for key in ('result', 'metadata', 'llm_model', 'crawled')})
     return result
 
+
+def respond_from_cache(payload, session_id, search_query):
+    """缓存命中: 回答照常写入会话记忆，history 按当前会话重新读取"""
+    if session_id:
+        MemoryService.add_to_memory(session_id, search_query, payload['result'])
+    response = dict(payload, cached=True)
+    response['history'] = MemoryService.get_recent_memory(session_id) if session_id else []
+    return JsonResponse(response, json_dumps_params={'ensure_ascii': False})
+
 def generate_xhs_search_url(query: str) -> str:
     """
     修正版小红书搜索URL生成器
@@ -1209,16 +1245,6 @@ def process_crawled_data_for_indexing(crawled_posts, platform):
             
         model_class = model_class_map[platform]
         
-        # 创建或获取IndexService实例
-        global index_service
-        # 确保索引服务使用正确的平台
-        if index_service.platform != platform:
-            index_service.platform = platform
-            index_service.faiss_manager.set_platform(platform)
-        
-        # 确保已加载索引
-        index_service.faiss_manager.load_index()
-        
         # 收集所有抓取的thread_ids，用于一次性查询已存在的记录
         thread_ids = [post.thread_id for post in crawled_posts if hasattr(post, 'thread_id') and post.thread_id]
         
@@ -1247,28 +1273,20 @@ def process_crawled_data_for_indexing(crawled_posts, platform):
         # 重新过滤crawled_posts，只保留未删除的记录
         filtered_posts = [post for post in crawled_posts if post.id not in duplicate_ids]
         
-        # 逐个处理抓取到的条目
+        # 没有内容的条目直接跳过
+        indexable_posts = [post for post in filtered_posts if getattr(post, 'content', None)]
+        skipped_count = len(filtered_posts) - len(indexable_posts)
+        if skipped_count:
+            logger.warning(f"跳过 {skipped_count} 条没有内容的条目")
+
+        # 持有该平台的写锁，在单独加载的索引上写入，保存后再替换常驻索引
+        # 所有条目一次 embedding、一次写入 FAISS，快照发布成功后才写 embedding_key / 清空 content;
+        # 发布失败时抛出异常，返回 success=False 让队列重试
         processed_count = 0
-        skipped_count = 0
-        
-        for post in filtered_posts:
-            if not hasattr(post, 'content') or not post.content:
-                logger.warning(f"跳过没有内容的条目: {post.id}")
-                skipped_count += 1
-                continue
-                
-            # 现在处理确认不存在且有内容的条目
-            try:
-                # 使用项目中现有的index_crawled_item方法进行处理
-                # 这将生成embedding，添加到FAISS，并设置embedding_key
-                index_service.indexer.index_crawled_item(post, post.content, save_index=False)
-                processed_count += 1
-            except Exception as e:
-                logger.error(f"处理条目时出错 (ID: {post.id}): {str(e)}", exc_info=True)
-        
-        # 批量保存索引
-        if processed_count > 0:
-            index_service.faiss_manager.save_index()
+        if indexable_posts:
+            with index_registry.writer(platform) as faiss_manager:
+                indexer = Indexer(index_registry.embedding_model, faiss_manager)
+                processed_count = indexer.index_crawled_items(indexable_posts, platform)
             logger.info(f"完成处理 {processed_count}/{len(filtered_posts)} 条数据，删除 {len(duplicate_ids)} 条重复数据，跳过 {skipped_count} 条无内容数据，平台: {platform}")
         
         return {
@@ -1282,6 +1300,24 @@ def process_crawled_data_for_indexing(crawled_posts, platform):
         logger.error(f"处理抓取数据时出错: {str(e)}", exc_info=True)
         return {"success": False, "message": f"处理失败: {str(e)}", "processed_count": 0}
 
+# 后台索引队列: Web 进程只写入任务，由 process_indexing_queue 命令中的写入线程按平台合并成批后调用 process_crawled_data_for_indexing
+indexing_worker = IndexingWorker(
+    process_crawled_data_for_indexing,
+    batch_size=getattr(settings, 'INDEXING_QUEUE_BATCH_SIZE', 200),
+    poll_interval=getattr(settings, 'INDEXING_QUEUE_POLL_INTERVAL', 5.0)
+)
+
+
+def indexing_status(request):
+    """索引队列状态: 各平台队列深度、最早待处理任务的等待时间 (lag) 和最近一批的耗时"""
+    return JsonResponse(indexing_worker.stats())
+
+
+def search_cache_status(request):
+    """搜索响应缓存的命中率 (本进程)"""
+    return JsonResponse(response_cache.stats())
+
+
 def log_benchmark(description: str, start_time: datetime):
     """
     Append benchmark log to 'benchmark.txt'.
@@ -158,4 +158,60 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 BGE_MODEL_NAME = "BAAI/bge-large-en"
 BGE_BATCH_SIZE = 32
 
-TIME_ZONE = 'Australia/Sydney'
\ No newline at end of file
+TIME_ZONE = 'Australia/Sydney'
+
+# 多平台索引注册表 (IndexRegistry): 常驻内存的平台数量 / 估算内存上限(MB), None 表示不限制
+INDEX_REGISTRY_MAX_RESIDENT = None
+INDEX_REGISTRY_MEMORY_BUDGET_MB = None
+
+# 新建 FAISS 索引时使用的类型 (flat / ivf_flat / ivf_pq / hnsw / sq8) 及参数; 已有索引以 index_params.json 为准
+FAISS_INDEX_TYPE = 'flat'
+FAISS_INDEX_PARAMS = {}
+
+# 磁盘 embedding 缓存 (按模型名 + 文本哈希)，超过条数上限按 LRU 淘汰; 设为 0 关闭
+EMBEDDING_CACHE_DIR = 'embedding_cache'
+EMBEDDING_CACHE_MAX_ENTRIES = 500000
+
+# 查询向量 LRU 缓存: 条数上限 (0 关闭) 与过期秒数; 设置 CACHES 中的别名后可跨进程共享
+QUERY_EMBEDDING_CACHE_SIZE = 2048
+QUERY_EMBEDDING_CACHE_TTL = 3600
+QUERY_EMBEDDING_CACHE_ALIAS = None
+
+# embedding 后端: 'torch' (HuggingFaceEmbeddings) 或 'onnx' (同一模型导出的 ONNX，CPU 推理更快，见 index_service/onnx_embeddings.py)
+EMBEDDING_BACKEND = 'torch'
+EMBEDDING_ONNX_MODEL_PATH = 'model_cache/gte-multilingual-base-onnx'
+EMBEDDING_ONNX_QUANTIZED = False
+
+# 后台索引队列 (IndexingJob): 每批最多处理的任务数与空闲时的轮询间隔 (秒)
+INDEXING_QUEUE_BATCH_SIZE = 200
+INDEXING_QUEUE_POLL_INTERVAL = 5.0
+
+# 索引快照: 各进程检查 CURRENT 是否有新版本的间隔 (秒，None 表示不检查)
+INDEX_SNAPSHOT_REFRESH_INTERVAL = 5.0
+
+# jieba 前缀词典缓存目录 (jieba.cache)，放在持久目录中避免每次启动重新构建词典
+JIEBA_CACHE_DIR = 'model_cache/jieba'
+
+# Django 缓存: search_responses 用于搜索响应缓存 (locmem 为单进程; 多进程部署可换成
+# django.core.cache.backends.filebased.FileBasedCache 或 django.core.cache.backends.redis.RedisCache)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search_responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'search-responses',
+        'OPTIONS': {'MAX_ENTRIES': 2000},  # 超过上限时按 CULL_FREQUENCY 淘汰
+    },
+}
+
+# 搜索响应缓存 (/search/ 与 /mix_search/): CACHES 中的别名 (None 关闭)、过期秒数，
+# 以及回答依赖会话记忆时是否跳过缓存
+SEARCH_RESPONSE_CACHE_ALIAS = 'search_responses'
+SEARCH_RESPONSE_CACHE_TTL = 600
+SEARCH_RESPONSE_CACHE_BYPASS_WITH_MEMORY = True
+
+# 查询分类: 'local' 使用 embedding 模型上的最近质心分类器 (第一次分类时用 query_classification/test_data.json 计算质心)，
+# 置信度低于 QUERY_CLASSIFIER_MIN_CONFIDENCE 时调用 LLM; 'llm' 每次都调用 LLM
+QUERY_CLASSIFIER_MODE = 'local'
+QUERY_CLASSIFIER_MIN_CONFIDENCE = 0.5
@@ -1 +1,2 @@
-from .classification import classify_query
\ No newline at end of file
+from .classification import classify_query
+from .local_classifier import LocalQueryClassifier
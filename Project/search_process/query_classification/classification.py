@@ -1,7 +1,20 @@
 from search_process.prompt_sender.sender import send_prompt_to_gemini, send_prompt_to_deepseek, send_prompt_to_chatgpt
 from search_process.langchain_parser.parser import parse_langchain_response
 
-def classify_query(query, model_name):
+def classify_query(query, model_name, local_classifier=None):
+    """
+    返回 LLM 回答中的分类编号 (调用方用 >N< 提取)。
+    传入 local_classifier (LocalQueryClassifier) 时先在本地分类，置信度不低于其 min_confidence 时直接返回，不调用 LLM。
+    """
+    if local_classifier is not None:
+        try:
+            category, confidence = local_classifier.predict(query)
+            if confidence >= local_classifier.min_confidence:
+                return f"<p>{category}</p>"
+            print(f"--- [classify_query] 本地分类置信度低 ({category}, {confidence:.2f})，改用 {model_name} ---")
+        except Exception as e:
+            print(f"--- [classify_query] 本地分类失败，改用 {model_name}: {e} ---")
+
     prompt = []
     prompt.append(f"## User Query:\n{query}\n\n")
     prompt.append("You need to judge the user's query and categorize the question with following categories, not answer the question but categorize it.\n")
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(__file__), 'test_data.json')
+DEFAULT_MIN_CONFIDENCE = 0.5
+DEFAULT_TEMPERATURE = 0.05
+
+
+class LocalQueryClassifier:
+    """
+    基于查询向量的最近质心分类器 (复用检索用的 embedding 模型，不需要额外的模型):
+      - 用 test_data.json 中的标注问题计算每个类别的平均向量 (质心)，第一次使用时才计算
+      - 预测时取余弦相似度最高的类别，置信度为相似度按 temperature 做 softmax 后的概率
+    置信度低于 min_confidence 时 classify_query 会改为调用 LLM。
+    """
+
+    def __init__(self, embedding_model, data_path=DEFAULT_DATA_PATH, min_confidence=DEFAULT_MIN_CONFIDENCE,
+                 temperature=DEFAULT_TEMPERATURE, embed_query_fn=None):
+        """
+        :param embedding_model: 与检索共用的 embedding 模型 (需要 embed_query / embed_documents)
+        :param data_path: 标注数据，格式同 test_data.json: [{"question": ..., "category": "1"}, ...]
+        :param min_confidence: 低于该置信度时应交给 LLM 分类
+        :param temperature: softmax 温度，越小置信度越集中在最相似的类别
+        :param embed_query_fn: 计算查询向量的函数，默认 embedding_model.embed_query (可传入带缓存的版本)
+        """
+        self.embedding_model = embedding_model
+        self.data_path = data_path
+        self.min_confidence = min_confidence
+        self.temperature = temperature
+        self.embed_query_fn = embed_query_fn or embedding_model.embed_query
+        self.labels = []
+        self._sums = None  # 每个类别的 (归一化后) 向量之和，留一法评估时需要
+        self._counts = None
+        self._centroids = None
+        self._lock = threading.Lock()
+        self._fit_lock = threading.Lock()  # 并发的第一次请求只计算一次质心
+
+    @staticmethod
+    def load_examples(data_path=DEFAULT_DATA_PATH):
+        with open(data_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return [item["question"] for item in data], [str(item["category"]) for item in data]
+
+    def fit(self, questions=None, categories=None):
+        """计算各类别的质心，返回训练样本的向量 (与 questions 顺序一致)"""
+        if questions is None:
+            questions, categories = self.load_examples(self.data_path)
+        vectors = self._normalize(np.asarray(self.embedding_model.embed_documents(list(questions)), dtype=np.float32))
+        labels = sorted(set(categories), key=int)
+        index = {label: i for i, label in enumerate(labels)}
+        sums = np.zeros((len(labels), vectors.shape[1]), dtype=np.float32)
+        counts = np.zeros(len(labels), dtype=np.float32)
+        for vector, category in zip(vectors, categories):
+            sums[index[category]] += vector
+            counts[index[category]] += 1
+        with self._lock:
+            self.labels = labels
+            self._sums = sums
+            self._counts = counts
+            self._centroids = self._normalize(sums / counts[:, None])
+        print(f"--- [LocalQueryClassifier.fit] {len(questions)} 个样本, {len(labels)} 个类别 ---")
+        return vectors
+
+    def predict(self, query):
+        """返回 (类别编号字符串, 置信度)"""
+        self._ensure_fitted()
+        return self.predict_vector(self.embed(query))
+
+    def embed(self, query):
+        """归一化后的查询向量"""
+        return self._normalize(np.asarray(self.embed_query_fn(query), dtype=np.float32))
+
+    def predict_vector(self, vector, held_out_category=None):
+        """
+        对已归一化的查询向量分类。
+        held_out_category 不为 None 时先把该向量从所属类别的质心中去掉 (留一法评估训练样本)
+        """
+        centroids = self._centroids
+        if held_out_category is not None:
+            i = self.labels.index(held_out_category)
+            centroids = centroids.copy()
+            remaining = self._sums[i] - vector
+            centroids[i] = self._normalize(remaining / max(self._counts[i] - 1, 1))
+        scores = centroids @ vector
+        probs = np.exp((scores - scores.max()) / self.temperature)
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best])
+
+    def _ensure_fitted(self):
+        if self._centroids is None:
+            with self._fit_lock:
+                if self._centroids is None:
+                    self.fit()
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
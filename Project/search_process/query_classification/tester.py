@@ -1,5 +1,7 @@
-from time import sleep
+from time import sleep, perf_counter
 from search_process.query_classification.classification import classify_query
+from search_process.query_classification.local_classifier import LocalQueryClassifier, DEFAULT_MIN_CONFIDENCE
+import argparse
 import json
 import os
 import re
@@ -37,26 +39,76 @@ def category_number_to_name(category_number):
     }
     return category_mapping.get(category_number, "Unknown Category")
 
-def test(model_name):
+def load_data():
     file_path = os.path.join(os.path.dirname(__file__), 'test_data.json')
     with open(file_path, "r", encoding="utf-8") as file:
-        data = json.load(file)  # 解析 JSON 文件
+        return json.load(file)  # 解析 JSON 文件
+
+def llm_predict(question, model_name):
+    response = classify_query(question, model_name)
+    match = re.search(r"\d+", response)
+    if match:
+        return match.group(0)
+    assert False, f"Error: Invalid response from model {model_name}, response: {response}, question: {question}"
+
+def test(model_name):
+    data = load_data()
 
     classifications = []
+    latencies = []
     for item in data:
         sleep(5)
         question = item["question"]
         ground_truth = item["category"]
-        response = classify_query(question, model_name)
-        match = re.search(r"\d+", response)
-        if match:
-            prediction = match.group(0)
-        else:
-            assert False, f"Error: Invalid response from model {model_name}, response: {response}, question: {question}"
+        start = perf_counter()
+        prediction = llm_predict(question, model_name)
+        latencies.append(perf_counter() - start)
         classification = Classification(item["id"], question, ground_truth, prediction)
         print(classification)
         classifications.append(classification)
 
+    report(model_name, data, classifications, latencies)
+
+def test_local(model_name=None, min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """
+    本地最近质心分类器的留一法评估: 每个问题都用去掉它自己之后的质心分类，延迟包括计算查询向量。
+    传入 model_name 时，置信度低于 min_confidence 的问题改用该 LLM 分类 (与线上的 local 模式一致)。
+    """
+    from django_apps.search.utils import get_embeddings
+
+    data = load_data()
+    classifier = LocalQueryClassifier(get_embeddings(), min_confidence=min_confidence)
+    classifier.fit([item["question"] for item in data], [item["category"] for item in data])
+
+    classifications = []
+    latencies = []
+    fallbacks = 0
+    for item in data:
+        question = item["question"]
+        ground_truth = item["category"]
+        start = perf_counter()
+        vector = classifier.embed(question)
+        prediction, confidence = classifier.predict_vector(vector, held_out_category=ground_truth)
+        latency = perf_counter() - start
+        if model_name and confidence < min_confidence:
+            fallbacks += 1
+            sleep(5)
+            start = perf_counter()
+            prediction = llm_predict(question, model_name)
+            latency += perf_counter() - start
+        latencies.append(latency)
+        classification = Classification(item["id"], question, ground_truth, prediction, confidence)
+        print(f"{classification}, Confidence: {confidence:.2f}")
+        classifications.append(classification)
+
+    low_confidence = sum(result.confidence < min_confidence for result in classifications)
+    title = f"local (leave-one-out, min_confidence={min_confidence})"
+    if model_name:
+        title += f" + {model_name} fallback"
+    report(title, data, classifications, latencies)
+    print(f"Low confidence: {low_confidence}/{len(classifications)}, LLM calls: {fallbacks}")
+
+def report(model_name, data, classifications, latencies):
     categories = set(item["category"] for item in data)  # 获取所有类别
     metrics = {category: {"TP": 0, "FP": 0, "FN": 0} for category in categories}  # 初始化混淆矩阵
 
@@ -92,6 +144,10 @@ def test(model_name):
 
     print(f"\n\n\nmodel_name: {model_name}")
     print(f"Accuracy: {accuracy:.4f}")
+    latencies = sorted(latencies)
+    print(f"Latency: mean {sum(latencies) / len(latencies) * 1000:.1f} ms, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000:.1f} ms\n")
     for category, scores in precision_recall_f1.items():
         print(f"Category: {category_number_to_name(int(category))}")
         print(f"  Precision: {scores['Precision']:.4f}")
@@ -100,5 +156,18 @@ def test(model_name):
 
 if __name__ == "__main__":
     #python -m search_process.query_classification.tester
+    #python -m search_process.query_classification.tester --mode local
     #deepseek-reasoner 才是R1
-    test("gemini-2.0-flash")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["llm", "local", "hybrid", "all"], default="llm",
+                        help="llm: 每个问题调用 LLM; local: 本地分类器 (留一法); hybrid: 本地分类器 + 低置信度时调用 LLM")
+    parser.add_argument("--model", default="gemini-2.0-flash")
+    parser.add_argument("--min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    if args.mode in ("local", "all"):
+        test_local(min_confidence=args.min_confidence)
+    if args.mode in ("hybrid", "all"):
+        test_local(args.model, min_confidence=args.min_confidence)
+    if args.mode in ("llm", "all"):
+        test(args.model)
\ No newline at end of file